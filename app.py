@@ -2,15 +2,29 @@
 Main application file for the Style Finder Gradio interface.
 """
 
+import asyncio
 import gradio as gr
 import pandas as pd
 import os
-from tempfile import NamedTemporaryFile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from PIL import Image
 
-# Import local modules
-from models.image_processor import ImageProcessor
-from models.llm_service import LlamaVisionService
-from utils.helpers import get_all_items_for_image, format_alternatives_response, process_response
+# Import local modules (the encoder and the LLM SDK are imported on first use)
+from models.filters import search_filters
+from models.index_manager import IndexManager
+from models.batching import MicroBatcher
+from models.projection import PCAProjection
+from models.vector_store import load_vector_store, store_fingerprint
+from models.regions import aggregate_region_matches, match_regions
+from utils.cache import create_cache, image_hash
+from utils.metrics import CACHE_LOOKUPS, IN_FLIGHT, QUEUE_DEPTH, REGISTRY, count, maybe_profiler, span
+from utils.helpers import (
+    build_basic_response, get_all_items_for_image, format_alternatives_response, process_response,
+    format_items_description, StreamingResponseProcessor
+)
 import config
 
 class StyleFinderApp:
@@ -18,90 +32,769 @@ class StyleFinderApp:
     Main application class that orchestrates the Style Finder workflow.
     """
     
-    def __init__(self, dataset_path):
+    def __init__(self, dataset_path, image_processor=None, llm_service=None, background=False):
         """
         Initialize the Style Finder application.
         
         Args:
-            dataset_path (str): Path to the dataset file
+            dataset_path (str): Path to the dataset file, or the path prefix
+                of a vector store written by scripts/build_vector_store.py
+            image_processor (ImageProcessor, optional): Preconfigured image processor
+            llm_service (LlamaVisionService, optional): Preconfigured LLM service,
+                e.g. one backed by a local stub model
+            background (bool): Load the dataset and models in a background thread
+                and return at once. Requests made before loading finishes get the
+                readiness message instead of an answer.
             
         Raises:
             FileNotFoundError: If the dataset file is not found
-            ValueError: If the dataset is empty or invalid
+            ValueError: If the dataset is empty or invalid (only when loading
+                in the foreground; in the background the failure is reported
+                by readiness_message)
         """
-        # Load the dataset
-        if not os.path.exists(dataset_path):
+        if not os.path.exists(dataset_path + ".json") and not os.path.exists(dataset_path):
             raise FileNotFoundError(f"Dataset file not found: {dataset_path}")
-            
-        self.data = pd.read_pickle(dataset_path)
-        if self.data.empty:
-            raise ValueError("The loaded dataset is empty")
+        self.dataset_path = dataset_path
         
-        # Initialize components
-        self.image_processor = ImageProcessor(
-            image_size=config.IMAGE_SIZE,
-            norm_mean=config.NORMALIZATION_MEAN,
-            norm_std=config.NORMALIZATION_STD
-        )
+        # Filled in by _load_components
+        self.catalog = None
+        self.image_processor = None
+        self.encoder_batcher = None
+        self.llm_service = None
+        
+        # Startup progress: the current phase and how long each phase took
+        self.startup_phase = "starting"
+        self.startup_timings = {}
+        self.startup_error = None
+        self._ready = threading.Event()
         
-        self.llm_service = LlamaVisionService(
-            model_id=config.LLAMA_MODEL_ID,
-            project_id=config.PROJECT_ID,
-            region=config.REGION
+        # Two cache levels: pixel hash -> feature vectors, matched outfit -> final response
+        self.encoding_cache = None
+        self.response_cache = None
+        if config.CACHE_ENABLED:
+            self.encoding_cache = create_cache(
+                "encodings", config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS, config.CACHE_DIR
+            )
+            self.response_cache = create_cache(
+                "responses", config.CACHE_MAX_ENTRIES, config.CACHE_TTL_SECONDS, config.CACHE_DIR
+            )
+        
+        # Bounded pools keep blocking work off the event loop in process_image_async:
+        # CPU-bound encoding and the blocking LLM round trip each get their own
+        self.encode_pool = ThreadPoolExecutor(
+            max_workers=config.ENCODE_WORKERS, thread_name_prefix="encode"
+        )
+        self.llm_pool = ThreadPoolExecutor(
+            max_workers=config.LLM_WORKERS, thread_name_prefix="llm"
         )
+        self._register_metrics()
+        
+        if background:
+            threading.Thread(
+                target=self._start, args=(image_processor, llm_service),
+                name="startup", daemon=True
+            ).start()
+        else:
+            self._start(image_processor, llm_service, raise_errors=True)
+
+    @property
+    def ready(self):
+        """bool: Whether the dataset and models are loaded and warmed up."""
+        return self._ready.is_set()
+
+    def wait_until_ready(self, timeout=None):
+        """
+        Block until startup has finished.
+        
+        Returns:
+            bool: True if the app is ready, False on timeout or startup failure
+        """
+        self._ready.wait(timeout)
+        return self.ready
+
+    def readiness_message(self):
+        """
+        Describe the startup state for the UI.
+        
+        Returns:
+            str: Ready, in-progress or failure message
+        """
+        if self.ready:
+            return "Ready to analyze."
+        if self.startup_error is not None:
+            return f"Error: The application failed to start: {self.startup_error}"
+        return (f"The style finder is still starting up ({self.startup_phase}). "
+                "Please try again in a moment.")
+
+    @property
+    def data(self):
+        """DataFrame: Metadata of the current catalog generation."""
+        return self.catalog.current.data if self.catalog else None
+
+    @property
+    def index(self):
+        """SegmentedIndex: Similarity index of the current catalog generation."""
+        return self.catalog.current.index if self.catalog else None
+
+    @property
+    def item_lookup(self):
+        """dict: Items grouped by image in the current catalog generation."""
+        return self.catalog.current.item_lookup if self.catalog else None
+
+    @property
+    def catalog_filter(self):
+        """CatalogFilter: Filter structures of the current catalog generation."""
+        return self.catalog.current.catalog_filter if self.catalog else None
+
+    def filter_choices(self, column):
+        """
+        List the values a categorical filter offers, most frequent first.
+        
+        Returns:
+            list: Values of the column, empty before startup or when the catalog lacks it
+        """
+        if not self.ready:
+            return []
+        catalog_filter = self.catalog.current.catalog_filter
+        if column not in catalog_filter.columns:
+            return []
+        return catalog_filter.values(column)
+
+    def _start(self, image_processor, llm_service, raise_errors=False):
+        """
+        Load every component, recording per-phase timings, and mark the app ready.
+        """
+        start = time.perf_counter()
+        try:
+            self._load_components(image_processor, llm_service)
+        except Exception as e:
+            self.startup_error = e
+            self.startup_phase = "failed"
+            print(f"Error starting the application: {e}")
+            if raise_errors:
+                raise
+            return
+        
+        self.startup_timings["total"] = time.perf_counter() - start
+        print("Startup timings: " + ", ".join(
+            f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_timings.items()
+        ))
+        self.startup_phase = "ready"
+        self._ready.set()
+
+    def _load_components(self, image_processor, llm_service):
+        """
+        Load the dataset, index, encoder and LLM client, then warm up the encoder.
+        """
+        # Heavy modules are imported here, so the UI can be served before torch loads
+        with self._phase("loading the dataset"):
+            index = None
+            columnar = os.path.exists(self.dataset_path + ".json")
+            if columnar:
+                # Compact store: the embeddings and metadata columns are memory-mapped, not unpickled
+                data, index = load_vector_store(self.dataset_path)
+            else:
+                data = pd.read_pickle(self.dataset_path)
+            
+            if data.empty:
+                raise ValueError("The loaded dataset is empty")
+        
+        with self._phase("building the index"):
+            # The manager builds the similarity index once so requests only pay for a
+            # dot product, groups item rows by image so the matched outfit is a dict
+            # lookup, and precomputes the filter structures. Catalog updates swap in
+            # a new generation of all three while requests keep running.
+            self.catalog = IndexManager(
+                data, index,
+                index_options=_index_options(),
+                filter_columns=config.FILTER_COLUMNS,
+                # Item lists of a memory-mapped catalog are rendered per request, so only
+                # the matched rows' names and links are ever read
+                describe_items=not columnar,
+                compact_tombstone_fraction=config.CATALOG_COMPACT_TOMBSTONE_FRACTION,
+                compact_max_segments=config.CATALOG_COMPACT_MAX_SEGMENTS,
+                # Names the catalog in the response cache, which may outlive the process
+                source_id=store_fingerprint(self.dataset_path)
+            )
+            if config.CATALOG_WATCH_DIR:
+                self.catalog.watch(config.CATALOG_WATCH_DIR, config.CATALOG_WATCH_INTERVAL_SECONDS)
+        
+        with self._phase("importing torch"):
+            from models.image_processor import ImageProcessor
+            from models.inference import configure_threads, list_calibration_images
+            configure_threads(config.ENCODER_THREADS, config.ENCODER_INTEROP_THREADS)
+        
+        with self._phase("loading the image encoder"):
+            if image_processor is None:
+                calibration_images = None
+                if config.ENCODER_INFERENCE_MODE == "int8" and not config.ENCODER_TORCHSCRIPT_PATH:
+                    if not config.ENCODER_CALIBRATION_DIR:
+                        raise ValueError("The int8 inference mode needs ENCODER_CALIBRATION_DIR "
+                                         "or an exported ENCODER_TORCHSCRIPT_PATH")
+                    calibration_images = list_calibration_images(
+                        config.ENCODER_CALIBRATION_DIR, config.ENCODER_CALIBRATION_IMAGES
+                    )
+                image_processor = ImageProcessor(
+                    image_size=config.IMAGE_SIZE,
+                    norm_mean=config.NORMALIZATION_MEAN,
+                    norm_std=config.NORMALIZATION_STD,
+                    embedding_head=config.EMBEDDING_HEAD,
+                    projection=PCAProjection.load(config.PCA_PROJECTION_PATH) if config.PCA_PROJECTION_PATH else None,
+                    llm_image_max_side=config.LLM_IMAGE_MAX_SIDE,
+                    llm_image_quality=config.LLM_IMAGE_QUALITY,
+                    weights_path=config.ENCODER_WEIGHTS_PATH,
+                    torchscript_path=config.ENCODER_TORCHSCRIPT_PATH,
+                    inference_mode=config.ENCODER_INFERENCE_MODE,
+                    calibration_images=calibration_images,
+                    fast_preprocess=config.FAST_PREPROCESSING
+                )
+            self.image_processor = image_processor
+            
+            # Optionally coalesce concurrent requests into batched forward passes
+            if config.ENCODER_MICRO_BATCHING:
+                self.encoder_batcher = MicroBatcher(
+                    self.image_processor.encode_images,
+                    max_batch_size=config.ENCODER_MAX_BATCH_SIZE,
+                    max_wait_ms=config.ENCODER_MAX_WAIT_MS
+                )
+                QUEUE_DEPTH.set_function(self.encoder_batcher.queue_depth, queue="encoder_batches")
+        
+        with self._phase("connecting to the LLM"):
+            if llm_service is None:
+                from models.llm_service import LlamaVisionService
+                llm_service = LlamaVisionService(
+                    model_id=config.LLAMA_MODEL_ID,
+                    project_id=config.PROJECT_ID,
+                    region=config.REGION,
+                    timeout=config.LLM_TIMEOUT_SECONDS,
+                    max_retries=config.LLM_MAX_RETRIES,
+                    backoff_seconds=config.LLM_BACKOFF_SECONDS,
+                    max_concurrency=config.LLM_MAX_CONCURRENCY,
+                    breaker_failures=config.LLM_BREAKER_FAILURES,
+                    breaker_reset_seconds=config.LLM_BREAKER_RESET_SECONDS
+                )
+            self.llm_service = llm_service
+        
+        with self._phase("warming up the encoder"):
+            # The first forward pass allocates buffers and picks kernels; pay for it now
+            warmup_image = Image.new("RGB", config.IMAGE_SIZE, (128, 128, 128))
+            self.image_processor.encode_image(warmup_image, is_url=False)
+
+    @contextmanager
+    def _phase(self, name):
+        """
+        Mark a startup phase as current and record its duration.
+        """
+        self.startup_phase = name
+        start = time.perf_counter()
+        yield
+        self.startup_timings[name] = time.perf_counter() - start
 
-    def process_image(self, image):
+    def process_image(self, image, min_price=None, max_price=None, categories=None, brands=None):
         """
         Process a user-uploaded image and generate a fashion response.
         
         Args:
-            image: PIL image uploaded through Gradio
+            image: PIL image uploaded through Gradio, or a path to an image file
+            min_price (float, optional): Only match items costing at least this much
+            max_price (float, optional): Only match items costing at most this much
+            categories (list, optional): Only match items of these garment categories
+            brands (list, optional): Only match items of these brands
                 
         Returns:
             str: Formatted response with fashion analysis
         """
-        # Save the image temporarily if it's not already a file path
-        if not isinstance(image, str):
-            temp_file = NamedTemporaryFile(delete=False, suffix=".jpg")
-            image_path = temp_file.name
-            image.save(image_path)
-        else:
-            image_path = image
+        filters = search_filters(min_price, max_price, categories, brands)
+        with self._request("sync", track=True):
+            match, error = self.match_image(image, filters)
+            if error:
+                return error
+            return self.generate_response(match)
+
+    async def process_image_async(self, image, min_price=None, max_price=None, categories=None, brands=None):
+        """
+        Asynchronous version of process_image for the Gradio event loop.
+        
+        Encoding and matching run in the encode pool and the LLM call in the
+        LLM pool, so while one request waits on the model other requests can
+        be encoded.
+        
+        Args:
+            image, min_price, max_price, categories, brands: As for process_image
+                
+        Returns:
+            str: Formatted response with fashion analysis
+        """
+        filters = search_filters(min_price, max_price, categories, brands)
+        with self._request("async") as profiler:
+            match, error = await self._run_in(self.encode_pool, profiler, self.match_image, image, filters)
+            if error:
+                return error
+            return await self._run_in(self.llm_pool, profiler, self.generate_response, match)
+
+    async def process_image_stream(self, image, min_price=None, max_price=None, categories=None, brands=None):
+        """
+        Streaming version of process_image_async for progressive rendering.
+        
+        Yields the Markdown rendered so far as LLM chunks arrive. The last
+        value is always the fully processed response, including the item
+        section fallback and rejection handling of process_response.
+        
+        Args:
+            image, min_price, max_price, categories, brands: As for process_image
+            
+        Yields:
+            str: Formatted response so far
+        """
+        filters = search_filters(min_price, max_price, categories, brands)
+        with self._request("stream") as profiler:
+            match, error = await self._run_in(self.encode_pool, profiler, self.match_image, image, filters)
+            if error:
+                yield error
+                return
+            
+            responses = self._stream_response(match, profiler)
+            try:
+                async for rendered in responses:
+                    yield rendered
+            finally:
+                # A client that goes away stops the model stream too
+                await responses.aclose()
+
+    async def process_image_tiered(self, image, min_price=None, max_price=None, categories=None, brands=None):
+        """
+        Tiered version of process_image_stream that answers from the catalog first.
+        
+        The first value is the deterministic item list, available as soon as
+        the match is found. The LLM analysis then replaces it (progressively
+        when STREAM_RESPONSES is on). If the analysis is not done within
+        LLM_DEADLINE_SECONDS, the catalog answer is kept.
+        
+        Args:
+            image, min_price, max_price, categories, brands: As for process_image
+            
+        Yields:
+            str: Formatted response so far
+        """
+        loop = asyncio.get_running_loop()
+        filters = search_filters(min_price, max_price, categories, brands)
+        with self._request("tiered") as profiler:
+            match, error = await self._run_in(self.encode_pool, profiler, self.match_image, image, filters)
+            if error:
+                yield error
+                return
+            
+            # Tier 1: the catalog answer needs no model call
+            with span("catalog_answer"):
+                catalog_response = process_response(build_basic_response(
+                    match["items_description"], match["similarity_score"], config.SIMILARITY_THRESHOLD,
+                    match.get("similar_items_description")
+                ))
+            yield catalog_response
+            
+            # Tier 2: the LLM analysis, bounded by the deadline
+            if config.STREAM_RESPONSES:
+                enrichment = self._stream_response(match, profiler)
+            else:
+                enrichment = self._blocking_response(match, profiler)
+            deadline = loop.time() + config.LLM_DEADLINE_SECONDS
+            try:
+                while True:
+                    remaining = max(0.0, deadline - loop.time())
+                    yield await asyncio.wait_for(enrichment.__anext__(), timeout=remaining)
+            except StopAsyncIteration:
+                return
+            except asyncio.TimeoutError:
+                print(f"LLM analysis missed the {config.LLM_DEADLINE_SECONDS}s deadline, "
+                      "keeping the catalog answer")
+                count("llm_deadline_missed")
+                yield catalog_response + "\n\n_The detailed style analysis is unavailable right now._"
+            finally:
+                # Stop the model stream of an analysis that missed the deadline or lost its client
+                await enrichment.aclose()
+
+    @contextmanager
+    def _request(self, handler, track=False):
+        """
+        Time a request end to end and, for a sampled share of requests, profile it.
+        
+        Args:
+            handler (str): Request handler, used as a metric label
+            track (bool): Profile the calling thread for the whole request, for
+                handlers that do not hop between the pools
+            
+        Yields:
+            SamplingProfiler: Profiler to pass to _run_in, or None if not sampled
+        """
+        profiler = maybe_profiler(config.PROFILE_SAMPLE_RATE, config.PROFILE_INTERVAL_MS / 1000)
+        IN_FLIGHT.inc()
+        try:
+            with span("request", handler=handler):
+                if profiler is not None and track:
+                    with profiler.track():
+                        yield profiler
+                else:
+                    yield profiler
+        finally:
+            IN_FLIGHT.dec()
+            if profiler is not None:
+                path = profiler.save(os.path.join(config.PROFILE_DIR, f"{handler}-{time.time_ns()}.folded"))
+                print(f"Saved request profile to {path}")
+
+    def _run_in(self, pool, profiler, fn, *args):
+        """
+        Run fn in a pool from the event loop, sampled by the request profiler if there is one.
+        """
+        if profiler is not None:
+            fn, args = profiler.call, (fn,) + args
+        return asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+
+    def match_image(self, image, filters=None):
+        """
+        Encode an image and find its closest catalog outfit (steps 1 to 3).
+        
+        Args:
+            image: PIL image uploaded through Gradio, or a path to an image file
+            filters (dict, optional): Predicates from search_filters. Only items
+                passing them are searched and listed.
+            
+        Returns:
+            tuple: (match dict, None) on success or (None, error message)
+        """
+        if not self.ready:
+            return None, self.readiness_message()
+        
+        if image is None:
+            count("request_rejected", reason="no_image")
+            return None, "Error: Please upload an image first."
         
-        # Step 1: Encode the image
-        user_encoding = self.image_processor.encode_image(image_path, is_url=False)
+        # Work on one catalog generation throughout, even if an update is swapped in meanwhile
+        catalog = self.catalog.current
+        
+        # Evaluate the filters before the costly encoding, so an empty selection fails fast
+        allowed = None
+        if filters:
+            with span("filter"):
+                allowed = catalog.catalog_filter.mask(filters["min_price"], filters["max_price"],
+                                                   filters["where"])
+            if allowed is not None and not allowed.any():
+                count("request_rejected", reason="no_filter_match")
+                return None, "Error: No catalog items match the selected filters."
+        
+        # Step 1: Encode the image (in memory, no temporary file)
+        user_encoding = self._encode(image)
         if user_encoding['vector'] is None:
-            return "Error: Unable to process the image. Please try another image."
+            count("request_rejected", reason="unreadable_image")
+            return None, "Error: Unable to process the image. Please try another image."
         
         # Step 2: Find the closest match
-        closest_row, similarity_score = self.image_processor.find_closest_match(user_encoding['vector'], self.data)
+        closest_row, similarity_score = self.image_processor.find_closest_match(
+            user_encoding['vector'], catalog.data, index=catalog.index, allowed=allowed
+        )
         if closest_row is None:
-            return "Error: Unable to find a match. Please try another image."
+            count("request_rejected", reason="no_match")
+            return None, "Error: Unable to find a match. Please try another image."
         
         print(f"Closest match: {closest_row['Item Name']} with similarity score {similarity_score:.2f}")
         
         # Step 3: Get all related items
-        all_items = get_all_items_for_image(closest_row['Image URL'], self.data)
+        image_url = closest_row['Image URL']
+        with span("item_lookup"):
+            all_items = get_all_items_for_image(image_url, catalog.data, catalog.item_lookup)
         if all_items.empty:
-            return "Error: No items found for the matched image."
+            count("request_rejected", reason="no_items")
+            return None, "Error: No items found for the matched image."
+        items_description = catalog.item_lookup[image_url].get("items_description")
+        if items_description is None:
+            items_description = format_items_description(all_items)
+        if allowed is not None:
+            # The outfit photo matched through an allowed item; list only the allowed ones
+            keep = catalog.catalog_filter.rows_allowed(allowed, catalog.item_lookup[image_url]["positions"])
+            if not keep.all():
+                all_items = all_items[keep]
+                items_description = format_items_description(all_items)
+        
+        # Optional step 3b: items matching individual garment regions. They come from
+        # other outfits, so they are listed apart from the matched outfit's items
+        region_rows = ()
+        similar_items_description = None
+        if user_encoding.get('regions'):
+            with span("regions"):
+                region_rows = self._match_regions(catalog.index, user_encoding['regions'],
+                                                  catalog.item_lookup[image_url]["positions"], allowed)
+            if region_rows:
+                similar_items_description = format_items_description(catalog.data.iloc[list(region_rows)])
+        
+        return {
+            "encoding": user_encoding,
+            "closest_row": closest_row,
+            "similarity_score": similarity_score,
+            "all_items": all_items,
+            "items_description": items_description,
+            "similar_items_description": similar_items_description,
+            "region_rows": region_rows,
+            "filters": _filters_key(filters),
+            "catalog_id": catalog.catalog_id,
+        }, None
+
+    def _match_regions(self, index, regions, outfit_positions, allowed=None):
+        """
+        Find catalog items for each garment region, outside the matched outfit.
+        
+        Returns:
+            tuple: Positional row ids of the extra items, grouped by region
+        """
+        region_matches = match_regions(
+            [region['vector'] for region in regions], index, k=config.REGION_SEARCH_K,
+            allowed=allowed
+        )
+        per_region = aggregate_region_matches(
+            region_matches, per_region=config.REGION_ITEMS_PER_REGION, exclude=outfit_positions
+        )
+        return tuple(row_id for rows in per_region for row_id, _ in rows)
+
+    def generate_response(self, match):
+        """
+        Generate and format the fashion response for a match (step 4).
+        
+        Args:
+            match (dict): Result of match_image
+            
+        Returns:
+            str: Formatted response with fashion analysis
+        """
+        cache_key = self._response_cache_key(match)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
         
-        # Step 4: Generate fashion response
         bot_response = self.llm_service.generate_fashion_response(
-            user_image_base64=user_encoding['base64'],
-            matched_row=closest_row,
-            all_items=all_items,
-            similarity_score=similarity_score,
-            threshold=config.SIMILARITY_THRESHOLD
+            user_image_base64=match["encoding"]['base64'],
+            matched_row=match["closest_row"],
+            all_items=match["all_items"],
+            similarity_score=match["similarity_score"],
+            threshold=config.SIMILARITY_THRESHOLD,
+            items_description=match["items_description"],
+            similar_items_description=match.get("similar_items_description")
+        )
+        
+        with span("format"):
+            response = process_response(bot_response)
+        if cache_key is not None and not self._is_fallback(match, bot_response):
+            self.response_cache.set(cache_key, response)
+        return response
+
+    async def _stream_response(self, match, profiler=None):
+        """
+        Stream the LLM response for a match, yielding the rendering so far.
+        
+        The last value is always the fully processed response, including the
+        item section fallback and rejection handling of process_response.
+        """
+        cache_key = self._response_cache_key(match)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+        
+        stream = self.llm_service.generate_fashion_response_stream(
+            user_image_base64=match["encoding"]['base64'],
+            matched_row=match["closest_row"],
+            all_items=match["all_items"],
+            similarity_score=match["similarity_score"],
+            threshold=config.SIMILARITY_THRESHOLD,
+            items_description=match["items_description"],
+            similar_items_description=match.get("similar_items_description")
         )
+        # Guards the stream, as a chunk read may still run in the pool when it is closed
+        stream_lock = threading.Lock()
+        
+        def next_chunk():
+            with stream_lock:
+                return _next_chunk(stream)
+        
+        def close_stream():
+            with stream_lock:
+                stream.close()
+        
+        renderer = StreamingResponseProcessor()
+        chunks = []
+        try:
+            while True:
+                # Pull each chunk in the LLM pool so the blocking read stays off the loop
+                chunk, complete = await self._run_in(self.llm_pool, profiler, next_chunk)
+                if chunk is None:
+                    break
+                chunks.append(chunk)
+                if renderer.feed(chunk):
+                    yield renderer.text
+        finally:
+            # Closing the stream early ends the model call and frees its LLM slot; if a
+            # cancelled read is still running, close once it returns
+            if stream_lock.acquire(blocking=False):
+                try:
+                    stream.close()
+                finally:
+                    stream_lock.release()
+            else:
+                self.llm_pool.submit(close_stream)
+        
+        with span("format"):
+            response = process_response("".join(chunks))
+        # A stream that failed or broke off ends in the catalog fallback; ask the LLM again next time
+        if cache_key is not None and complete:
+            self.response_cache.set(cache_key, response)
+        yield response
+
+    async def _blocking_response(self, match, profiler=None):
+        """
+        Generate the full LLM response for a match in the LLM pool, yielding it once.
+        """
+        yield await self._run_in(self.llm_pool, profiler, self.generate_response, match)
+
+    def _is_fallback(self, match, bot_response):
+        """
+        Check whether a response is only the catalog fallback, which is not cached
+        so the LLM is asked again once it recovers.
+        """
+        return bot_response == build_basic_response(
+            match["items_description"], match["similarity_score"], config.SIMILARITY_THRESHOLD,
+            match.get("similar_items_description")
+        )
+
+    def _response_cache_key(self, match):
+        """
+        Key a response by matched outfit, threshold bucket, filters, catalog
+        contents and prompt version.
+        
+        The catalog is named by its catalog_id rather than its version, which
+        restarts at 0 in every process while a disk cache keeps its entries.
+        
+        Returns:
+            tuple: The cache key, or None when caching is disabled
+        """
+        if self.response_cache is None:
+            return None
+        threshold_bucket = match["similarity_score"] >= config.SIMILARITY_THRESHOLD
+        return (match["closest_row"]['Image URL'], threshold_bucket, match.get("region_rows", ()),
+                match.get("filters"), match.get("catalog_id"), config.PROMPT_VERSION)
+
+    def _register_metrics(self):
+        """
+        Export the pool queue depths and cache counters through the metrics registry.
+        """
+        QUEUE_DEPTH.set_function(self.encode_pool._work_queue.qsize, queue="encode_pool")
+        QUEUE_DEPTH.set_function(self.llm_pool._work_queue.qsize, queue="llm_pool")
+        REGISTRY.gauge("stylefinder_catalog_items", "Live catalog items").set_function(
+            lambda: self.catalog.current.items if self.catalog else 0)
+        REGISTRY.gauge("stylefinder_catalog_version", "Version of the live catalog generation").set_function(
+            lambda: self.catalog.current.version if self.catalog else 0)
+        caches = {"encodings": self.encoding_cache, "responses": self.response_cache}
+        for name, cache in caches.items():
+            if cache is not None:
+                CACHE_LOOKUPS.set_function(lambda cache=cache: cache.hits, cache=name, result="hit")
+                CACHE_LOOKUPS.set_function(lambda cache=cache: cache.misses, cache=name, result="miss")
+
+    def cache_stats(self):
+        """
+        Report hit and miss counters of both cache levels.
+        
+        Returns:
+            dict: Stats per cache level, empty when caching is disabled
+        """
+        caches = {"encodings": self.encoding_cache, "responses": self.response_cache}
+        return {name: cache.stats() for name, cache in caches.items() if cache is not None}
+
+    def _encode(self, image):
+        """
+        Encode an image, reusing the cached feature vectors of an identical upload.
         
-        # Clean up temporary file
-        if not isinstance(image, str):
+        Only the vectors are cached, keyed by a hash of the decoded pixels; the
+        LLM payload is always built from the current upload.
+        """
+        key = None
+        if self.encoding_cache is not None:
             try:
-                os.unlink(image_path)
-            except:
-                pass
+                with span("hash"):
+                    image = self.image_processor.load_image(image, is_url=False)
+                    key = image_hash(image)
+                if config.REGION_MATCHING:
+                    key = (key, config.REGION_CROP_MODE, config.REGION_COUNT)
+            except Exception as e:
+                # Let the encoder report unreadable images as usual
+                print(f"Error hashing image: {e}")
+            if key is not None:
+                cached = self.encoding_cache.get(key)
+                if cached is not None:
+                    return {**cached, "base64": self.image_processor.llm_payload(image)}
+        
+        with span("encode"):
+            if config.REGION_MATCHING:
+                # The whole image and its crops share one forward pass
+                user_encoding = self.image_processor.encode_regions(
+                    image, mode=config.REGION_CROP_MODE, count=config.REGION_COUNT, is_url=False
+                )
+            elif self.encoder_batcher is not None:
+                user_encoding = self.encoder_batcher(image)
+            else:
+                user_encoding = self.image_processor.encode_image(image, is_url=False)
+        
+        if key is not None and user_encoding['vector'] is not None:
+            self.encoding_cache.set(key, {name: value for name, value in user_encoding.items()
+                                          if name != "base64"})
+        return user_encoding
+
+def _next_chunk(stream):
+    """
+    Pull the next chunk of a generator.
+    
+    Returns:
+        tuple: (chunk, None), or (None, the generator's return value) once it is exhausted
+    """
+    try:
+        return next(stream), None
+    except StopIteration as stop:
+        return None, stop.value
+
+
+def _filters_key(filters):
+    """
+    Turn search_filters output into a hashable cache key part.
+    """
+    if not filters:
+        return None
+    return (filters["min_price"], filters["max_price"], tuple(sorted(filters["where"].items())))
+
+
+def _index_options():
+    """
+    Collect the similarity index settings from the configuration.
+    
+    Returns:
+        dict: Keyword arguments for build_index
+    """
+    if config.INDEX_BACKEND == "ivf":
+        return {"backend": "ivf", "nlist": config.IVF_NLIST, "nprobe": config.IVF_NPROBE}
+    return {"backend": config.INDEX_BACKEND}
+
+
+def _response_handler(app):
+    """
+    Pick the request handler matching the configured response mode.
+    
+    Args:
+        app (StyleFinderApp): Instance of the StyleFinderApp
         
-        return process_response(bot_response)
+    Returns:
+        Callable: Handler taking the uploaded image and the filter values
+    """
+    if config.TIERED_RESPONSES:
+        return app.process_image_tiered
+    if config.STREAM_RESPONSES:
+        return app.process_image_stream
+    return app.process_image_async
 
 
 def create_gradio_interface(app):
@@ -109,7 +802,8 @@ def create_gradio_interface(app):
     Create and configure the Gradio interface.
     
     Args:
-        app (StyleFinderApp): Instance of the StyleFinderApp
+        app (StyleFinderApp or WorkerPool): Instance of the StyleFinderApp, or a
+            pool of worker processes running it
         
     Returns:
         gr.Blocks: Configured Gradio interface
@@ -148,11 +842,25 @@ def create_gradio_interface(app):
                     label="Upload Fashion Image"
                 )
                 
+                # Optional filters restricting the matched items
+                with gr.Accordion("Filters", open=False):
+                    with gr.Row():
+                        min_price = gr.Number(value=None, label="Min price", minimum=0)
+                        max_price = gr.Number(value=None, label="Max price", minimum=0)
+                    category_input = gr.Dropdown(
+                        choices=app.filter_choices("Category"), multiselect=True, label="Category"
+                    )
+                    brand_choices = app.filter_choices("Brand")
+                    brand_input = gr.Dropdown(
+                        choices=brand_choices, multiselect=True, label="Brand", visible=bool(brand_choices)
+                    )
+                
                 # Submit button
                 submit_btn = gr.Button("Analyze Style", variant="primary")
                 
-                # Status indicator
-                status = gr.Markdown("Ready to analyze.")
+                # Status indicator, showing startup progress until the app is ready
+                status = gr.Markdown(app.readiness_message())
+                startup_timer = gr.Timer(1.0, active=not app.ready)
             
             with gr.Column(scale=2):
                 # Output markdown component for displaying analysis results
@@ -162,15 +870,32 @@ def create_gradio_interface(app):
                 )
         
         # Event handlers
+        # 0. Poll the startup state, stopping once the app is ready
+        def poll_startup():
+            brands = app.filter_choices("Brand")
+            return (
+                app.readiness_message(),
+                gr.Timer(active=not app.ready and app.startup_error is None),
+                gr.Dropdown(choices=app.filter_choices("Category")),
+                gr.Dropdown(choices=brands, visible=bool(brands)),
+            )
+        
+        startup_timer.tick(
+            fn=poll_startup,
+            inputs=None,
+            outputs=[status, startup_timer, category_input, brand_input]
+        )
+        
         # 1. Submit button click with processing indicator
         submit_btn.click(
             fn=lambda: "Analyzing image... This may take a few moments.",
             inputs=None,
             outputs=status
         ).then(
-            fn=app.process_image,
-            inputs=[image_input],
-            outputs=output
+            fn=_response_handler(app),
+            inputs=[image_input, min_price, max_price, category_input, brand_input],
+            outputs=output,
+            concurrency_limit=config.GRADIO_CONCURRENCY_LIMIT
         ).then(
             fn=lambda: "Analysis complete!",
             inputs=None,
@@ -228,13 +953,35 @@ def create_gradio_interface(app):
 
 if __name__ == "__main__":
     try:
-        # Initialize the app with the dataset
-        app = StyleFinderApp("swift-style-embeddings.pkl")
+        start = time.perf_counter()
+        
+        dataset_path = config.VECTOR_STORE_PATH or "swift-style-embeddings.pkl"
+        if config.SERVING_WORKERS > 0:
+            # Serve from worker processes, each loading its own models
+            from services.worker_pool import WorkerPool
+            app = WorkerPool(dataset_path, workers=config.SERVING_WORKERS,
+                             heartbeat_seconds=config.WORKER_HEARTBEAT_SECONDS,
+                             health_timeout=config.WORKER_HEALTH_TIMEOUT_SECONDS,
+                             concurrency=config.WORKER_CONCURRENCY,
+                             request_timeout=config.WORKER_REQUEST_TIMEOUT_SECONDS)
+        else:
+            # Initialize the app with the dataset, loading the models in the background if configured
+            app = StyleFinderApp(dataset_path, background=config.BACKGROUND_STARTUP)
+        
+        if config.METRICS_PORT is not None:
+            # Metrics are optional; a taken port must not keep the app from serving
+            from utils.metrics import start_metrics_server
+            try:
+                start_metrics_server(config.METRICS_PORT)
+            except OSError as e:
+                print(f"Warning: cannot serve metrics on port {config.METRICS_PORT}: {e}")
         
         # Create the Gradio interface
         demo = create_gradio_interface(app)
+        print(f"Interface ready after {time.perf_counter() - start:.2f}s")
         
         # Launch the Gradio interface
+        demo.queue(default_concurrency_limit=config.GRADIO_CONCURRENCY_LIMIT)
         demo.launch(
             server_name="127.0.0.1",  
             server_port=5000,
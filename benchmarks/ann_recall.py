@@ -0,0 +1,63 @@
+"""
+Compare the approximate IVF index against exact search on recall@k and latency.
+
+Usage:
+    python -m benchmarks.ann_recall --rows 200000 --dim 1000 --nprobe 8
+    python -m benchmarks.ann_recall --dataset swift-style-embeddings.pkl
+"""
+
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+from models.embedding_index import EmbeddingIndex, IVFFlatIndex, evaluate_recall
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", help="Pickled dataset to index instead of random vectors")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows in the synthetic catalog")
+    parser.add_argument("--dim", type=int, default=1000, help="Dimension of the synthetic vectors")
+    parser.add_argument("--clusters", type=int, default=500,
+                        help="Latent clusters the synthetic vectors are drawn around")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours compared per query")
+    parser.add_argument("--nlist", type=int, default=None, help="IVF clusters")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32],
+                        help="IVF clusters scanned per query (several values allowed)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.dataset:
+        dataset = pd.read_pickle(args.dataset)
+        exact = EmbeddingIndex.from_dataframe(dataset)
+    else:
+        exact = EmbeddingIndex(_synthetic_vectors(rng, args.rows, args.dim, args.clusters),
+                               np.arange(args.rows))
+
+    # Queries are perturbed catalog vectors, like photos of catalog outfits
+    picks = rng.choice(len(exact), args.queries)
+    queries = exact.matrix[picks] + rng.normal(scale=0.05, size=(args.queries, exact.dim))
+
+    approx = IVFFlatIndex(exact.matrix, exact.row_ids, nlist=args.nlist, seed=args.seed)
+    for nprobe in args.nprobe:
+        approx.nprobe = min(nprobe, approx.nlist)
+        report = evaluate_recall(approx, exact, queries, k=args.k)
+        report.update({"rows": len(exact), "nlist": approx.nlist, "nprobe": approx.nprobe})
+        print(json.dumps(report))
+
+
+def _synthetic_vectors(rng, rows, dim, clusters):
+    """
+    Draw clustered random vectors so the IVF partitioning has structure to find.
+    """
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=rows)
+    noise = rng.normal(scale=0.5, size=(rows, dim)).astype(np.float32)
+    return centers[labels] + noise
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Load test of StyleFinderApp.process_image_async against a local stub LLM.
+
+Sends a fixed number of requests at several concurrency levels and reports
+throughput and latency percentiles. With a stub that only sleeps, throughput
+should grow with concurrency until the encode or LLM pools are saturated.
+
+Usage:
+    python -m benchmarks.async_load --requests 64 --concurrency 1 2 4 8 16 --llm-latency 1.0
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from app import StyleFinderApp
+from benchmarks.fakes import FakeChatModel, synthetic_catalog
+from models.llm_service import LlamaVisionService
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds per stub LLM call")
+    parser.add_argument("--catalog-rows", type=int, default=10000)
+    args = parser.parse_args()
+
+    llm_service = LlamaVisionService(
+        model_id="stub", project_id="stub", model=FakeChatModel(latency=args.llm_latency)
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path = os.path.join(tmp, "catalog.pkl")
+        synthetic_catalog(args.catalog_rows).to_pickle(dataset_path)
+        app = StyleFinderApp(dataset_path, llm_service=llm_service)
+
+    images = [Image.open(path).convert("RGB") for path in sorted(glob.glob("examples/*.png"))]
+    app.process_image(images[0])  # Warm up
+
+    for concurrency in args.concurrency:
+        latencies, elapsed = asyncio.run(_run(app, images, args.requests, concurrency))
+        print(json.dumps({
+            "concurrency": concurrency,
+            "requests": args.requests,
+            "throughput_rps": round(args.requests / elapsed, 2),
+            "p50_s": round(float(np.percentile(latencies, 50)), 3),
+            "p99_s": round(float(np.percentile(latencies, 99)), 3),
+        }))
+
+
+async def _run(app, images, count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await app.process_image_async(images[i % len(images)])
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(count)))
+    return latencies, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Startup time and memory of the catalog formats.
+
+Writes one synthetic catalog three ways and loads each in a fresh
+interpreter the way the app does, up to a ready catalog (index, item lookup
+and filter structures):
+
+- pickle: the original dataset pickle, embeddings included
+- store-pickle: a vector store with pickled metadata (the older store format)
+- store-arrow: a vector store with memory-mapped Arrow metadata columns
+
+Then it serves a number of lookups (items of a random outfit, rendered for
+the prompt) and reports the load time, the resident memory after loading
+and after the lookups, and the peak. The encoder is not loaded, so the
+numbers only cover the catalog.
+
+Usage:
+    python -m benchmarks.catalog_formats --rows 200000
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+FORMATS = ("pickle", "store-pickle", "store-arrow")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--encoding", default="int8", help="Encoding of the vector stores")
+    parser.add_argument("--lookups", type=int, default=1000)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(json.loads(args.child))
+        return
+
+    import pyarrow as pa
+    from benchmarks.fakes import synthetic_catalog
+    from models.vector_store import save_vector_store
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset = synthetic_catalog(args.rows, dim=args.dim)
+        paths = {
+            "pickle": os.path.join(tmp, "catalog.pkl"),
+            "store-pickle": os.path.join(tmp, "legacy"),
+            "store-arrow": os.path.join(tmp, "columnar"),
+        }
+        dataset.to_pickle(paths["pickle"])
+        save_vector_store(paths["store-arrow"], dataset, encoding=args.encoding)
+        save_vector_store(paths["store-pickle"], dataset, encoding=args.encoding)
+        del dataset
+
+        # The older store format: the same metadata, pickled
+        legacy = paths["store-pickle"]
+        pa.ipc.open_file(pa.memory_map(f"{legacy}.items.arrow")).read_all().to_pandas().to_pickle(
+            f"{legacy}.items.pkl")
+        os.remove(f"{legacy}.items.arrow")
+
+        for name in FORMATS:
+            options = {"format": name, "path": paths[name], "lookups": args.lookups}
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.catalog_formats", "--child", json.dumps(options)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            report = json.loads(output.strip().splitlines()[-1])
+            print(json.dumps({"format": name, "rows": args.rows, **report}))
+
+
+def _child(options):
+    import pandas as pd
+
+    from app import _index_options
+    import config
+    from models.index_manager import IndexManager
+    from models.vector_store import load_vector_store
+    from utils.helpers import format_items_description, get_all_items_for_image
+
+    baseline = _rss_mb()
+    baseline_peak = _rss_mb("VmHWM")
+    start = time.perf_counter()
+    if options["format"] == "pickle":
+        data, index = pd.read_pickle(options["path"]), None
+    else:
+        data, index = load_vector_store(options["path"])
+    loaded = time.perf_counter() - start
+
+    catalog = IndexManager(data, index, index_options=_index_options(),
+                           filter_columns=config.FILTER_COLUMNS,
+                           describe_items=options["format"] != "store-arrow")
+    ready = time.perf_counter() - start
+    ready_rss = _rss_mb() - baseline
+
+    generation = catalog.current
+    urls = list(generation.item_lookup)
+    rng = random.Random(0)
+    start = time.perf_counter()
+    for _ in range(options["lookups"]):
+        url = rng.choice(urls)
+        items = get_all_items_for_image(url, generation.data, generation.item_lookup)
+        description = generation.item_lookup[url].get("items_description")
+        if description is None:
+            description = format_items_description(items)
+    lookup_us = (time.perf_counter() - start) * 1e6 / options["lookups"]
+
+    print(json.dumps({
+        "load_s": round(loaded, 3),
+        "ready_s": round(ready, 3),
+        "rss_ready_mb": round(ready_rss, 1),
+        "rss_after_lookups_mb": round(_rss_mb() - baseline, 1),
+        "peak_rss_mb": round(_rss_mb("VmHWM") - baseline_peak, 1),
+        "lookup_us": round(lookup_us, 1),
+    }))
+
+
+def _rss_mb(field="VmRSS"):
+    """Current (VmRSS) or peak (VmHWM) resident set size of this process in MiB (Linux)."""
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+
+if __name__ == "__main__":
+    main()
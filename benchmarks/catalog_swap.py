@@ -0,0 +1,151 @@
+"""
+Check that catalog updates never fail or stall requests in flight.
+
+Serves a synthetic catalog and keeps a fixed number of requests in flight
+while a writer drops update files into the watched directory: appended
+vector store segments (some replacing existing items), deletions, and now
+and then a whole new catalog. Compaction runs whenever the tombstones or
+segments pile up. The LLM is a local stub and caching is off, so every
+request searches the index. Latency with and without updates is reported
+side by side; the exit status is 1 if any request failed. The same
+guarantee is checked without the encoder in tests/test_index_manager.py.
+
+Usage:
+    python -m benchmarks.catalog_swap --weights resnet50.pth --rows 50000 --seconds 30
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import config
+from benchmarks.fakes import FakeChatModel, synthetic_catalog
+from models.llm_service import LlamaVisionService
+from models.vector_store import save_vector_store
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--weights", default=config.ENCODER_WEIGHTS_PATH,
+                        help="Local ResNet50 state dict (default: the pretrained weights)")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--seconds", type=float, default=30, help="Duration of each phase")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--update-rows", type=int, default=2000, help="Items per appended segment")
+    parser.add_argument("--update-interval", type=float, default=0.5,
+                        help="Seconds between update files")
+    parser.add_argument("--llm-latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    config.ENCODER_WEIGHTS_PATH = args.weights
+    config.CACHE_ENABLED = False
+    from app import StyleFinderApp
+
+    images = [Image.open(path).convert("RGB") for path in sorted(glob.glob("examples/*.png"))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path = os.path.join(tmp, "catalog.pkl")
+        synthetic_catalog(args.rows).to_pickle(dataset_path)
+        updates = os.path.join(tmp, "updates")
+        os.makedirs(updates)
+
+        app = StyleFinderApp(dataset_path, llm_service=LlamaVisionService(
+            model_id="stub", project_id="stub", model=FakeChatModel(latency=args.llm_latency)))
+        app.catalog.watch(updates, interval=0.1)
+        asyncio.run(_serve(app, images, args.concurrency, 2))  # Warm up
+
+        steady = asyncio.run(_serve(app, images, args.concurrency, args.seconds))
+
+        stop = threading.Event()
+        writer = threading.Thread(target=_write_updates,
+                                  args=(updates, args, stop), name="update-writer")
+        start_version = app.catalog.current.version
+        writer.start()
+        try:
+            swapping = asyncio.run(_serve(app, images, args.concurrency, args.seconds))
+        finally:
+            stop.set()
+            writer.join()
+        app.catalog.stop()
+        generations = app.catalog.current.version - start_version
+
+    report = {"rows": args.rows, "generations_published": generations}
+    for phase, results in (("steady", steady), ("updating", swapping)):
+        latencies = np.array([latency for latency, _ in results]) * 1000
+        report[phase] = {
+            "requests": len(results),
+            "failed": sum(response.startswith("Error") for _, response in results),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p99_ms": round(float(np.percentile(latencies, 99)), 1),
+            "max_ms": round(float(latencies.max()), 1),
+        }
+    print(json.dumps(report, indent=2))
+    sys.exit(1 if report["steady"]["failed"] or report["updating"]["failed"] else 0)
+
+
+async def _serve(app, images, concurrency, seconds):
+    """
+    Keep `concurrency` requests in flight for `seconds`.
+
+    Returns:
+        list: (latency in seconds, response) per request
+    """
+    deadline = time.perf_counter() + seconds
+    results = []
+
+    async def client(offset):
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await app.process_image_async(images[i % len(images)])
+            results.append((time.perf_counter() - start, response))
+            i += concurrency
+
+    await asyncio.gather(*(client(offset) for offset in range(concurrency)))
+    return results
+
+
+def _write_updates(directory, args, stop):
+    """
+    Drop a stream of update files into the watched directory until stopped.
+    """
+    rng = np.random.default_rng(1)
+    step = 0
+    while not stop.wait(args.update_interval):
+        step += 1
+        name = os.path.join(directory, f"{step:05d}")
+        if step % 10 == 0:
+            # A whole new catalog
+            save_vector_store(name + ".full", synthetic_catalog(args.rows, seed=step))
+        elif step % 3 == 0:
+            # Delete a few outfits and single items of the original catalog
+            outfits = rng.integers(0, args.rows // 4, size=50)
+            items = rng.integers(0, args.rows, size=200)
+            spec = {
+                "image_urls": [f"https://images.example.com/outfit/{i}.jpg" for i in outfits],
+                "links": [f"https://shop.example.com/item/{i}" for i in items],
+            }
+            with open(name + ".tmp", "w") as f:
+                json.dump(spec, f)
+            os.replace(name + ".tmp", name + ".delete.json")
+        else:
+            # New items, plus updated copies of some existing ones (same links)
+            items = synthetic_catalog(args.update_rows, seed=step)
+            fresh = np.arange(args.update_rows) >= args.update_rows // 10
+            items.loc[fresh, "Link"] = [f"https://shop.example.com/new/{step}/{i}"
+                                        for i in np.flatnonzero(fresh)]
+            items["Image URL"] = [f"https://images.example.com/new/{step}/{i // 4}.jpg"
+                                  for i in range(args.update_rows)]
+            save_vector_store(name, items, encoding="float32")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Compare retrieval quality of the embedding heads on the bundled example images.
+
+Each example image forms the gallery. Queries are randomly augmented views of
+the examples (crops, flips, colour and scale changes), and a query counts as
+correct when its own source image is the nearest gallery entry. PCA
+projections are fitted on a separate set of augmented views.
+
+Usage:
+    python -m benchmarks.embedding_heads --views 40 --components 64 128 256
+"""
+
+import argparse
+import glob
+import json
+
+import numpy as np
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+
+import config
+from models.embedding_index import EmbeddingIndex
+from models.image_processor import ImageProcessor
+from models.projection import PCAProjection
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--views", type=int, default=40, help="Augmented views per example")
+    parser.add_argument("--components", type=int, nargs="+", default=[64, 128, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob("examples/*.png"))
+    gallery = [Image.open(path).convert("RGB") for path in paths]
+    augment = transforms.Compose([
+        transforms.RandomResizedCrop(config.IMAGE_SIZE[0] * 2, scale=(0.6, 1.0)),
+        transforms.RandomHorizontalFlip(),
+        transforms.ColorJitter(brightness=0.3, contrast=0.3, saturation=0.3),
+    ])
+
+    torch.manual_seed(args.seed)
+    queries, labels = _views(gallery, augment, args.views)
+    fit_views, _ = _views(gallery, augment, args.views)
+
+    for head in ("logits", "pooled"):
+        processor = ImageProcessor(
+            image_size=config.IMAGE_SIZE,
+            norm_mean=config.NORMALIZATION_MEAN,
+            norm_std=config.NORMALIZATION_STD,
+            embedding_head=head
+        )
+        gallery_vectors = _encode(processor, gallery)
+        query_vectors = _encode(processor, queries)
+        _report(head, gallery_vectors, query_vectors, labels)
+
+        if head != "pooled":
+            continue
+        fit_vectors = _encode(processor, fit_views)
+        for n_components in args.components:
+            if n_components > min(fit_vectors.shape):
+                continue
+            projection = PCAProjection.fit(fit_vectors, n_components)
+            _report(f"pooled+pca{n_components}", projection.transform(gallery_vectors),
+                    projection.transform(query_vectors), labels)
+
+
+def _views(images, augment, count):
+    views = []
+    labels = []
+    for label, image in enumerate(images):
+        for _ in range(count):
+            views.append(augment(image))
+            labels.append(label)
+    return views, np.asarray(labels)
+
+
+def _encode(processor, images, batch_size=32):
+    vectors = []
+    for offset in range(0, len(images), batch_size):
+        batch = [processor.preprocess(image) for image in images[offset:offset + batch_size]]
+        vectors.append(processor.extract_features(torch.stack(batch)))
+    return np.vstack(vectors)
+
+
+def _report(name, gallery_vectors, query_vectors, labels):
+    index = EmbeddingIndex(gallery_vectors, np.arange(len(gallery_vectors)))
+    correct = 0
+    reciprocal_ranks = []
+    margins = []
+    for vector, label in zip(query_vectors, labels):
+        row_ids, scores = index.search(vector, k=len(index))
+        rank = int(np.flatnonzero(row_ids == label)[0])
+        correct += rank == 0
+        reciprocal_ranks.append(1.0 / (rank + 1))
+        # Gap between the true image and the best wrong one
+        true_score = scores[rank]
+        wrong_score = scores[0] if rank else scores[1]
+        margins.append(true_score - wrong_score)
+
+    print(json.dumps({
+        "embedding": name,
+        "dim": index.dim,
+        "bytes_per_vector": index.dim * 4,
+        "top1_accuracy": round(correct / len(labels), 4),
+        "mrr": round(float(np.mean(reciprocal_ranks)), 4),
+        "mean_margin": round(float(np.mean(margins)), 4),
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+Compare image encoding throughput of the single-image, batched and micro-batched paths.
+
+Usage:
+    python -m benchmarks.encode_throughput --images 64 --batch-sizes 1 8 16 32
+"""
+
+import argparse
+import glob
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from models.batching import MicroBatcher
+from models.image_processor import ImageProcessor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=64, help="Images encoded per run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 16, 32])
+    parser.add_argument("--clients", type=int, default=16,
+                        help="Concurrent callers for the micro-batcher run")
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    examples = sorted(glob.glob("examples/*.png"))
+    inputs = [examples[i % len(examples)] for i in range(args.images)]
+    processor = ImageProcessor()
+
+    # Warm up so lazy allocations do not count against the first run
+    processor.encode_images(inputs[:2], is_url=False)
+
+    start = time.perf_counter()
+    for path in inputs:
+        processor.encode_image(path, is_url=False)
+    _report("single", len(inputs), time.perf_counter() - start)
+
+    for batch_size in args.batch_sizes:
+        start = time.perf_counter()
+        for offset in range(0, len(inputs), batch_size):
+            processor.encode_images(inputs[offset:offset + batch_size], is_url=False)
+        _report("batched", len(inputs), time.perf_counter() - start, batch_size=batch_size)
+
+    batcher = MicroBatcher(
+        lambda paths: processor.encode_images(paths, is_url=False),
+        max_batch_size=max(args.batch_sizes),
+        max_wait_ms=args.max_wait_ms
+    )
+    with ThreadPoolExecutor(max_workers=args.clients) as pool:
+        start = time.perf_counter()
+        list(pool.map(batcher, inputs))
+        elapsed = time.perf_counter() - start
+    batcher.close()
+    _report("micro-batched", len(inputs), elapsed, clients=args.clients)
+
+
+def _report(mode, count, elapsed, **extra):
+    print(json.dumps({
+        "mode": mode,
+        "images": count,
+        "seconds": round(elapsed, 3),
+        "images_per_second": round(count / elapsed, 2),
+        **extra,
+    }))
+
+
+if __name__ == "__main__":
+    main()
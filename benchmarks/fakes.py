@@ -0,0 +1,268 @@
+"""
+Local stand-ins for the external services, used by the benchmarks and tests.
+"""
+
+import json
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from models.vector_store import save_items
+
+# Long enough to pass the "incomplete response" check in generate_fashion_response
+FAKE_ANALYSIS = (
+    "# Fashion Analysis\n\n"
+    "**The jacket** is a tailored navy wool blazer with notch lapels.\n"
+    "**The trousers** are slim-fit charcoal chinos with a flat front.\n"
+    "**The shoes** are brown leather loafers with a low heel.\n\n"
+    "The overall style is smart casual, suitable for business settings.\n\n"
+)
+
+
+class FakeAPIError(Exception):
+    """
+    HTTP error raised by the fakes, carrying a status code like a real API failure.
+    """
+
+    def __init__(self, status_code):
+        super().__init__(f"Fake API error (status {status_code})")
+        self.status_code = status_code
+
+
+class FakeChatModel:
+    """
+    Mimics ModelInference.chat and chat_stream with a fixed response.
+
+    ``chat`` blocks for ``latency`` seconds. ``chat_stream`` waits
+    ``first_chunk_latency`` seconds and then spreads the remaining time over
+    chunks of ``chunk_size`` characters. Like an HTTP client, both raise
+    TimeoutError once a wait exceeds the ``timeout`` passed to the call. A
+    ``failure_rate`` share of calls raise FakeAPIError after the latency
+    instead of answering; with ``interrupt_after`` set, streams break off
+    with a ConnectionError after that many chunks.
+    """
+
+    def __init__(self, latency=1.0, response=FAKE_ANALYSIS, first_chunk_latency=None,
+                 chunk_size=16, echo_items=True, jitter=0.0, failure_rate=0.0, failure_status=503,
+                 interrupt_after=None):
+        """
+        Args:
+            latency (float): Seconds a full response takes, like a remote round trip
+            response (str): Text returned as the message content
+            echo_items (bool): Append the prompt's item section like the real model
+            jitter (float): Sigma of a log-normal factor applied to each call's latency,
+                giving the long tail of a real endpoint
+            first_chunk_latency (float, optional): Seconds before the first streamed
+                chunk, defaults to a tenth of latency
+            chunk_size (int): Characters per streamed chunk
+            failure_rate (float): Probability that a call fails
+            failure_status (int): HTTP status of injected failures
+            interrupt_after (int, optional): Streamed chunks before the connection drops
+        """
+        self.latency = latency
+        self.response = response
+        self.first_chunk_latency = latency / 10 if first_chunk_latency is None else first_chunk_latency
+        self.chunk_size = chunk_size
+        self.echo_items = echo_items
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.interrupt_after = interrupt_after
+        self.calls = 0
+
+    def chat(self, messages, timeout=None, **kwargs):
+        self.calls += 1
+        self._wait(self._scaled(self.latency), timeout)
+        self._maybe_fail()
+        return {"choices": [{"message": {"content": self._content(messages)}}]}
+
+    def chat_stream(self, messages, timeout=None, **kwargs):
+        self.calls += 1
+        content = self._content(messages)
+        pieces = [content[i:i + self.chunk_size] for i in range(0, len(content), self.chunk_size)]
+        scale = self._scaled(1.0)
+        delay = scale * max(0.0, self.latency - self.first_chunk_latency) / max(1, len(pieces))
+
+        self._wait(scale * self.first_chunk_latency, timeout)
+        self._maybe_fail()
+        for i, piece in enumerate(pieces):
+            if i == self.interrupt_after:
+                raise ConnectionError("Fake connection reset mid-stream")
+            if i:
+                self._wait(delay, timeout)
+            yield {"choices": [{"delta": {"content": piece}}]}
+
+    def _wait(self, seconds, timeout):
+        if timeout is not None and seconds > timeout:
+            time.sleep(timeout)
+            raise TimeoutError(f"Fake read timed out after {timeout}s")
+        time.sleep(seconds)
+
+    def _maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise FakeAPIError(self.failure_status)
+
+    def _scaled(self, seconds):
+        return seconds * random.lognormvariate(0.0, self.jitter) if self.jitter else seconds
+
+    def _content(self, messages):
+        if not self.echo_items:
+            return self.response
+        prompt = messages[0]["content"][0]["text"]
+        # Echo the item sections like the real model is asked to
+        marker = " (always include this section in your response)"
+        sections = [prompt[prompt.find(header + marker):].split("\n\n")[0].replace(marker, "")
+                    for header in ("ITEM DETAILS", "SIMILAR ITEMS") if header + marker in prompt]
+        return self.response + "\n\n".join(sections)
+
+
+class FakeSearchBackend:
+    """
+    Mimics the SerpAPI shopping backend of SearchService from fixtures.
+
+    Queries found in the fixtures return the stored response; any other query
+    gets a generated one with ``results`` products. Each search blocks for
+    ``latency`` seconds, like a remote round trip.
+    """
+
+    def __init__(self, fixtures=None, latency=0.5, results=10, failure_rate=0.0):
+        """
+        Args:
+            fixtures (dict or str, optional): Query mapped to a SerpAPI JSON response,
+                or the path of a JSON file holding that mapping
+            latency (float): Seconds each search takes
+            results (int): Products in generated responses
+            failure_rate (float): Probability that a search fails
+        """
+        if isinstance(fixtures, str):
+            with open(fixtures) as f:
+                fixtures = json.load(f)
+        self.fixtures = fixtures or {}
+        self.latency = latency
+        self.results = results
+        self.failure_rate = failure_rate
+        self.queries = []
+
+    def search(self, query):
+        self.queries.append(query)
+        time.sleep(self.latency)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise FakeAPIError(503)
+        if query in self.fixtures:
+            return self.fixtures[query]
+        return {"shopping_results": [
+            {
+                "title": f"{query} #{i}",
+                "price": f"${10 + i * 5:.2f}",
+                "product_link": f"https://shop.example.com/search/{abs(hash(query)) % 10**8}/{i}",
+                "source": "Example Shop",
+            }
+            for i in range(self.results)
+        ]}
+
+
+# Vocabulary for synthetic item names, so text search has something to match
+_COLORS = ["white", "black", "navy", "grey", "beige", "red", "olive", "brown"]
+_GARMENTS = ["t-shirt", "shirt", "blazer", "jeans", "chinos", "dress", "sneakers",
+             "loafers", "jacket", "sweater", "skirt", "coat"]
+
+
+def synthetic_catalog(rows, dim=1000, items_per_image=4, seed=0):
+    """
+    Build a random catalog DataFrame in the app's dataset format.
+
+    Args:
+        rows (int): Number of item rows
+        dim (int): Embedding dimension
+        items_per_image (int): Items sharing each outfit image and embedding
+        seed (int): Random seed
+
+    Returns:
+        DataFrame: Columns Item Name, Price, Link, Image URL and Embedding
+    """
+    rng = np.random.default_rng(seed)
+    images = max(1, rows // items_per_image)
+    image_ids = np.arange(rows) % images
+    vectors = rng.normal(size=(images, dim)).astype(np.float32)
+    dataset = _synthetic_items(image_ids, rng)
+    dataset["Embedding"] = list(vectors[image_ids])
+    return dataset
+
+
+def synthetic_vector_store(prefix, rows, dim=1000, items_per_image=4, encoding="int8", seed=0,
+                           chunk_images=65536):
+    """
+    Write a random catalog straight to a vector store, one block of outfits at a time.
+
+    save_vector_store(synthetic_catalog(...)) holds every float vector in
+    memory at once; this writes the codes into a memory-mapped file instead,
+    so catalogs of millions of rows can be generated. The store has the same
+    layout as save_vector_store, and the items of an outfit share one
+    random vector like in synthetic_catalog.
+
+    Args:
+        prefix (str): Path prefix for the store files
+        rows (int): Number of item rows
+        dim (int): Embedding dimension
+        items_per_image (int): Items sharing each outfit image and embedding
+        encoding (str): "float32", "float16" or "int8"
+        seed (int): Random seed
+        chunk_images (int): Outfit vectors generated per block
+
+    Returns:
+        dict: The store metadata written to <prefix>.json
+    """
+    dtypes = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+    if encoding not in dtypes:
+        raise ValueError(f"Unsupported encoding '{encoding}', expected one of {sorted(dtypes)}")
+
+    rng = np.random.default_rng(seed)
+    images = max(1, rows // items_per_image)
+    codes = np.lib.format.open_memmap(f"{prefix}.codes.npy", mode="w+", dtype=dtypes[encoding],
+                                      shape=(rows, dim))
+    params = {}
+    for start in range(0, images, chunk_images):
+        block = rng.normal(size=(min(chunk_images, images - start), dim)).astype(np.float32)
+        block /= np.linalg.norm(block, axis=1, keepdims=True)
+        if encoding == "int8":
+            if "scale" not in params:
+                # Random rows share one distribution, so the first block fits the scales
+                params["scale"] = (np.abs(block).max(axis=0) / 127.0).astype(np.float32)
+            block = np.clip(np.rint(block / params["scale"]), -127, 127)
+        block = block.astype(dtypes[encoding])
+        # Row r belongs to outfit r % images, so each outfit's rows are `images` apart
+        for offset in range(start, rows, images):
+            count = min(len(block), rows - offset)
+            codes[offset:offset + count] = block[:count]
+    codes.flush()
+    del codes
+
+    np.savez(f"{prefix}.index.npz", row_ids=np.arange(rows), **params)
+    save_items(prefix, _synthetic_items(np.arange(rows) % images, rng))
+    meta = {
+        "encoding": encoding,
+        "rows": rows,
+        "vectors": rows,
+        "dim": dim,
+        "code_dtype": np.dtype(dtypes[encoding]).name,
+        "code_shape": [rows, dim],
+    }
+    with open(f"{prefix}.json", "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _synthetic_items(image_ids, rng):
+    """
+    Item metadata of a synthetic catalog, one row per image id.
+    """
+    rows = len(image_ids)
+    return pd.DataFrame({
+        "Item Name": [f"{_COLORS[i % len(_COLORS)]} {_GARMENTS[i * 7 % len(_GARMENTS)]} {i}"
+                      for i in range(rows)],
+        "Price": np.round(rng.uniform(5, 500, size=rows), 2),
+        "Link": [f"https://shop.example.com/item/{i}" for i in range(rows)],
+        "Image URL": [f"https://images.example.com/outfit/{j}.jpg" for j in image_ids],
+    })
@@ -0,0 +1,94 @@
+"""
+Latency of filtered similarity search across predicate selectivities.
+
+Builds a synthetic catalog, then runs the same queries with price ranges
+that allow from every row down to a handful. Filtered search evaluates the
+range on the sorted price array and scores only the allowed rows (or masks
+a full scan when most rows are allowed); post-filtering searches the whole
+index with a growing k until enough allowed rows come back. Expect filtered
+latency to stay flat or fall as the filter narrows, and post-filtering to
+blow up.
+
+Usage:
+    python -m benchmarks.filtered_search --rows 200000 --backend int8
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.ann_recall import _synthetic_vectors
+from models.embedding_index import INDEX_BACKENDS
+from models.filters import CatalogFilter
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--backend", default="exact", choices=sorted(INDEX_BACKENDS))
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--selectivity", type=float, nargs="+", default=[1.0, 0.5, 0.1, 0.01, 0.001],
+                        help="Share of the catalog allowed by the price filter")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    vectors = _synthetic_vectors(rng, args.rows, args.dim, args.clusters)
+    dataset = pd.DataFrame({
+        "Item Name": [f"item {i}" for i in range(args.rows)],
+        "Price": np.round(rng.uniform(5, 500, size=args.rows), 2),
+        "Embedding": list(vectors),
+    })
+    index = INDEX_BACKENDS[args.backend].from_dataframe(dataset)
+    catalog_filter = CatalogFilter(dataset, index.row_ids)
+    prices = dataset["Price"].to_numpy()
+    queries = vectors[rng.choice(args.rows, args.queries)] + rng.normal(
+        scale=0.05, size=(args.queries, args.dim)).astype(np.float32)
+
+    for selectivity in args.selectivity:
+        max_price = float(np.quantile(prices, selectivity))
+
+        start = time.perf_counter()
+        masks = [catalog_filter.mask(max_price=max_price) for _ in queries]
+        mask_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        filtered = [index.search(query, k=args.k, allowed=mask) for query, mask in zip(queries, masks)]
+        filtered_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        start = time.perf_counter()
+        post = [_post_filter(index, query, args.k, prices, max_price) for query in queries]
+        post_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+        agree = np.mean([list(a[0]) == list(b[0]) for a, b in zip(filtered, post)])
+        print(json.dumps({
+            "backend": args.backend,
+            "selectivity": selectivity,
+            "allowed_rows": int(masks[0].sum()),
+            "mask_ms": round(mask_ms, 3),
+            "filtered_search_ms": round(filtered_ms, 2),
+            "post_filter_ms": round(post_ms, 2),
+            "same_results": round(float(agree), 3),
+        }))
+
+
+def _post_filter(index, query, k, prices, max_price):
+    """
+    Baseline: global top-k, doubling k until k rows pass the filter.
+    """
+    fetch = k
+    while True:
+        row_ids, scores = index.search(query, k=fetch)
+        passing = prices[row_ids] <= max_price
+        if passing.sum() >= k or fetch >= len(index):
+            return row_ids[passing][:k], scores[passing][:k]
+        fetch = min(len(index), fetch * 4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Latency, throughput and embedding drift of the encoder inference modes.
+
+For each mode, reports single-image latency, batched throughput, the cosine
+similarity of its embeddings to the fp32 ones, and top-1 retrieval agreement:
+perturbed copies of the catalog images are searched against an index of the
+fp32 catalog embeddings, and the mode's top match is compared to fp32's.
+
+Catalog images come from --image-dir (default: the example images, expanded
+with random crops and flips). The int8 mode is calibrated on them.
+
+Usage:
+    python -m benchmarks.inference_modes --weights resnet50.pth --threads 4 --batch-size 32
+"""
+
+import argparse
+import glob
+import json
+import os
+import random
+import time
+
+import numpy as np
+import torch
+from PIL import Image, ImageEnhance, ImageOps
+
+import config
+from models.embedding_index import EmbeddingIndex
+from models.image_processor import ImageProcessor
+from models.inference import INFERENCE_MODES, configure_threads
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--weights", default=config.ENCODER_WEIGHTS_PATH,
+                        help="Local ResNet50 state dict (default: the pretrained weights)")
+    parser.add_argument("--image-dir", help="Catalog images (default: examples/ with augmentations)")
+    parser.add_argument("--catalog-size", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None, help="Torch intra-op threads")
+    parser.add_argument("--modes", nargs="+", default=list(INFERENCE_MODES), choices=INFERENCE_MODES)
+    args = parser.parse_args()
+
+    configure_threads(args.threads)
+    rng = random.Random(0)
+    catalog = _catalog_images(args.image_dir, args.catalog_size, rng)
+    queries = [_perturb(image, rng) for image in catalog]
+
+    reference = None
+    for mode in ["fp32"] + [m for m in args.modes if m != "fp32"]:
+        processor = ImageProcessor(
+            image_size=config.IMAGE_SIZE,
+            embedding_head=config.EMBEDDING_HEAD,
+            weights_path=args.weights,
+            inference_mode=mode,
+            calibration_images=catalog if mode == "int8" else None
+        )
+        catalog_batch = torch.stack([processor.preprocess(image) for image in catalog])
+        query_batch = torch.stack([processor.preprocess(image) for image in queries])
+        processor.extract_features(catalog_batch[:2])  # Warm up
+
+        latency = _median(lambda: processor.extract_features(query_batch[:1]), args.repeats)
+        batch = catalog_batch[:args.batch_size]
+        throughput = len(batch) / _median(lambda: processor.extract_features(batch), args.repeats)
+
+        catalog_vectors = _embed(processor, catalog_batch, args.batch_size)
+        query_vectors = _embed(processor, query_batch, args.batch_size)
+        if reference is None:
+            index = EmbeddingIndex(catalog_vectors, np.arange(len(catalog_vectors)))
+            reference = (catalog_vectors, _top1(index, query_vectors))
+
+        cosine = _cosine(catalog_vectors, reference[0])
+        if mode in args.modes:
+            print(json.dumps({
+                "mode": mode,
+                "threads": torch.get_num_threads(),
+                "latency_ms": round(latency * 1000, 1),
+                "throughput_img_s": round(throughput, 1),
+                "batch_size": len(batch),
+                "cosine_mean": round(float(cosine.mean()), 5),
+                "cosine_min": round(float(cosine.min()), 5),
+                "top1_agreement": round(float(np.mean(_top1(index, query_vectors) == reference[1])), 4),
+            }))
+
+
+def _catalog_images(image_dir, count, rng):
+    if image_dir:
+        paths = sorted(glob.glob(os.path.join(image_dir, "*")))[:count]
+        return [Image.open(path).convert("RGB") for path in paths]
+    examples = [Image.open(path).convert("RGB") for path in sorted(glob.glob("examples/*.png"))]
+    images = list(examples)
+    while len(images) < count:
+        images.append(_random_crop(rng.choice(examples), rng, 0.5))
+    return images[:count]
+
+
+def _random_crop(image, rng, min_scale):
+    scale = rng.uniform(min_scale, 1.0)
+    width, height = int(image.width * scale), int(image.height * scale)
+    left = rng.randint(0, image.width - width)
+    top = rng.randint(0, image.height - height)
+    crop = image.crop((left, top, left + width, top + height))
+    return ImageOps.mirror(crop) if rng.random() < 0.5 else crop
+
+
+def _perturb(image, rng):
+    """A slightly different photo of the same outfit: small crop and brightness change."""
+    image = _random_crop(image, rng, 0.85)
+    return ImageEnhance.Brightness(image).enhance(rng.uniform(0.85, 1.15))
+
+
+def _embed(processor, batch, batch_size):
+    return np.vstack([processor.extract_features(batch[i:i + batch_size])
+                      for i in range(0, len(batch), batch_size)])
+
+
+def _top1(index, vectors):
+    return np.array([index.search(vector, k=1)[0][0] for vector in vectors])
+
+
+def _cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def _median(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings))
+
+
+if __name__ == "__main__":
+    main()
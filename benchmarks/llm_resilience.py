@@ -0,0 +1,75 @@
+"""
+Success rate and latency of the LLM client under injected failures.
+
+Sends concurrent fashion requests through LlamaVisionService to a fake model
+that fails a share of calls with a 503 and has long-tailed latency. Reports
+how many requests got an LLM answer versus the catalog fallback, the latency
+percentiles, how many model calls were made and the circuit breaker state.
+
+Usage:
+    python -m benchmarks.llm_resilience --requests 200 --failure-rate 0.3 --retries 2 --timeout 1.5
+"""
+
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.fakes import FakeChatModel
+from models.llm_service import LlamaVisionService
+from utils.helpers import build_basic_response
+
+ITEMS_DESCRIPTION = "- Navy blazer ($120.00): https://shop.example.com/item/1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.2)
+    parser.add_argument("--jitter", type=float, default=0.5)
+    parser.add_argument("--failure-rate", type=float, default=0.3)
+    parser.add_argument("--timeout", type=float, default=1.5)
+    parser.add_argument("--retries", type=int, default=2)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--breaker-failures", type=int, default=5)
+    args = parser.parse_args()
+
+    model = FakeChatModel(latency=args.llm_latency, jitter=args.jitter,
+                          failure_rate=args.failure_rate)
+    service = LlamaVisionService(
+        model_id="stub", project_id="stub", model=model,
+        timeout=args.timeout, max_retries=args.retries, backoff_seconds=0.05,
+        max_concurrency=args.max_concurrency, breaker_failures=args.breaker_failures,
+        breaker_reset_seconds=1.0
+    )
+    fallback = build_basic_response(ITEMS_DESCRIPTION, 0.9)
+
+    def one(_):
+        start = time.perf_counter()
+        response = service.generate_fashion_response("", None, None, 0.9,
+                                                     items_description=ITEMS_DESCRIPTION)
+        return time.perf_counter() - start, response == fallback
+
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(one, range(args.requests)))
+
+    latencies = np.array([r[0] for r in results])
+    fallbacks = sum(r[1] for r in results)
+    print(json.dumps({
+        "requests": args.requests,
+        "failure_rate": args.failure_rate,
+        "retries": args.retries,
+        "llm_answers": args.requests - fallbacks,
+        "fallbacks": fallbacks,
+        "model_calls": model.calls,
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 1),
+        "breaker_state": service.model.breaker.state,
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Build time and query latency of the offline alternatives search.
+
+Builds LocalSearchService over a synthetic catalog and times
+search_alternatives for a four-garment outfit, text-only and blended with
+visual similarity. Compare with benchmarks/search_fanout.py for the web search.
+
+Usage:
+    python -m benchmarks.local_alternatives --rows 100000 --queries 200
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from benchmarks.fakes import synthetic_catalog
+from models.embedding_index import build_index
+from services.local_search_service import LocalSearchService
+
+DESCRIPTIONS = [
+    {"item_name": "The shirt", "description": "a white t-shirt."},
+    {"item_name": "The jeans", "description": "slim-fit navy jeans with a faded wash."},
+    {"item_name": "The jacket", "description": "a black leather jacket."},
+    {"item_name": "The shoes", "description": "white sneakers with a rubber sole."},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    dataset = synthetic_catalog(args.rows)
+    index = build_index(dataset)
+
+    start = time.perf_counter()
+    service = LocalSearchService(dataset, index=index)
+    build_s = time.perf_counter() - start
+
+    rng = np.random.default_rng(0)
+    for mode in ("text", "text+visual"):
+        latencies = []
+        found = 0
+        for _ in range(args.queries):
+            vector = rng.normal(size=index.dim).astype(np.float32) if mode != "text" else None
+            start = time.perf_counter()
+            alternatives = service.search_alternatives(DESCRIPTIONS, query_vector=vector)
+            latencies.append(time.perf_counter() - start)
+            found += sum(len(items) for items in alternatives.values())
+        print(json.dumps({
+            "rows": args.rows,
+            "mode": mode,
+            "build_s": round(build_s, 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+            "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 2),
+            "results_per_item": round(found / (args.queries * len(DESCRIPTIONS)), 2),
+            "max_price": service.default_max_price,
+        }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Throughput and equivalence of the standard and fast preprocessing paths.
+
+Encodes JPEG bytes (the example images upscaled to phone-photo size) at
+batch sizes 1 and 32 with both paths. Reports preprocessing-only and
+end-to-end throughput. It also reports how close the fast path's embeddings
+are to the standard ones, both on the same decoded pixels and with JPEG
+draft decoding on top.
+
+Usage:
+    python -m benchmarks.preprocess_throughput --weights resnet50.pth --images 64
+"""
+
+import argparse
+import glob
+import json
+import time
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+import config
+from models.image_processor import ImageProcessor
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--weights", default=config.ENCODER_WEIGHTS_PATH,
+                        help="Local ResNet50 state dict (default: the pretrained weights)")
+    parser.add_argument("--images", type=int, default=64)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 32])
+    parser.add_argument("--photo-side", type=int, default=3000, help="Longest side of the test JPEGs")
+    args = parser.parse_args()
+
+    photos = _jpeg_photos(args.images, args.photo_side)
+    processors = {
+        fast: ImageProcessor(image_size=config.IMAGE_SIZE, embedding_head=config.EMBEDDING_HEAD,
+                             weights_path=args.weights, fast_preprocess=fast)
+        for fast in (False, True)
+    }
+
+    for batch_size in args.batch_sizes:
+        for fast, processor in processors.items():
+            processor.encode_images(photos[:2])  # Warm up
+            print(json.dumps({
+                "path": "fast" if fast else "standard",
+                "batch_size": batch_size,
+                "preprocess_img_s": round(_throughput(
+                    lambda batch: processor.preprocess_batch(
+                        [processor.load_image(photo) for photo in batch]), photos, batch_size), 1),
+                "end_to_end_img_s": round(_throughput(processor.encode_images, photos, batch_size), 1),
+            }))
+
+    # Same decoded pixels through both paths, then the fast path with JPEG drafting
+    decoded = [Image.open(BytesIO(photo)).convert("RGB") for photo in photos[:16]]
+    standard = processors[False].extract_features(processors[False].preprocess_batch(decoded))
+    folded = processors[True].extract_features(processors[True].preprocess_batch(decoded))
+    drafted = np.vstack([r["vector"] for r in processors[True].encode_images(photos[:16])])
+    print(json.dumps({
+        "same_pixels_cosine_min": round(float(_cosine(standard, folded).min()), 6),
+        "same_pixels_max_abs_diff": float(np.abs(standard - folded).max()),
+        "with_draft_cosine_min": round(float(_cosine(standard, drafted).min()), 6),
+    }))
+
+
+def _jpeg_photos(count, side):
+    photos = []
+    for path in sorted(glob.glob("examples/*.png")):
+        image = Image.open(path).convert("RGB")
+        scale = side / max(image.size)
+        image = image.resize((int(image.width * scale), int(image.height * scale)), Image.BICUBIC)
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        photos.append(buffer.getvalue())
+    return [photos[i % len(photos)] for i in range(count)]
+
+
+def _throughput(fn, inputs, batch_size):
+    start = time.perf_counter()
+    for offset in range(0, len(inputs), batch_size):
+        fn(inputs[offset:offset + batch_size])
+    return len(inputs) / (time.perf_counter() - start)
+
+
+def _cosine(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+if __name__ == "__main__":
+    main()
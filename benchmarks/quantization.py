@@ -0,0 +1,90 @@
+"""
+Measure the accuracy loss and speed of the quantized encodings against float32.
+
+Usage:
+    python -m benchmarks.quantization --rows 200000 --dim 1000
+    python -m benchmarks.quantization --dataset swift-style-embeddings.pkl
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.ann_recall import _synthetic_vectors
+from models.embedding_index import (
+    EmbeddingIndex, Float16Index, Int8Index, PQIndex, evaluate_recall
+)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--dataset", help="Pickled dataset to use instead of random vectors")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=1000)
+    parser.add_argument("--clusters", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--subspaces", type=int, nargs="+", default=[8, 25, 50],
+                        help="Product quantization subspace counts to try")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    if args.dataset:
+        exact = EmbeddingIndex.from_dataframe(pd.read_pickle(args.dataset))
+    else:
+        exact = EmbeddingIndex(_synthetic_vectors(rng, args.rows, args.dim, args.clusters),
+                               np.arange(args.rows))
+
+    picks = rng.choice(len(exact), args.queries)
+    queries = exact.matrix[picks] + rng.normal(scale=0.05, size=(args.queries, exact.dim))
+
+    candidates = [
+        ("float32", exact, exact.matrix.nbytes),
+        ("float16", Float16Index(exact.matrix, exact.row_ids), None),
+        ("int8", Int8Index(exact.matrix, exact.row_ids), None),
+    ]
+    for n_subspaces in args.subspaces:
+        if exact.dim % n_subspaces == 0:
+            start = time.perf_counter()
+            index = PQIndex(exact.matrix, exact.row_ids, n_subspaces=n_subspaces)
+            print(f"Trained pq{n_subspaces} in {time.perf_counter() - start:.1f}s")
+            candidates.append((f"pq{n_subspaces}", index, None))
+
+    for name, index, nbytes in candidates:
+        if nbytes is None:
+            nbytes = index.codes.nbytes
+        report = evaluate_recall(index, exact, queries, k=args.k)
+        report.update({
+            "encoding": name,
+            "bytes_per_vector": round(nbytes / len(index), 1),
+            "recall@1": _recall_at_1(index, exact, queries),
+            "mean_abs_score_error": _score_error(index, exact, queries),
+        })
+        print(json.dumps(report))
+
+
+def _recall_at_1(index, exact, queries):
+    agree = sum(
+        index.search(query, k=1)[0][0] == exact.search(query, k=1)[0][0] for query in queries
+    )
+    return agree / len(queries)
+
+
+def _score_error(index, exact, queries, k=10):
+    """
+    Mean absolute difference between approximate and exact top-k scores.
+    """
+    errors = []
+    for query in queries:
+        row_ids, scores = index.search(query, k=k)
+        normalized = exact.prepare_query(query)
+        positions = np.searchsorted(exact.row_ids, row_ids)
+        errors.append(np.abs(scores - exact.matrix[positions] @ normalized).mean())
+    return float(np.mean(errors))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Latency of region-level matching against whole-image matching.
+
+Times encode_image against encode_regions (whole image plus crops in one
+forward pass) for several region counts and both crop modes, and the
+per-region index search plus aggregation over a synthetic catalog.
+
+Usage:
+    python -m benchmarks.region_matching --rows 100000 --counts 2 3 4 6 --repeats 5
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+import config
+from benchmarks.fakes import synthetic_catalog
+from models.embedding_index import build_index
+from models.image_processor import ImageProcessor
+from models.regions import CROP_MODES, aggregate_region_matches, match_regions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--counts", type=int, nargs="+", default=[2, 3, 4, 6])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    processor = ImageProcessor(image_size=config.IMAGE_SIZE, embedding_head=config.EMBEDDING_HEAD)
+    image = Image.open("examples/test-1.png").convert("RGB")
+    index = build_index(synthetic_catalog(args.rows, dim=1000 if config.EMBEDDING_HEAD == "logits" else 2048))
+
+    processor.encode_image(image)  # Warm up
+    baseline = _median_ms(lambda: processor.encode_image(image), args.repeats)
+    print(json.dumps({"mode": "whole image", "regions": 0, "encode_ms": baseline}))
+
+    for mode in CROP_MODES:
+        for count in args.counts:
+            encoding = processor.encode_regions(image, mode=mode, count=count)
+            vectors = [region["vector"] for region in encoding["regions"]]
+            print(json.dumps({
+                "mode": mode,
+                "regions": count,
+                "encode_ms": _median_ms(lambda: processor.encode_regions(image, mode=mode, count=count),
+                                        args.repeats),
+                "search_ms": _median_ms(
+                    lambda: aggregate_region_matches(match_regions(vectors, index, k=8), per_region=2),
+                    args.repeats
+                ),
+                "boxes": [list(region["box"]) for region in encoding["regions"]],
+            }))
+
+
+def _median_ms(fn, repeats):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(float(np.median(timings)) * 1000, 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Latency of the alternatives search: sequential, parallel and cached.
+
+Runs SearchService.search_alternatives against a fake search backend with a
+fixed round-trip latency. Compares one worker without a cache (the old
+sequential behaviour) with the parallel pool, then repeats the request to
+show the cache. Reports wall time and the number of backend searches.
+
+Usage:
+    python -m benchmarks.search_fanout --latency 0.5 --workers 4
+"""
+
+import argparse
+import json
+import time
+
+from benchmarks.fakes import FakeSearchBackend
+from services.search_service import SearchService
+
+# Four garments, two of which normalize to the same query
+DESCRIPTIONS = [
+    {"item_name": "The shirt", "description": "a white t-shirt."},
+    {"item_name": "The undershirt", "description": "A White T-shirt"},
+    {"item_name": "The jeans", "description": "slim-fit blue denim jeans with a faded wash."},
+    {"item_name": "The shoes", "description": "white leather sneakers with a rubber sole."},
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    runs = [
+        ("sequential", SearchService(backend=FakeSearchBackend(latency=args.latency),
+                                     max_workers=1, cache_ttl=None)),
+        ("parallel", SearchService(backend=FakeSearchBackend(latency=args.latency),
+                                   max_workers=args.workers)),
+    ]
+    for name, service in runs:
+        for attempt in ("first", "repeat"):
+            start = time.perf_counter()
+            alternatives = service.search_alternatives(DESCRIPTIONS)
+            print(json.dumps({
+                "mode": name,
+                "request": attempt,
+                "wall_s": round(time.perf_counter() - start, 3),
+                "backend_searches": len(service.backend.queries),
+                "items_with_results": sum(1 for items in alternatives.values() if items),
+            }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Cold start time of the app, per phase, for each way of loading the encoder.
+
+Each configuration runs in a fresh interpreter and reports the time to
+import app.py, the time until the interface is built (what users wait for
+with BACKGROUND_STARTUP) and the per-phase startup timings until ready.
+The LLM is a local stub, so no network access is needed.
+
+Usage:
+    python -m benchmarks.startup_time --weights resnet50.pth --torchscript encoder.ts
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--weights", help="Local ResNet50 state dict for the eager encoder")
+    parser.add_argument("--torchscript", help="Encoder exported by scripts/export_encoder.py")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child(json.loads(args.child))
+        return
+
+    from benchmarks.fakes import synthetic_catalog
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path = os.path.join(tmp, "catalog.pkl")
+        synthetic_catalog(args.rows).to_pickle(dataset_path)
+
+        runs = [("eager", {"weights": args.weights})]
+        if args.torchscript:
+            runs.append(("torchscript", {"torchscript": args.torchscript}))
+        for name, options in runs:
+            options.update(dataset=dataset_path)
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.startup_time", "--child", json.dumps(options)],
+                capture_output=True, text=True, check=True
+            ).stdout
+            report = json.loads(output.strip().splitlines()[-1])
+            print(json.dumps({"encoder": name, **report}))
+
+
+def _child(options):
+    start = time.perf_counter()
+    import app
+    import config
+    imported = time.perf_counter() - start
+
+    from benchmarks.fakes import FakeChatModel
+    from models.llm_service import LlamaVisionService
+
+    config.ENCODER_WEIGHTS_PATH = options.get("weights")
+    config.ENCODER_TORCHSCRIPT_PATH = options.get("torchscript")
+    llm_service = LlamaVisionService(model_id="stub", project_id="stub", model=FakeChatModel())
+
+    style_finder = app.StyleFinderApp(options["dataset"], llm_service=llm_service, background=True)
+    app.create_gradio_interface(style_finder)
+    interface = time.perf_counter() - start
+    style_finder.wait_until_ready()
+
+    print(json.dumps({
+        "import_s": round(imported, 2),
+        "interface_s": round(interface, 2),
+        "ready_s": round(time.perf_counter() - start, 2),
+        "phases_s": {phase: round(seconds, 2) for phase, seconds in style_finder.startup_timings.items()},
+        "error": str(style_finder.startup_error) if style_finder.startup_error else None,
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Compare time to first rendered output of the streaming and blocking handlers.
+
+Runs StyleFinderApp against a local fake streaming model and checks that the
+final streamed rendering contains the item section, including when the model
+leaves it out, returns too little or breaks off mid-stream. It should match
+the blocking response except for too-short and interrupted responses: the
+blocking handler replaces those (the fake only interrupts streams), while the
+stream has already shown them and appends the basic response instead. The
+assertions live in tests/test_streaming.py.
+
+Usage:
+    python -m benchmarks.streaming_ttft --llm-latency 3.0 --first-chunk 0.3
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+from app import StyleFinderApp
+from benchmarks.fakes import FAKE_ANALYSIS, FakeChatModel, synthetic_catalog
+from models.llm_service import LlamaVisionService
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--llm-latency", type=float, default=3.0)
+    parser.add_argument("--first-chunk", type=float, default=0.3)
+    args = parser.parse_args()
+
+    model = FakeChatModel(latency=args.llm_latency, first_chunk_latency=args.first_chunk)
+    llm_service = LlamaVisionService(model_id="stub", project_id="stub", model=model)
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path = os.path.join(tmp, "catalog.pkl")
+        synthetic_catalog(2000).to_pickle(dataset_path)
+        app = StyleFinderApp(dataset_path, llm_service=llm_service)
+    app.response_cache = None  # Measure the model every time
+    image = Image.open("examples/test-1.png").convert("RGB")
+
+    # Full response, a response without the item section, a too-short one and
+    # one whose connection drops after a few chunks
+    cases = [("complete", FAKE_ANALYSIS, True, None), ("missing_items", FAKE_ANALYSIS, False, None),
+             ("short", "Hi.", False, None), ("interrupted", FAKE_ANALYSIS, True, 5)]
+    for name, response, echo_items, interrupt_after in cases:
+        model.response = response
+        model.echo_items = echo_items
+        model.interrupt_after = interrupt_after
+
+        start = time.perf_counter()
+        blocking = asyncio.run(app.process_image_async(image))
+        blocking_s = time.perf_counter() - start
+
+        first_s, streamed, updates = asyncio.run(_stream(app, image))
+        print(json.dumps({
+            "case": name,
+            "blocking_s": round(blocking_s, 3),
+            "stream_first_output_s": round(first_s, 3),
+            "stream_updates": updates,
+            "final_has_items": "## Item Details" in streamed or "## Similar Items" in streamed,
+            "final_matches_blocking": streamed == blocking,
+        }))
+
+
+async def _stream(app, image):
+    start = time.perf_counter()
+    first = None
+    last = None
+    updates = 0
+    async for rendered in app.process_image_stream(image):
+        if first is None:
+            first = time.perf_counter() - start
+        last = rendered
+        updates += 1
+    return first, last, updates
+
+
+if __name__ == "__main__":
+    main()
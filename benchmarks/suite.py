@@ -0,0 +1,381 @@
+"""
+Reproducible benchmark suite: per-stage and end-to-end latency over synthetic catalogs.
+
+For each catalog size a synthetic vector store is written and loaded into
+the app the way production loads it (memory-mapped). The example images are
+the queries; the LLM and SerpAPI are local fakes with configurable latency.
+Measured per catalog size:
+
+- encode: encoder latency at batch size 1 and throughput at --batch-size
+- search: nearest-neighbour search (find_closest_match)
+- lookup: item lookup for the matched outfit (get_all_items_for_image)
+- format: response post-processing (process_response, format_alternatives_response)
+- alternatives: online alternatives search against the fake SerpAPI
+- end_to_end: concurrent requests through process_image_async, plus the
+  per-stage percentiles the app records itself (utils/metrics.py)
+
+Every catalog is benchmarked --repeats times and each metric reported is
+the median over the runs. Results are written as JSON. Given a --baseline
+report from an earlier run, every latency that grew (or throughput that
+dropped) by more than --tolerance is listed and the exit status is 1.
+Stages that only time the fakes (the LLM and the search backend) are
+reported but not compared, and the baseline is scaled by how much slower
+the machine ran a fixed calibration workload this time.
+
+Usage:
+    python -m benchmarks.suite --rows 10000 100000 --output bench.json
+    python -m benchmarks.suite --rows 10000 100000 --baseline bench.json --tolerance 0.2
+    python -m benchmarks.suite --rows 10000000 --encoding int8 --quick
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import config
+from benchmarks.fakes import FakeChatModel, FakeSearchBackend, synthetic_vector_store
+from utils.helpers import (
+    build_basic_response, format_alternatives_response, format_items_description, get_all_items_for_image,
+    process_response
+)
+from utils.metrics import STAGE_SECONDS
+
+# Stages timed inside the fakes; they measure a sleep, not the code under test
+FAKE_STAGES = ("llm", "llm_first_chunk", "search")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000],
+                        help="Catalog sizes to benchmark")
+    parser.add_argument("--encoding", default="int8", choices=["float32", "float16", "int8"],
+                        help="Vector store encoding of the synthetic catalogs")
+    parser.add_argument("--weights", default=config.ENCODER_WEIGHTS_PATH,
+                        help="Local ResNet50 state dict (default: the pretrained weights)")
+    parser.add_argument("--requests", type=int, default=64, help="End-to-end requests per catalog")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--iterations", type=int, default=200, help="Samples per micro-benchmark")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--search-latency", type=float, default=0.2)
+    parser.add_argument("--quick", action="store_true", help="A tenth of the samples, for large catalogs")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="Runs per catalog; each metric reported is the median over the runs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--baseline", help="Earlier report to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Allowed slowdown relative to the baseline (0.2 = 20%%)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="Ignore latency changes smaller than this, which are mostly noise")
+    parser.add_argument("--min-delta-s", type=float, default=0.25,
+                        help="Same for the latencies reported in seconds, such as startup")
+    args = parser.parse_args()
+    if args.quick:
+        args.iterations = max(10, args.iterations // 10)
+        args.requests = max(8, args.requests // 10)
+
+    random.seed(args.seed)
+    np.random.seed(args.seed)
+    config.CACHE_ENABLED = False  # Every request does the full work
+    config.ENCODER_WEIGHTS_PATH = args.weights
+
+    from app import StyleFinderApp
+    from models.image_processor import ImageProcessor
+    from models.llm_service import LlamaVisionService
+    from services.search_service import SearchService
+
+    queries = [Image.open(path).convert("RGB") for path in sorted(glob.glob("examples/*.png"))]
+    processor = ImageProcessor(
+        image_size=config.IMAGE_SIZE,
+        norm_mean=config.NORMALIZATION_MEAN,
+        norm_std=config.NORMALIZATION_STD,
+        embedding_head=config.EMBEDDING_HEAD,
+        weights_path=args.weights,
+        inference_mode=config.ENCODER_INFERENCE_MODE,
+        fast_preprocess=config.FAST_PREPROCESSING
+    )
+    dim = len(processor.encode_image(queries[0])["vector"])
+
+    report = {"environment": _environment(), "settings": vars(args), "results": {}}
+    calibrations = []
+    for rows in args.rows:
+        print(f"Benchmarking a catalog of {rows} rows...", file=sys.stderr)
+        with tempfile.TemporaryDirectory() as tmp:
+            store = os.path.join(tmp, "catalog")
+            start = time.perf_counter()
+            synthetic_vector_store(store, rows, dim=dim, encoding=args.encoding, seed=args.seed)
+            build_seconds = time.perf_counter() - start
+
+            llm_service = LlamaVisionService(model_id="stub", project_id="stub",
+                                             model=FakeChatModel(latency=args.llm_latency))
+            start = time.perf_counter()
+            app = StyleFinderApp(store, image_processor=processor, llm_service=llm_service)
+            results = {"catalog": {"rows": rows, "build_s": round(build_seconds, 2),
+                                   "startup_s": round(time.perf_counter() - start, 2)}}
+
+            runs = []
+            for _ in range(args.repeats):
+                calibrations.append(_calibrate())
+                run = {"encode": _bench_encode(processor, queries, args)}
+                run["search"], match = _bench_search(app, processor, queries, args)
+                run["lookup"] = _bench_lookup(app, args)
+                run["format"] = _bench_format(match, args)
+                run["alternatives"] = _bench_alternatives(SearchService, match, args)
+                run["end_to_end"] = _bench_end_to_end(app, queries, args)
+                runs.append(run)
+            results.update(_median(runs))
+            report["results"][str(rows)] = results
+            print(json.dumps({"rows": rows, **{stage + "_p50_ms": values["p50_ms"] for stage, values
+                                               in results.items() if "p50_ms" in values}}),
+                  file=sys.stderr)
+
+    report["calibration_ms"] = round(float(np.median(calibrations)), 3)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance, args.min_delta_ms, args.min_delta_s)
+        for key, before, after, change in regressions:
+            print(f"REGRESSION {key}: {before} -> {after} ({change:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+def compare(baseline, report, tolerance, min_delta_ms=0.5, min_delta_s=0.25):
+    """
+    Find the metrics that got worse than the baseline by more than the tolerance.
+
+    Latencies (keys ending in _ms or _s) regress when they grow and
+    throughputs (keys ending in _per_s) when they drop. Metrics missing from
+    either report, such as a catalog size only one of them ran, and the
+    stages timed inside the fakes (FAKE_STAGES) are skipped. When both
+    reports carry a calibration time and the machine ran the fixed
+    calibration workload slower this time, the baseline is first scaled by
+    that slowdown.
+
+    Args:
+        baseline (dict): Earlier report
+        report (dict): Current report
+        tolerance (float): Allowed relative change
+        min_delta_ms (float): Smallest absolute change of a millisecond latency
+            that counts, so microsecond stages do not flag timer noise
+        min_delta_s (float): Same for latencies in seconds, so startup times
+            rounded to centiseconds do not flag a 0.01 s change
+
+    Returns:
+        list: (metric path, baseline value, current value, relative change
+            against the scaled baseline) tuples
+    """
+    before = _flatten(baseline.get("results", {}))
+    after = _flatten(report.get("results", {}))
+    # How much slower the machine ran this time; the baseline is scaled to match.
+    # Never scaled down, since the stages sleeping in the fakes do not speed up.
+    slowdown = 1.0
+    if baseline.get("calibration_ms") and report.get("calibration_ms"):
+        slowdown = max(1.0, report["calibration_ms"] / baseline["calibration_ms"])
+    regressions = []
+    for key in sorted(before.keys() & after.keys()):
+        old, new = before[key], after[key]
+        if not old or key.endswith("build_s") or _is_fake_stage(key):
+            continue
+        if key.endswith("_per_s"):
+            expected = old / slowdown
+            change = (new - expected) / expected
+            worse = change < -tolerance
+        elif key.endswith(("_ms", "_s")):
+            expected = old * slowdown
+            change = (new - expected) / expected
+            floor = min_delta_ms if key.endswith("_ms") else min_delta_s
+            worse = change > tolerance and new - expected > floor
+        else:
+            continue
+        if worse:
+            regressions.append((key, old, new, change))
+    return regressions
+
+
+def _is_fake_stage(key):
+    parts = key.split(".")
+    return "stages" in parts and parts[parts.index("stages") + 1] in FAKE_STAGES
+
+
+def _calibrate():
+    """
+    Time a fixed CPU workload, the yardstick for how fast the machine is right now.
+    """
+    rng = np.random.default_rng(0)
+    a = rng.random((256, 256), dtype=np.float32)
+    values = rng.random(100000)
+
+    def run(i):
+        a @ a
+        np.sort(values)
+        sum(j * j for j in range(50000))
+
+    return float(np.median(_timings(run, 50))) * 1000
+
+
+def _bench_encode(processor, queries, args):
+    single = _timings(lambda i: processor.encode_images([queries[i % len(queries)]]), args.iterations)
+    batch = [queries[i % len(queries)] for i in range(args.batch_size)]
+    repeats = max(3, args.iterations // args.batch_size)
+    batched = _timings(lambda i: processor.encode_images(batch), repeats)
+    return {
+        **_summary(single),
+        "batch_size": args.batch_size,
+        "batched_throughput_per_s": round(args.batch_size * len(batched) / sum(batched), 2),
+    }
+
+
+def _bench_search(app, processor, queries, args):
+    rng = np.random.default_rng(args.seed)
+    vectors = [result["vector"] for result in processor.encode_images(queries)]
+    # Jittered copies of the query embeddings, so the scans do not repeat exactly
+    probes = [vector + rng.normal(scale=0.05 * np.abs(vector).mean(), size=vector.shape)
+              for vector in vectors for _ in range(4)]
+    timings = _timings(lambda i: processor.find_closest_match(probes[i % len(probes)], app.data,
+                                                              index=app.index), args.iterations)
+    closest_row, score = processor.find_closest_match(vectors[0], app.data, index=app.index)
+    match = {"closest_row": closest_row, "similarity_score": score,
+             "items_description": format_items_description(
+                 get_all_items_for_image(closest_row["Image URL"], app.data, app.item_lookup))}
+    return _summary(timings), match
+
+
+def _bench_lookup(app, args):
+    urls = list(app.item_lookup)
+    rng = random.Random(args.seed)
+    picks = [rng.choice(urls) for _ in range(args.iterations)]
+    return _summary(_timings(lambda i: get_all_items_for_image(picks[i], app.data, app.item_lookup),
+                             args.iterations))
+
+
+def _bench_format(match, args):
+    bot_response = build_basic_response(match["items_description"], match["similarity_score"],
+                                        config.SIMILARITY_THRESHOLD)
+    alternatives = {f"item {i}": [{"title": f"Alternative {j}", "price": "$20.00",
+                                   "link": f"https://shop.example.com/{i}/{j}", "source": "Example"}
+                                  for j in range(config.DEFAULT_ALTERNATIVES_COUNT)]
+                    for i in range(4)}
+
+    def run(i):
+        response = process_response(bot_response)
+        format_alternatives_response(response, alternatives, match["similarity_score"],
+                                     config.SIMILARITY_THRESHOLD)
+
+    return _summary(_timings(run, args.iterations))
+
+
+def _bench_alternatives(search_service_cls, match, args):
+    service = search_service_cls(backend=FakeSearchBackend(latency=args.search_latency),
+                                 cache_ttl=None)
+    descriptions = [{"item_name": line, "description": line}
+                    for line in match["items_description"].splitlines()]
+    repeats = max(3, args.iterations // 20)
+    return _summary(_timings(lambda i: service.search_alternatives(descriptions), repeats))
+
+
+def _bench_end_to_end(app, queries, args):
+    STAGE_SECONDS.reset()
+    latencies = []
+
+    async def one(image, limit):
+        async with limit:
+            start = time.perf_counter()
+            await app.process_image_async(image)
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        limit = asyncio.Semaphore(args.concurrency)
+        await asyncio.gather(*(one(queries[i % len(queries)], limit) for i in range(args.requests)))
+
+    start = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for labels in STAGE_SECONDS.labels():
+        name = labels["stage"] + (f".{labels['handler']}" if "handler" in labels else "")
+        quantiles = STAGE_SECONDS.quantiles(**labels)
+        stages[name] = {f"p{round(q * 100)}_ms": round(value * 1000, 3) for q, value in quantiles.items()}
+    return {
+        **_summary(latencies),
+        "concurrency": args.concurrency,
+        "throughput_per_s": round(args.requests / elapsed, 2),
+        "stages": dict(sorted(stages.items())),
+    }
+
+
+def _timings(fn, iterations):
+    fn(0)  # Warm up
+    timings = []
+    for i in range(iterations):
+        start = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _summary(timings):
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+    return {
+        "samples": len(timings),
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "mean_ms": round(float(np.mean(timings)) * 1000, 3),
+    }
+
+
+def _median(runs):
+    """
+    Merge the results of repeated runs, taking the median of every number.
+    """
+    first = runs[0]
+    if isinstance(first, dict):
+        return {key: _median([run[key] for run in runs]) for key in first if all(key in run for run in runs)}
+    if isinstance(first, (int, float)) and not isinstance(first, bool):
+        return type(first)(round(float(np.median(runs)), 3))
+    return first
+
+
+def _flatten(results, prefix=""):
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def _environment():
+    import torch
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "numpy": np.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+End-to-end latency of the tiered response mode, per tier.
+
+Measures, for each request, the time until the catalog answer (tier 1) and
+until the final answer (LLM analysis or the deadline fallback, tier 2),
+against a stub LLM with long-tailed latency. Reports p50 and p99 per tier
+and how many requests hit the deadline.
+
+Usage:
+    python -m benchmarks.tiered_latency --requests 50 --llm-latency 2.0 --jitter 0.6 --deadline 4
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+import config
+from app import StyleFinderApp
+from benchmarks.fakes import FakeChatModel, synthetic_catalog
+from models.llm_service import LlamaVisionService
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--jitter", type=float, default=0.6)
+    parser.add_argument("--deadline", type=float, default=4.0)
+    parser.add_argument("--no-stream", action="store_true", help="Use the blocking LLM call")
+    args = parser.parse_args()
+
+    config.LLM_DEADLINE_SECONDS = args.deadline
+    config.STREAM_RESPONSES = not args.no_stream
+
+    model = FakeChatModel(latency=args.llm_latency, jitter=args.jitter)
+    llm_service = LlamaVisionService(model_id="stub", project_id="stub", model=model)
+    with tempfile.TemporaryDirectory() as tmp:
+        dataset_path = os.path.join(tmp, "catalog.pkl")
+        synthetic_catalog(10000).to_pickle(dataset_path)
+        app = StyleFinderApp(dataset_path, llm_service=llm_service)
+    app.response_cache = None  # Every request pays for the model
+    image = Image.open("examples/test-1.png").convert("RGB")
+
+    results = asyncio.run(_run(app, image, args.requests, args.concurrency))
+    first = np.array([r[0] for r in results])
+    final = np.array([r[1] for r in results])
+    print(json.dumps({
+        "requests": args.requests,
+        "deadline_s": args.deadline,
+        "streaming": config.STREAM_RESPONSES,
+        "tier1_p50_ms": round(float(np.percentile(first, 50)) * 1000, 1),
+        "tier1_p99_ms": round(float(np.percentile(first, 99)) * 1000, 1),
+        "final_p50_ms": round(float(np.percentile(final, 50)) * 1000, 1),
+        "final_p99_ms": round(float(np.percentile(final, 99)) * 1000, 1),
+        "deadline_misses": sum(r[2] for r in results),
+    }))
+
+
+async def _run(app, image, count, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            first = None
+            last = ""
+            async for rendered in app.process_image_tiered(image):
+                if first is None:
+                    first = time.perf_counter() - start
+                last = rendered
+            missed = last.endswith("_The detailed style analysis is unavailable right now._")
+            return first, time.perf_counter() - start, missed
+
+    return await asyncio.gather(*(one() for _ in range(count)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Request throughput of the multi-process serving mode by worker count.
+
+Writes a synthetic catalog as a memory-mapped vector store, then sends a
+fixed number of concurrent requests through pools of 1, 2, 4, ... worker
+processes. Each worker encodes the image on its own encoder and matches it
+against the shared store, with up to --worker-concurrency requests in flight.
+The LLM is a local stub with a realistic latency and caching is off, so
+every request does the full CPU work and then waits on the model. Expect
+throughput to grow with the worker count up to the number of physical
+cores; with a slow LLM, even one worker should keep --concurrency requests
+in flight rather than one at a time.
+
+Usage:
+    python -m benchmarks.worker_scaling --weights resnet50.pth --workers 1 2 4 --requests 64
+"""
+
+import argparse
+import asyncio
+import functools
+import glob
+import json
+import os
+import tempfile
+import time
+
+from PIL import Image
+
+import config
+from benchmarks.fakes import FakeChatModel, synthetic_catalog
+from models.vector_store import save_vector_store
+from services.worker_pool import WorkerPool
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--weights", default=config.ENCODER_WEIGHTS_PATH,
+                        help="Local ResNet50 state dict (default: the pretrained weights)")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=16, help="Requests in flight at once")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--worker-concurrency", type=int, default=config.WORKER_CONCURRENCY,
+                        help="Requests each worker handles at once")
+    args = parser.parse_args()
+
+    images = [Image.open(path).convert("RGB") for path in sorted(glob.glob("examples/*.png"))]
+    requests = [images[i % len(images)] for i in range(args.requests)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = os.path.join(tmp, "catalog")
+        save_vector_store(store, synthetic_catalog(args.rows))
+
+        baseline = None
+        for workers in args.workers:
+            pool = WorkerPool(
+                store, workers=workers, concurrency=args.worker_concurrency,
+                llm_factory=functools.partial(_fake_llm_service, args.llm_latency),
+                config_overrides={"ENCODER_WEIGHTS_PATH": args.weights, "CACHE_ENABLED": False}
+            )
+            try:
+                start = time.perf_counter()
+                pool.wait_until_ready(all_workers=True)
+                startup = time.perf_counter() - start
+                if pool.startup_error:
+                    raise RuntimeError(pool.startup_error)
+
+                asyncio.run(_serve(pool, requests[:workers * 2], args.concurrency))  # Warm up
+                start = time.perf_counter()
+                responses = asyncio.run(_serve(pool, requests, args.concurrency))
+                elapsed = time.perf_counter() - start
+                health = pool.health()
+            finally:
+                pool.close()
+
+            throughput = len(requests) / elapsed
+            baseline = baseline or throughput
+            print(json.dumps({
+                "workers": workers,
+                "startup_s": round(startup, 2),
+                "throughput_req_s": round(throughput, 2),
+                "speedup": round(throughput / baseline, 2),
+                "errors": sum(response.startswith("Error") for response in responses),
+                "handled_per_worker": [worker["handled"] for worker in health],
+            }))
+
+
+def _fake_llm_service(latency):
+    """Module-level, so worker processes can unpickle it as their LLM factory."""
+    from models.llm_service import LlamaVisionService
+    return LlamaVisionService(model_id="stub", project_id="stub", model=FakeChatModel(latency=latency))
+
+
+async def _serve(pool, requests, concurrency):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(image):
+        async with limit:
+            return await pool.process_image_async(image)
+
+    return await asyncio.gather(*(one(image) for image in requests))
+
+
+if __name__ == "__main__":
+    main()
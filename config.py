@@ -7,13 +7,109 @@ LLAMA_MODEL_ID = "meta-llama/llama-3-2-90b-vision-instruct"
 PROJECT_ID = "skills-network"  # Default project ID for lab environment
 REGION = "us-south"
 
+# Startup
+BACKGROUND_STARTUP = True  # Serve the UI at once and load the dataset and models in the background
+ENCODER_WEIGHTS_PATH = None  # Local ResNet50 state dict (.pth), so no weights are downloaded
+ENCODER_TORCHSCRIPT_PATH = None  # Frozen encoder written by scripts/export_encoder.py, loads fastest
+
+# Encoder CPU inference
+ENCODER_INFERENCE_MODE = "fp32"  # "fp32", "channels_last" or "int8" (static quantization, CPU only)
+ENCODER_CALIBRATION_DIR = None  # Catalog images calibrating the int8 mode
+ENCODER_CALIBRATION_IMAGES = 64  # Calibration images used from that directory
+ENCODER_THREADS = None  # Intra-op threads per encoder process, None keeps the torch default
+ENCODER_INTEROP_THREADS = None  # Inter-op threads per encoder process
+
 # Image processing settings
 IMAGE_SIZE = (224, 224)
 NORMALIZATION_MEAN = [0.485, 0.456, 0.406]
 NORMALIZATION_STD = [0.229, 0.224, 0.225]
 
+# Fast preprocessing: uint8 resize into a reused batch buffer, normalization folded
+# into the first convolution, and JPEGs decoded at reduced size
+FAST_PREPROCESSING = False
+
+# Image sent to the vision LLM (downscaled JPEG)
+LLM_IMAGE_MAX_SIDE = 1024  # Longest side in pixels
+LLM_IMAGE_QUALITY = 85  # JPEG quality
+
+# Embedding settings (must match how the dataset embeddings were built)
+EMBEDDING_HEAD = "logits"  # "pooled" (2048-d features) or "logits" (1000-class output)
+PCA_PROJECTION_PATH = None  # Optional .npz projection stored next to the dataset
+
+# Micro-batching of concurrent image encodings
+ENCODER_MICRO_BATCHING = False  # Coalesce concurrent requests into one forward pass
+ENCODER_MAX_BATCH_SIZE = 16  # Maximum images per forward pass
+ENCODER_MAX_WAIT_MS = 10  # Maximum time a request waits for its batch to fill
+
 # Default similarity threshold
 SIMILARITY_THRESHOLD = 0.8
 
+# Region-level matching: also match garment crops, so items can come from other outfits
+REGION_MATCHING = False
+REGION_CROP_MODE = "saliency"  # "saliency" (crops around the subject) or "grid"
+REGION_COUNT = 3  # Garment regions per image, encoded in the same batch as the whole image
+REGION_SEARCH_K = 8  # Index matches fetched per region
+REGION_ITEMS_PER_REGION = 2  # Extra items reported per region
+
+# Search filters offered in the UI: categorical columns with a filter each, besides the
+# price range. "Category" is inferred from item names when the catalog has no such column;
+# other columns are offered only when present.
+FILTER_COLUMNS = ("Category", "Brand")
+
+# Similarity index settings
+INDEX_BACKEND = "exact"  # "exact" (brute force) or "ivf" (approximate, for large catalogs)
+IVF_NLIST = None  # Number of IVF clusters, None picks about sqrt(catalog size)
+IVF_NPROBE = 8  # Number of IVF clusters scanned per query
+
+# Optional compact vector store (path prefix written by scripts/build_vector_store.py).
+# When set, it is loaded with memory mapping instead of swift-style-embeddings.pkl.
+VECTOR_STORE_PATH = None
+
+# Catalog updates without a restart (see models/index_manager.py)
+CATALOG_WATCH_DIR = None  # Directory polled for append, delete and full-catalog update files
+CATALOG_WATCH_INTERVAL_SECONDS = 5  # Interval between polls of the directory
+CATALOG_COMPACT_TOMBSTONE_FRACTION = 0.2  # Compact the index once this share of rows is deleted
+CATALOG_COMPACT_MAX_SEGMENTS = 8  # Compact the index once appends left more segments
+
+# LLM client resilience
+LLM_TIMEOUT_SECONDS = 30  # Deadline of a single LLM call from when it starts (for streams, of each chunk)
+LLM_MAX_RETRIES = 2  # Retries on timeouts, connection errors, 429 and 5xx responses
+LLM_BACKOFF_SECONDS = 0.5  # Base delay of the jittered exponential backoff
+LLM_MAX_CONCURRENCY = 8  # LLM calls in flight at once
+LLM_BREAKER_FAILURES = 5  # Consecutive failures before answering from the catalog only
+LLM_BREAKER_RESET_SECONDS = 30  # Seconds before trying the LLM again
+
+# Render the LLM response progressively as it streams in
+STREAM_RESPONSES = True
+
+# Show the catalog item list immediately and fill in the LLM analysis afterwards
+TIERED_RESPONSES = True
+LLM_DEADLINE_SECONDS = 30  # Give up on the LLM analysis after this long
+
+# Request concurrency
+GRADIO_CONCURRENCY_LIMIT = 8  # Requests the Gradio queue runs at the same time
+ENCODE_WORKERS = 2  # Threads encoding and matching images
+LLM_WORKERS = 8  # Threads waiting on LLM calls
+
+# Multi-process serving
+SERVING_WORKERS = 0  # Worker processes serving requests, 0 serves from the Gradio process
+WORKER_HEARTBEAT_SECONDS = 1.0  # Interval of the worker health heartbeats
+WORKER_HEALTH_TIMEOUT_SECONDS = 30  # Restart a worker after this long without a heartbeat
+WORKER_CONCURRENCY = 8  # Requests each worker process handles at once (most of them wait on the LLM)
+WORKER_REQUEST_TIMEOUT_SECONDS = 120  # Give up on a request after this long, including its wait for a worker
+
+# Metrics and profiling
+METRICS_PORT = None  # Serve Prometheus metrics at http://127.0.0.1:PORT/metrics (worker i: PORT + 1 + i), e.g. 9464; None disables it
+PROFILE_SAMPLE_RATE = 0.0  # Share of requests profiled with the sampling profiler
+PROFILE_INTERVAL_MS = 5  # Interval between profiler stack samples
+PROFILE_DIR = "profiles"  # Collapsed-stack files of profiled requests, for flame graph tools
+
+# Response caching
+CACHE_ENABLED = True
+CACHE_TTL_SECONDS = 3600  # Seconds a cached embedding or response stays valid
+CACHE_MAX_ENTRIES = 1024  # Entries per cache level before LRU eviction
+CACHE_DIR = None  # Directory for the on-disk cache backend, None keeps caches in memory
+PROMPT_VERSION = "1"  # Bump when the prompts change to invalidate cached responses
+
 # Number of alternatives to return from search
 DEFAULT_ALTERNATIVES_COUNT = 5
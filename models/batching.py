@@ -0,0 +1,117 @@
+"""
+Request coalescing for batched model inference.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into small batches for a batch function.
+
+    Callers submit single items from any thread. A background worker waits
+    for up to ``max_wait_ms`` after the first pending item (or until
+    ``max_batch_size`` items are queued) and then calls ``batch_fn`` once for
+    the whole group.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=10):
+        """
+        Initialize the batcher and start its worker thread.
+
+        Args:
+            batch_fn: Callable taking a list of items and returning a list of
+                results in the same order
+            max_batch_size (int): Maximum number of items per batch
+            max_wait_ms (float): Maximum time to wait for a batch to fill up
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._closed = False
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """
+        Queue an item for the next batch.
+
+        Args:
+            item: Input accepted by batch_fn
+
+        Returns:
+            Future: Resolves to the result for this item
+        """
+        if self._closed:
+            raise RuntimeError("MicroBatcher is closed")
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item, timeout=None):
+        """
+        Submit an item and block until its result is available.
+        """
+        return self.submit(item).result(timeout=timeout)
+
+    def queue_depth(self):
+        """
+        Returns:
+            int: Items waiting for the next batch (approximate)
+        """
+        return self._queue.qsize()
+
+    def close(self):
+        """
+        Stop the worker thread after the pending items have been processed.
+        """
+        if not self._closed:
+            self._closed = True
+            self._queue.put(None)
+            self._worker.join()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch = [first]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    entry = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if entry is None:
+                    stop = True
+                    break
+                batch.append(entry)
+
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch):
+        items = [item for item, _ in batch]
+        futures = [future for _, future in batch]
+        try:
+            results = self.batch_fn(items)
+            if len(results) != len(items):
+                raise RuntimeError(
+                    f"Batch function returned {len(results)} results for {len(items)} items"
+                )
+        except Exception as e:
+            for future in futures:
+                future.set_exception(e)
+            return
+
+        for future, result in zip(futures, results):
+            future.set_result(result)
@@ -0,0 +1,813 @@
+"""
+Module for the in-memory embedding indexes used for similarity matching.
+"""
+
+import copy
+import time
+
+import numpy as np
+
+# Filtered searches allowing at most this share of the rows score only those
+# rows; above it, a full scan with the other rows masked out costs the same
+SPARSE_FILTER_FRACTION = 0.1
+
+class EmbeddingIndex:
+    """
+    Exact (brute force) cosine similarity index.
+
+    Holds the catalog embeddings as a contiguous, L2-normalized float32 matrix.
+
+    Every matrix row keeps the positional row id of the DataFrame row it came
+    from, so results can always be mapped back with ``dataset.iloc[row_id]``
+    even when some rows have no embedding.
+    """
+
+    def __init__(self, matrix, row_ids):
+        """
+        Initialize the index from a matrix of embeddings.
+
+        Args:
+            matrix: Array of shape (n, dim) with one embedding per row
+            row_ids: Positional DataFrame row ids, one per matrix row
+        """
+        matrix = np.array(matrix, dtype=np.float32, order="C")
+        row_ids = np.asarray(row_ids, dtype=np.int64)
+        if matrix.ndim != 2:
+            raise ValueError("Embedding matrix must be two-dimensional")
+        if len(row_ids) != matrix.shape[0]:
+            raise ValueError("Row ids must match the number of embeddings")
+
+        self.matrix = _normalize_rows(matrix)
+        self.row_ids = row_ids
+
+    @classmethod
+    def from_dataframe(cls, dataset, column="Embedding", **kwargs):
+        """
+        Build an index from a DataFrame column holding one vector per row.
+
+        Args:
+            dataset (DataFrame): Dataset containing precomputed feature vectors
+            column (str): Name of the column holding the embeddings
+            **kwargs: Backend-specific options passed to the constructor
+
+        Returns:
+            EmbeddingIndex: Index over every row that has an embedding
+        """
+        embeddings = dataset[column].values
+        row_ids = np.flatnonzero(dataset[column].notna().values)
+        if len(row_ids) == 0:
+            raise ValueError("The dataset does not contain any embeddings")
+
+        matrix = np.vstack([np.ravel(embeddings[i]) for i in row_ids])
+        return cls(matrix, row_ids, **kwargs)
+
+    @classmethod
+    def from_normalized(cls, matrix, row_ids):
+        """
+        Wrap an already normalized matrix without copying it.
+
+        Args:
+            matrix: L2-normalized float32 array of shape (n, dim), e.g. a memory map
+            row_ids: Positional DataFrame row ids, one per matrix row
+
+        Returns:
+            EmbeddingIndex: Index sharing the given matrix
+        """
+        index = cls.__new__(cls)
+        index.matrix = matrix
+        index.row_ids = np.asarray(row_ids, dtype=np.int64)
+        return index
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    @property
+    def dim(self):
+        """int: Dimensionality of the indexed vectors."""
+        return self.matrix.shape[1]
+
+    def prepare_query(self, vector):
+        """
+        Convert a query vector into a normalized float32 vector.
+
+        Args:
+            vector: Query feature vector
+
+        Returns:
+            ndarray: Normalized query of shape (dim,)
+        """
+        query = np.asarray(vector, dtype=np.float32).ravel()
+        if query.shape[0] != self.dim:
+            raise ValueError(
+                f"Query has {query.shape[0]} dimensions, index expects {self.dim}"
+            )
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def search(self, vector, k=1, min_score=None, allowed=None):
+        """
+        Find the k most similar catalog rows by cosine similarity.
+
+        Args:
+            vector: Query feature vector
+            k (int): Number of matches to return
+            min_score (float, optional): Drop matches scoring below this value
+            allowed (ndarray, optional): Boolean mask over the index positions,
+                e.g. from CatalogFilter.mask(); only these rows can match
+
+        Returns:
+            tuple: (row ids, similarity scores), both sorted by descending score
+        """
+        query = self.prepare_query(vector)
+        if allowed is None:
+            positions, scores = self._search(query, k)
+        else:
+            positions, scores = self._search_filtered(query, k, allowed)
+        if min_score is not None:
+            keep = scores >= min_score
+            positions, scores = positions[keep], scores[keep]
+        return self.row_ids[positions], scores
+
+    def _search(self, query, k):
+        """
+        Score every indexed vector against a normalized query.
+
+        Returns:
+            tuple: (matrix positions, scores) of the top k, best first
+        """
+        scores = self.matrix @ query
+        positions = _top_k(scores, k)
+        return positions, scores[positions]
+
+    def _search_filtered(self, query, k, allowed):
+        """
+        Search only the allowed positions, picking the cheaper strategy.
+
+        A selective filter scores just the allowed rows; a broad one scans
+        everything and masks the scores. Either way the cost stays at or
+        below an unfiltered search.
+        """
+        candidates = np.flatnonzero(allowed)
+        if len(candidates) <= SPARSE_FILTER_FRACTION * len(self):
+            scores = self._score_positions(query, candidates)
+            best = _top_k(scores, k)
+            return candidates[best], scores[best]
+        return self._search_masked(query, k, allowed)
+
+    def _score_positions(self, query, positions, chunk_size=65536):
+        """
+        Score the given positions only.
+        """
+        scores = np.empty(len(positions), dtype=np.float32)
+        for start in range(0, len(positions), chunk_size):
+            chunk = positions[start:start + chunk_size]
+            scores[start:start + len(chunk)] = self.matrix[chunk] @ query
+        return scores
+
+    def _search_masked(self, query, k, allowed):
+        """
+        Full scan with the disallowed rows scored -inf.
+        """
+        scores = self.matrix @ query
+        scores[~allowed] = -np.inf
+        return _finite_top_k(scores, k)
+
+    def reconstruct(self, positions):
+        """
+        Return the stored vectors at some positions as normalized float32 rows.
+        """
+        return np.asarray(self.matrix[positions], dtype=np.float32)
+
+    def subset(self, positions, row_ids):
+        """
+        Copy some positions into a new index of the same kind, e.g. to drop deleted rows.
+
+        Args:
+            positions: Sorted index positions to keep
+            row_ids: New positional DataFrame row id of each kept position
+
+        Returns:
+            EmbeddingIndex: Index over the kept rows only
+        """
+        return type(self).from_normalized(np.ascontiguousarray(self.matrix[positions]), row_ids)
+
+    def extend(self, matrix, row_ids):
+        """
+        Return a new index holding these rows plus the given ones.
+
+        Args:
+            matrix: Array of shape (n, dim) with the added embeddings
+            row_ids: Positional DataFrame row ids of the added rows
+
+        Returns:
+            EmbeddingIndex: The combined index; this one is left unchanged
+        """
+        added = _normalize_rows(np.array(matrix, dtype=np.float32, order="C"))
+        return type(self).from_normalized(
+            np.concatenate([self.matrix, added]), np.concatenate([self.row_ids, row_ids])
+        )
+
+
+class IVFFlatIndex(EmbeddingIndex):
+    """
+    Approximate cosine similarity index using an inverted file (IVF-flat).
+
+    The catalog is clustered with spherical k-means and the rows are stored
+    grouped by cluster, so a query only scans the ``nprobe`` clusters whose
+    centroids are closest to it instead of the whole matrix.
+    """
+
+    def __init__(self, matrix, row_ids, nlist=None, nprobe=8,
+                 train_size=50000, n_iter=10, seed=0):
+        """
+        Initialize the index and train the coarse quantizer.
+
+        Args:
+            matrix: Array of shape (n, dim) with one embedding per row
+            row_ids: Positional DataFrame row ids, one per matrix row
+            nlist (int, optional): Number of clusters, defaults to about sqrt(n)
+            nprobe (int): Number of clusters scanned per query
+            train_size (int): Maximum number of rows used to train the clusters
+            n_iter (int): Number of k-means iterations
+            seed (int): Random seed for the k-means initialization
+        """
+        super().__init__(matrix, row_ids)
+
+        n_rows = len(self)
+        if nlist is None:
+            nlist = int(np.sqrt(n_rows))
+        nlist = max(1, min(nlist, n_rows))
+        self.nprobe = max(1, min(nprobe, nlist))
+
+        rng = np.random.default_rng(seed)
+        if n_rows > train_size:
+            sample = self.matrix[rng.choice(n_rows, train_size, replace=False)]
+        else:
+            sample = self.matrix
+        self.centroids = _kmeans(sample, nlist, n_iter, rng)
+
+        # Store rows contiguously per cluster so each probe is one slice
+        assignments = _assign(self.matrix, self.centroids)
+        order = np.argsort(assignments, kind="stable")
+        self.matrix = np.ascontiguousarray(self.matrix[order])
+        self.row_ids = self.row_ids[order]
+        counts = np.bincount(assignments, minlength=len(self.centroids))
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    @property
+    def nlist(self):
+        """int: Number of inverted lists."""
+        return len(self.centroids)
+
+    def _search(self, query, k):
+        probes = _top_k(self.centroids @ query, self.nprobe)
+        positions = np.concatenate([
+            np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes
+        ])
+        if len(positions) == 0:
+            return positions, np.empty(0, dtype=np.float32)
+
+        scores = self.matrix[positions] @ query
+        best = _top_k(scores, k)
+        return positions[best], scores[best]
+
+    def _search_masked(self, query, k, allowed):
+        probes = _top_k(self.centroids @ query, self.nprobe)
+        positions = np.concatenate([
+            np.arange(self.offsets[p], self.offsets[p + 1]) for p in probes
+        ])
+        positions = positions[allowed[positions]]
+        if len(positions) < k:
+            # The probed clusters hold too few allowed rows: fall back to all of them
+            candidates = np.flatnonzero(allowed)
+            scores = self._score_positions(query, candidates)
+            best = _top_k(scores, k)
+            return candidates[best], scores[best]
+
+        scores = self.matrix[positions] @ query
+        best = _top_k(scores, k)
+        return positions[best], scores[best]
+
+    def subset(self, positions, row_ids):
+        # Kept rows stay in their clusters, so the centroids are reused as they are
+        clusters = np.searchsorted(self.offsets, positions, side="right") - 1
+        return self._with_rows(self.matrix[positions], row_ids, clusters)
+
+    def extend(self, matrix, row_ids):
+        # Added rows join their nearest existing cluster; the centroids are not retrained
+        added = _normalize_rows(np.array(matrix, dtype=np.float32, order="C"))
+        clusters = np.concatenate([
+            np.repeat(np.arange(self.nlist), np.diff(self.offsets)), _assign(added, self.centroids)
+        ])
+        return self._with_rows(np.concatenate([self.matrix, added]),
+                               np.concatenate([self.row_ids, row_ids]), clusters)
+
+    def _with_rows(self, matrix, row_ids, clusters):
+        """
+        Copy of this index over other rows, given the cluster of each row.
+        """
+        order = np.argsort(clusters, kind="stable")
+        index = copy.copy(self)
+        index.matrix = np.ascontiguousarray(matrix[order])
+        index.row_ids = np.asarray(row_ids, dtype=np.int64)[order]
+        index.offsets = np.concatenate([[0], np.cumsum(np.bincount(clusters, minlength=self.nlist))])
+        return index
+
+
+class QuantizedIndex(EmbeddingIndex):
+    """
+    Base class for exact-scan indexes that score against compressed vectors.
+
+    The compressed rows live in ``self.codes``, which may be a read-only
+    memory map shared between processes. Queries are scored one block of
+    rows at a time so the float32 working set stays small.
+    """
+
+    # Names of the fitted arrays needed to decode the codes
+    param_names = ()
+
+    def __init__(self, matrix, row_ids, chunk_size=1024, **kwargs):
+        """
+        Initialize the index by quantizing a float matrix.
+
+        Args:
+            matrix: Array of shape (n, dim) with one embedding per row
+            row_ids: Positional DataFrame row ids, one per matrix row
+            chunk_size (int): Rows scored per block, small enough to stay in cache
+            **kwargs: Encoding-specific options
+        """
+        super().__init__(matrix, row_ids)
+        self.chunk_size = chunk_size
+        self._dim = self.matrix.shape[1]
+        self.codes = self._fit(self.matrix, **kwargs)
+        del self.matrix
+
+    @classmethod
+    def from_codes(cls, codes, row_ids, dim, chunk_size=1024, **params):
+        """
+        Wrap already quantized codes, for example a memory-mapped file.
+
+        Args:
+            codes: Compressed rows as produced by the encoding
+            row_ids: Positional DataFrame row ids, one per row
+            dim (int): Dimensionality of the original vectors
+            chunk_size (int): Rows scored per block, small enough to stay in cache
+            **params: Fitted arrays named in param_names
+
+        Returns:
+            QuantizedIndex: Index scoring directly against the codes
+        """
+        index = cls.__new__(cls)
+        index.codes = codes
+        index.row_ids = np.asarray(row_ids, dtype=np.int64)
+        index.chunk_size = chunk_size
+        index._dim = int(dim)
+        for name in cls.param_names:
+            setattr(index, name, np.asarray(params[name], dtype=np.float32))
+        return index
+
+    def __len__(self):
+        return self.codes.shape[0]
+
+    @property
+    def dim(self):
+        """int: Dimensionality of the indexed vectors."""
+        return self._dim
+
+    @property
+    def params(self):
+        """dict: Fitted arrays needed to rebuild the index with from_codes()."""
+        return {name: getattr(self, name) for name in self.param_names}
+
+    def _search(self, query, k):
+        state = self._prepare(query)
+        scores = np.empty(len(self), dtype=np.float32)
+        for start in range(0, len(self), self.chunk_size):
+            block = self.codes[start:start + self.chunk_size]
+            scores[start:start + len(block)] = self._score_block(block, state)
+        positions = _top_k(scores, k)
+        return positions, scores[positions]
+
+    def _score_positions(self, query, positions):
+        state = self._prepare(query)
+        scores = np.empty(len(positions), dtype=np.float32)
+        for start in range(0, len(positions), self.chunk_size):
+            chunk = positions[start:start + self.chunk_size]
+            scores[start:start + len(chunk)] = self._score_block(self.codes[chunk], state)
+        return scores
+
+    def _search_masked(self, query, k, allowed):
+        state = self._prepare(query)
+        scores = np.full(len(self), -np.inf, dtype=np.float32)
+        for start in range(0, len(self), self.chunk_size):
+            keep = allowed[start:start + self.chunk_size]
+            if keep.any():  # Blocks without allowed rows are never read
+                block = self.codes[start:start + self.chunk_size]
+                scores[start:start + len(block)] = np.where(keep, self._score_block(block, state), -np.inf)
+        return _finite_top_k(scores, k)
+
+    def reconstruct(self, positions):
+        return self._decode(np.asarray(self.codes[positions]))
+
+    def subset(self, positions, row_ids):
+        return type(self).from_codes(np.ascontiguousarray(self.codes[positions]), row_ids,
+                                     self.dim, self.chunk_size, **self.params)
+
+    def extend(self, matrix, row_ids):
+        # Added rows are encoded with the fitted params, which are not refitted
+        added = _normalize_rows(np.array(matrix, dtype=np.float32, order="C"))
+        return type(self).from_codes(np.concatenate([self.codes, self._encode(added)]),
+                                     np.concatenate([self.row_ids, row_ids]),
+                                     self.dim, self.chunk_size, **self.params)
+
+    def _fit(self, matrix, **kwargs):
+        """
+        Quantize normalized rows, setting any fitted params on self.
+
+        Returns:
+            ndarray: The codes
+        """
+        raise NotImplementedError
+
+    def _encode(self, matrix):
+        """
+        Quantize normalized rows with the already fitted params.
+        """
+        raise NotImplementedError
+
+    def _decode(self, codes):
+        """
+        Approximate the normalized float32 rows behind some codes.
+        """
+        raise NotImplementedError
+
+    def _prepare(self, query):
+        """
+        Precompute whatever the block scoring needs from a normalized query.
+        """
+        return query
+
+    def _score_block(self, block, state):
+        """
+        Score a block of codes against the prepared query.
+        """
+        raise NotImplementedError
+
+
+class Float16Index(QuantizedIndex):
+    """
+    Stores the normalized embeddings in half precision (2 bytes per value).
+
+    NumPy has no half precision matrix product, so each block is converted to
+    float32 before scoring, which makes searches several times slower than
+    with EmbeddingIndex or Int8Index.
+    """
+
+    def _fit(self, matrix):
+        return self._encode(matrix)
+
+    def _encode(self, matrix):
+        return matrix.astype(np.float16)
+
+    def _decode(self, codes):
+        return codes.astype(np.float32)
+
+    def _score_block(self, block, query):
+        return block.astype(np.float32) @ query
+
+
+class Int8Index(QuantizedIndex):
+    """
+    Stores the normalized embeddings as int8 with one scale per dimension.
+
+    The scales are folded into the query, so each block is scored with a
+    single product against the raw codes.
+    """
+
+    param_names = ("scale",)
+
+    def _fit(self, matrix):
+        scale = np.abs(matrix).max(axis=0) / 127.0
+        scale[scale == 0] = 1.0
+        self.scale = scale.astype(np.float32)
+        return self._encode(matrix)
+
+    def _encode(self, matrix):
+        return np.clip(np.rint(matrix / self.scale), -127, 127).astype(np.int8)
+
+    def _decode(self, codes):
+        return codes.astype(np.float32) * self.scale
+
+    def _prepare(self, query):
+        return query * self.scale
+
+    def _score_block(self, block, query):
+        return block.astype(np.float32) @ query
+
+
+class PQIndex(QuantizedIndex):
+    """
+    Product quantization: every vector is split into subspaces and each part
+    is replaced by the id of its nearest centroid (one byte per subspace).
+
+    Scoring uses asymmetric distance computation: the query's dot product
+    with every centroid is tabulated once, and a row's score is the sum of
+    its table entries.
+    """
+
+    param_names = ("codebooks",)
+
+    def _fit(self, matrix, n_subspaces=8, n_centroids=256, train_size=50000,
+             n_iter=15, seed=0):
+        n_rows, dim = matrix.shape
+        if dim % n_subspaces:
+            raise ValueError(
+                f"Dimension {dim} is not divisible into {n_subspaces} subspaces"
+            )
+        n_centroids = min(n_centroids, 256, n_rows)
+        sub_dim = dim // n_subspaces
+
+        rng = np.random.default_rng(seed)
+        if n_rows > train_size:
+            sample = matrix[rng.choice(n_rows, train_size, replace=False)]
+        else:
+            sample = matrix
+
+        codebooks = np.empty((n_subspaces, n_centroids, sub_dim), dtype=np.float32)
+        for j in range(n_subspaces):
+            part = slice(j * sub_dim, (j + 1) * sub_dim)
+            codebooks[j] = _kmeans(np.ascontiguousarray(sample[:, part]), n_centroids,
+                                   n_iter, rng, spherical=False)
+
+        self.codebooks = codebooks
+        return self._encode(matrix)
+
+    def _encode(self, matrix):
+        n_subspaces, _, sub_dim = self.codebooks.shape
+        codes = np.empty((matrix.shape[0], n_subspaces), dtype=np.uint8)
+        for j in range(n_subspaces):
+            part = slice(j * sub_dim, (j + 1) * sub_dim)
+            codes[:, j] = _assign(np.ascontiguousarray(matrix[:, part]), self.codebooks[j],
+                                  spherical=False)
+        return codes
+
+    def _decode(self, codes):
+        n_subspaces = self.codebooks.shape[0]
+        return np.concatenate(
+            [self.codebooks[j][codes[:, j]] for j in range(n_subspaces)], axis=1
+        ).astype(np.float32)
+
+    def _prepare(self, query):
+        n_subspaces, _, sub_dim = self.codebooks.shape
+        return np.einsum("mkd,md->mk", self.codebooks, query.reshape(n_subspaces, sub_dim))
+
+    def _score_block(self, block, tables):
+        return tables[np.arange(tables.shape[0]), block].sum(axis=1)
+
+
+class SegmentedIndex:
+    """
+    Several indexes searched as one, with deleted rows masked out.
+
+    Used for catalogs updated at runtime: the first segment is the full
+    index and each appended delta adds a small segment, so an update never
+    rebuilds or copies the existing vectors. Deleted rows stay stored but are
+    tombstoned until compact() rewrites everything into one index.
+
+    Instances are never modified; updates create a new SegmentedIndex that
+    shares the untouched segments.
+    """
+
+    def __init__(self, segments, tombstones=None):
+        """
+        Args:
+            segments (list): Indexes whose row ids already point into the
+                combined dataset
+            tombstones (ndarray, optional): Boolean mask over the combined
+                positions marking deleted rows
+        """
+        self.segments = list(segments)
+        self.offsets = np.concatenate([[0], np.cumsum([len(segment) for segment in self.segments])])
+        self.row_ids = np.concatenate([segment.row_ids for segment in self.segments])
+        self.tombstones = tombstones
+        self._live = None if tombstones is None or not tombstones.any() else ~tombstones
+
+    def __len__(self):
+        return int(self.offsets[-1])
+
+    @property
+    def dim(self):
+        """int: Dimensionality of the indexed vectors."""
+        return self.segments[0].dim
+
+    @property
+    def deleted(self):
+        """int: Number of tombstoned rows."""
+        return 0 if self._live is None else int(len(self) - self._live.sum())
+
+    def search(self, vector, k=1, min_score=None, allowed=None):
+        """
+        Search every segment and merge the results, see EmbeddingIndex.search.
+        """
+        if self._live is not None:
+            allowed = self._live if allowed is None else allowed & self._live
+        if len(self.segments) == 1:
+            return self.segments[0].search(vector, k=k, min_score=min_score, allowed=allowed)
+
+        row_ids, scores = [], []
+        for segment, start in zip(self.segments, self.offsets):
+            mask = None if allowed is None else allowed[start:start + len(segment)]
+            if mask is not None and not mask.any():
+                continue
+            segment_rows, segment_scores = segment.search(vector, k=k, min_score=min_score, allowed=mask)
+            row_ids.append(segment_rows)
+            scores.append(segment_scores)
+        if not row_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        row_ids, scores = np.concatenate(row_ids), np.concatenate(scores)
+        best = _top_k(scores, k)
+        return row_ids[best], scores[best]
+
+    def append(self, segment):
+        """
+        Returns:
+            SegmentedIndex: This index plus one more segment
+        """
+        tombstones = None
+        if self.tombstones is not None:
+            tombstones = np.concatenate([self.tombstones, np.zeros(len(segment), dtype=bool)])
+        return SegmentedIndex(self.segments + [segment], tombstones)
+
+    def delete(self, tombstones):
+        """
+        Returns:
+            SegmentedIndex: This index with another tombstone mask
+        """
+        return SegmentedIndex(self.segments, tombstones)
+
+    def compact(self, row_map):
+        """
+        Rewrite the live rows of every segment into one index of the first segment's kind.
+
+        Args:
+            row_map (ndarray): New positional row id for every old one, -1 for deleted rows
+
+        Returns:
+            SegmentedIndex: A single-segment index without tombstones
+        """
+        merged = None
+        for segment in self.segments:
+            positions = np.flatnonzero(row_map[segment.row_ids] >= 0)
+            row_ids = row_map[segment.row_ids[positions]]
+            if merged is None:
+                merged = segment.subset(positions, row_ids)
+            elif len(positions):
+                merged = merged.extend(segment.reconstruct(positions), row_ids)
+        return SegmentedIndex([merged])
+
+
+INDEX_BACKENDS = {
+    "exact": EmbeddingIndex,
+    "ivf": IVFFlatIndex,
+    "float16": Float16Index,
+    "int8": Int8Index,
+    "pq": PQIndex,
+}
+
+
+def build_index(dataset, backend="exact", column="Embedding", **kwargs):
+    """
+    Build a similarity index over a dataset with the requested backend.
+
+    Args:
+        dataset (DataFrame): Dataset containing precomputed feature vectors
+        backend (str): Name of the backend, one of INDEX_BACKENDS
+        column (str): Name of the column holding the embeddings
+        **kwargs: Backend-specific options
+
+    Returns:
+        EmbeddingIndex: The constructed index
+    """
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(
+            f"Unknown index backend '{backend}', expected one of {sorted(INDEX_BACKENDS)}"
+        )
+    return INDEX_BACKENDS[backend].from_dataframe(dataset, column=column, **kwargs)
+
+
+def evaluate_recall(index, reference, queries, k=10):
+    """
+    Measure recall@k and query latency of an index against an exact reference.
+
+    Args:
+        index (EmbeddingIndex): Index under test, usually approximate
+        reference (EmbeddingIndex): Exact index over the same rows
+        queries: Array of shape (n_queries, dim) with query vectors
+        k (int): Number of neighbours compared per query
+
+    Returns:
+        dict: Recall and latency percentiles (in milliseconds) for both indexes
+    """
+    hits = 0
+    expected = 0
+    index_times = []
+    reference_times = []
+
+    for query in np.atleast_2d(queries):
+        start = time.perf_counter()
+        truth, _ = reference.search(query, k=k)
+        reference_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        found, _ = index.search(query, k=k)
+        index_times.append(time.perf_counter() - start)
+
+        hits += len(np.intersect1d(truth, found))
+        expected += len(truth)
+
+    index_ms = np.asarray(index_times) * 1000
+    reference_ms = np.asarray(reference_times) * 1000
+    return {
+        "k": k,
+        "queries": len(index_ms),
+        f"recall@{k}": hits / expected if expected else 0.0,
+        "index_p50_ms": float(np.percentile(index_ms, 50)),
+        "index_p99_ms": float(np.percentile(index_ms, 99)),
+        "exact_p50_ms": float(np.percentile(reference_ms, 50)),
+        "exact_p99_ms": float(np.percentile(reference_ms, 99)),
+    }
+
+
+def _normalize_rows(matrix):
+    """
+    L2-normalize the rows of a matrix in place, leaving zero rows untouched.
+    """
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+def _top_k(scores, k):
+    """
+    Return the positions of the k largest scores in descending order.
+    """
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(scores, -k)[-k:]
+    else:
+        candidates = np.arange(len(scores))
+    return candidates[np.argsort(-scores[candidates], kind="stable")]
+
+
+def _finite_top_k(scores, k):
+    """
+    Like _top_k, but without the masked (-inf) entries.
+    """
+    positions = _top_k(scores, k)
+    positions = positions[np.isfinite(scores[positions])]
+    return positions, scores[positions]
+
+
+def _assign(matrix, centroids, spherical=True, chunk_size=65536):
+    """
+    Assign each row to its nearest centroid, in chunks to bound memory.
+
+    Spherical assignment picks the most similar centroid by dot product,
+    otherwise the closest one by Euclidean distance.
+    """
+    bias = 0.0 if spherical else 0.5 * (centroids ** 2).sum(axis=1)
+    assignments = np.empty(matrix.shape[0], dtype=np.int64)
+    for start in range(0, matrix.shape[0], chunk_size):
+        block = matrix[start:start + chunk_size]
+        assignments[start:start + chunk_size] = np.argmax(block @ centroids.T - bias, axis=1)
+    return assignments
+
+
+def _kmeans(matrix, n_clusters, n_iter, rng, spherical=True):
+    """
+    Cluster rows with k-means, on the unit sphere when spherical is set.
+
+    Returns:
+        ndarray: Centroids of shape (n_clusters, dim), normalized if spherical
+    """
+    centroids = matrix[rng.choice(matrix.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _assign(matrix, centroids, spherical)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, matrix)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # Reseed empty clusters from random rows so no list stays unused
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = matrix[rng.choice(matrix.shape[0], int(empty.sum()))]
+            counts[empty] = 1
+        if spherical:
+            centroids = _normalize_rows(sums)
+        else:
+            centroids = sums / counts[:, None]
+    return centroids
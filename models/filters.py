@@ -0,0 +1,233 @@
+"""
+Module for metadata predicates evaluated inside the similarity search.
+
+CatalogFilter computes, once per index, the structures that turn a
+predicate into a boolean mask over the index positions:
+
+- a sorted price array, so a price range is two binary searches and one
+  slice of row positions
+- per-value posting lists for categorical columns (category, brand), so an
+  "is one of" predicate touches only the rows that have those values
+
+The index then scores only the allowed rows (see EmbeddingIndex.search)
+instead of post-filtering a global top-k. Each structure is built on first
+use, so a catalog whose columns are loaded lazily only reads a column once
+someone filters on it.
+"""
+
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from utils.helpers import parse_prices
+
+# Keywords mapping item names to a garment category, for catalogs without a Category column
+CATEGORY_KEYWORDS = {
+    "Outerwear": ("coat", "jacket", "blazer", "parka", "trench", "cardigan", "vest"),
+    "Dresses": ("dress", "gown", "jumpsuit", "romper"),
+    "Tops": ("shirt", "t-shirt", "tee", "top", "blouse", "sweater", "hoodie", "sweatshirt",
+             "polo", "tank", "camisole", "bodysuit", "turtleneck", "pullover", "jumper"),
+    "Bottoms": ("jeans", "trousers", "pants", "chinos", "shorts", "skirt", "leggings", "joggers"),
+    "Shoes": ("shoes", "sneakers", "trainers", "boots", "loafers", "heels", "sandals", "pumps",
+              "flats", "mules", "oxfords", "slippers"),
+    "Bags": ("bag", "tote", "clutch", "backpack", "handbag", "purse", "satchel"),
+    "Accessories": ("hat", "cap", "scarf", "belt", "sunglasses", "watch", "necklace", "earrings",
+                    "bracelet", "ring", "gloves", "tie", "socks"),
+}
+
+
+def infer_categories(item_names):
+    """
+    Guess the garment category of items from their names.
+
+    Args:
+        item_names (Series): Catalog item names
+
+    Returns:
+        ndarray: One key of CATEGORY_KEYWORDS (or "Other") per item
+    """
+    names = pd.Series(item_names, dtype=object).astype(str).str.lower()
+    categories = np.full(len(names), "Other", dtype=object)
+    # Earlier categories win, so assign them last
+    for category, keywords in reversed(CATEGORY_KEYWORDS.items()):
+        pattern = r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + r")s?\b"
+        categories[names.str.contains(pattern, regex=True).to_numpy()] = category
+    return categories
+
+
+class CatalogFilter:
+    """
+    Precomputed predicate structures over the rows of an index.
+
+    Masks are expressed in index positions (the order of ``index.row_ids``),
+    so they can be passed straight to ``index.search(..., allowed=mask)``.
+    """
+
+    def __init__(self, dataset, row_ids=None, price_column="Price", columns=("Category",)):
+        """
+        Build the price array and the posting lists.
+
+        Args:
+            dataset (DataFrame): Catalog metadata
+            row_ids (array, optional): Positional dataset row of each index position,
+                e.g. ``index.row_ids``. Defaults to every dataset row in order.
+            price_column (str): Column holding the prices
+            columns (tuple): Categorical columns to support. "Category" is inferred
+                from the item names when the dataset has no such column; other
+                missing columns are skipped.
+        """
+        self.row_ids = np.arange(len(dataset)) if row_ids is None else np.asarray(row_ids)
+        self.size = len(self.row_ids)
+        self._dataset = dataset
+        self._price_column = price_column
+        self._columns = [column for column in columns if column in dataset.columns
+                         or (column == "Category" and "Item Name" in dataset.columns)]
+        self._position_of_row = None
+        self._prices = None  # (index positions sorted by price, sorted prices)
+        self._postings = {}
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self):
+        """list: Categorical columns that can be filtered on."""
+        return list(self._columns)
+
+    def values(self, column):
+        """
+        Returns:
+            list: Distinct values of a categorical column, most frequent first
+        """
+        postings = self._posting_lists(column)
+        return sorted(postings, key=lambda value: (-len(postings[value]), str(value)))
+
+    def price_range(self):
+        """
+        Returns:
+            tuple: (lowest, highest) known price, or (None, None) without prices
+        """
+        _, sorted_prices = self._sorted_prices()
+        if len(sorted_prices) == 0:
+            return None, None
+        return float(sorted_prices[0]), float(sorted_prices[-1])
+
+    def mask(self, min_price=None, max_price=None, where=None):
+        """
+        Evaluate predicates into a boolean mask over the index positions.
+
+        Args:
+            min_price (float, optional): Lowest price allowed (inclusive)
+            max_price (float, optional): Highest price allowed (inclusive)
+            where (dict, optional): Categorical column -> value or list of allowed values.
+                Empty values mean "any".
+
+        Returns:
+            ndarray: Boolean mask, or None when no predicate is set (every row allowed)
+
+        Raises:
+            KeyError: If a column in ``where`` is not supported
+        """
+        mask = None
+        if min_price is not None or max_price is not None:
+            price_positions, sorted_prices = self._sorted_prices()
+            low = 0 if min_price is None else np.searchsorted(sorted_prices, min_price, side="left")
+            high = (len(sorted_prices) if max_price is None
+                    else np.searchsorted(sorted_prices, max_price, side="right"))
+            mask = np.zeros(self.size, dtype=bool)
+            mask[price_positions[low:high]] = True
+
+        for column, allowed in (where or {}).items():
+            if allowed is None or (isinstance(allowed, (list, tuple, set)) and not allowed):
+                continue
+            if column not in self._columns:
+                raise KeyError(f"Column '{column}' cannot be filtered on, expected one of {self.columns}")
+            if not isinstance(allowed, (list, tuple, set)):
+                allowed = [allowed]
+            postings = self._posting_lists(column)
+            column_mask = np.zeros(self.size, dtype=bool)
+            for value in allowed:
+                column_mask[postings.get(value, _EMPTY)] = True
+            mask = column_mask if mask is None else mask & column_mask
+        return mask
+
+    def rows_allowed(self, mask, rows):
+        """
+        Check dataset rows against a mask over the index positions.
+
+        Args:
+            mask (ndarray): Result of mask()
+            rows (array): Positional dataset rows, e.g. the items of an outfit
+
+        Returns:
+            ndarray: Boolean per row; rows without an embedding never pass
+        """
+        with self._lock:
+            if self._position_of_row is None:
+                position_of_row = np.full(len(self._dataset), -1, dtype=np.int64)
+                position_of_row[self.row_ids] = np.arange(self.size)
+                self._position_of_row = position_of_row
+        positions = self._position_of_row[np.asarray(rows, dtype=np.int64)]
+        return (positions >= 0) & mask[np.maximum(positions, 0)]
+
+    def _sorted_prices(self):
+        """
+        Returns:
+            tuple: (index positions ordered by price, their prices), built on first use
+        """
+        with self._lock:
+            if self._prices is None:
+                prices = parse_prices(self._dataset[self._price_column].iloc[self.row_ids])
+                priced = np.flatnonzero(~np.isnan(prices))
+                order = np.argsort(prices[priced], kind="stable")
+                self._prices = (priced[order], prices[priced][order])
+            return self._prices
+
+    def _posting_lists(self, column):
+        """
+        Returns:
+            dict: Value -> index positions for a categorical column, built on first use
+        """
+        with self._lock:
+            if column not in self._postings:
+                if column in self._dataset.columns:
+                    values = self._dataset[column].iloc[self.row_ids]
+                else:
+                    values = infer_categories(self._dataset["Item Name"].iloc[self.row_ids])
+                self._postings[column] = _posting_lists(values)
+            return self._postings[column]
+
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+
+def _posting_lists(values):
+    """
+    Group the positions of equal values: value -> sorted int64 positions.
+    """
+    codes, uniques = pd.factorize(pd.Series(values), use_na_sentinel=True)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    return {value: order[bounds[i]:bounds[i + 1]] for i, value in enumerate(uniques.tolist())}
+
+
+def search_filters(min_price=None, max_price=None, categories=None, brands=None):
+    """
+    Collect filter values from the UI into the predicates taken by
+    StyleFinderApp.match_image.
+
+    Args:
+        min_price (float, optional): Lowest price allowed
+        max_price (float, optional): Highest price allowed
+        categories (list, optional): Allowed garment categories
+        brands (list, optional): Allowed brands
+
+    Returns:
+        dict: 'min_price', 'max_price' and 'where' (column -> tuple of values),
+            or None when no filter is set
+    """
+    where = {column: tuple(sorted(values)) for column, values in
+             (("Category", categories), ("Brand", brands)) if values}
+    if min_price is None and max_price is None and not where:
+        return None
+    return {"min_price": min_price, "max_price": max_price, "where": where}
@@ -10,7 +10,100 @@ import requests
 import base64
 from io import BytesIO
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
+import json
+import os
+
+from models.embedding_index import EmbeddingIndex
+from models.inference import INFERENCE_MODES, optimize_encoder, prepare_input
+from models.preprocessing import FastPreprocessor, draft_for_size, fold_normalization
+from models.regions import crop_regions
+from utils.metrics import span
+
+# Supported model outputs used as the image embedding
+EMBEDDING_HEADS = ("pooled", "logits")
+
+# Metadata stored inside exported TorchScript encoders
+ENCODER_METADATA_FILE = "encoder.json"
+
+def build_preprocess(image_size=(224, 224),
+                     norm_mean=[0.485, 0.456, 0.406],
+                     norm_std=[0.229, 0.224, 0.225]):
+    """
+    Build the preprocessing pipeline that turns a PIL image into a model input.
+    
+    Args:
+        image_size (tuple): Target size for input images
+        norm_mean (list): Normalization mean values for RGB channels
+        norm_std (list): Normalization standard deviation values for RGB channels
+        
+    Returns:
+        Callable: Transform producing a tensor of shape (3, H, W)
+    """
+    return transforms.Compose([
+        transforms.Resize(image_size),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=norm_mean, std=norm_std),
+    ])
+
+
+def build_encoder(embedding_head="logits", weights_path=None):
+    """
+    Build the ResNet50 encoder for an embedding head.
+    
+    Args:
+        embedding_head (str): "pooled" or "logits"
+        weights_path (str, optional): Local state dict to load. The pretrained
+            weights are downloaded (or taken from the torch cache) when omitted.
+            
+    Returns:
+        torch.nn.Module: The encoder
+    """
+    if weights_path:
+        model = resnet50(weights=None)
+        model.load_state_dict(torch.load(weights_path, map_location="cpu", weights_only=True))
+    else:
+        model = resnet50(pretrained=True)
+    if embedding_head == "pooled":
+        # Drop the classifier so the model returns the pooled features
+        model.fc = torch.nn.Identity()
+    return model
+
+
+def load_torchscript_encoder(path, embedding_head, device, inference_mode="fp32",
+                             fast_preprocess=False):
+    """
+    Load an encoder exported by scripts/export_encoder.py.
+    
+    Returns:
+        tuple: (model, metadata dict stored with the export)
+    
+    Raises:
+        FileNotFoundError: If the file does not exist
+        ValueError: If it was exported for a different embedding head, inference
+            mode or preprocessing path
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"TorchScript encoder not found: {path}")
+    extra_files = {ENCODER_METADATA_FILE: ""}
+    model = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+    metadata = json.loads(extra_files[ENCODER_METADATA_FILE] or "{}")
+    if metadata.get("embedding_head", embedding_head) != embedding_head:
+        raise ValueError(
+            f"Encoder {path} was exported for the '{metadata['embedding_head']}' head, "
+            f"not '{embedding_head}'"
+        )
+    if metadata.get("inference_mode", "fp32") != inference_mode:
+        raise ValueError(
+            f"Encoder {path} was exported for the '{metadata.get('inference_mode', 'fp32')}' "
+            f"inference mode, not '{inference_mode}'"
+        )
+    if metadata.get("fast_preprocess", False) != fast_preprocess:
+        raise ValueError(
+            f"Encoder {path} was exported {'with' if not fast_preprocess else 'without'} "
+            "the fast preprocessing path"
+        )
+    return model, metadata
+
 
 class ImageProcessor:
     """
@@ -19,7 +112,11 @@ class ImageProcessor:
     
     def __init__(self, image_size=(224, 224), 
                  norm_mean=[0.485, 0.456, 0.406], 
-                 norm_std=[0.229, 0.224, 0.225]):
+                 norm_std=[0.229, 0.224, 0.225],
+                 embedding_head="logits", projection=None,
+                 llm_image_max_side=1024, llm_image_quality=85,
+                 weights_path=None, torchscript_path=None,
+                 inference_mode="fp32", calibration_images=None, fast_preprocess=False):
         """
         Initialize the image processor with a pre-trained ResNet50 model.
         
@@ -27,81 +124,330 @@ class ImageProcessor:
             image_size (tuple): Target size for input images
             norm_mean (list): Normalization mean values for RGB channels
             norm_std (list): Normalization standard deviation values for RGB channels
+            embedding_head (str): "pooled" for the 2048-d pooled features or
+                "logits" for the 1000-class classifier output
+            projection (PCAProjection, optional): Projection applied to every embedding
+            llm_image_max_side (int): Longest side of the JPEG sent to the LLM
+            llm_image_quality (int): JPEG quality of the image sent to the LLM
+            weights_path (str, optional): Local ResNet50 state dict, loaded instead
+                of downloading the pretrained weights
+            torchscript_path (str, optional): Frozen encoder written by
+                scripts/export_encoder.py, loaded instead of building ResNet50
+            inference_mode (str): "fp32", "channels_last" or "int8" (CPU only)
+            calibration_images (list, optional): Catalog images (PIL images or
+                paths) calibrating the "int8" mode. Not needed with a TorchScript
+                encoder, which is already converted.
+            fast_preprocess (bool): Use the uint8 preprocessing path with the
+                normalization folded into the first convolution (see
+                models/preprocessing.py), and let JPEGs decode at reduced size
         """
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.model = resnet50(pretrained=True).to(self.device)
-        self.model.eval()  # Set model to evaluation mode
+        if embedding_head not in EMBEDDING_HEADS:
+            raise ValueError(
+                f"Unknown embedding head '{embedding_head}', expected one of {EMBEDDING_HEADS}"
+            )
+        if inference_mode not in INFERENCE_MODES:
+            raise ValueError(
+                f"Unknown inference mode '{inference_mode}', expected one of {INFERENCE_MODES}"
+            )
+        
+        # Quantized kernels only exist for the CPU
+        use_cuda = torch.cuda.is_available() and inference_mode != "int8"
+        self.device = torch.device("cuda" if use_cuda else "cpu")
+        self.embedding_head = embedding_head
+        self.inference_mode = inference_mode
+        self.projection = projection
+        self.llm_image_max_side = llm_image_max_side
+        self.llm_image_quality = llm_image_quality
+        
+        self.fast_preprocess = fast_preprocess
+        # JPEGs may decode at reduced size as long as both the model input and the LLM image fit
+        self.draft_side = max(llm_image_max_side, *image_size)
         
         # Image preprocessing pipeline
-        self.preprocess = transforms.Compose([
-            transforms.Resize(image_size),
-            transforms.ToTensor(),
-            transforms.Normalize(mean=norm_mean, std=norm_std),
-        ])
+        self.preprocess = build_preprocess(image_size, norm_mean, norm_std)
+        
+        if torchscript_path:
+            self.model, metadata = load_torchscript_encoder(
+                torchscript_path, embedding_head, self.device, inference_mode, fast_preprocess
+            )
+            if fast_preprocess:
+                self.preprocess = FastPreprocessor(image_size, norm_mean, metadata["input_padding"])
+        else:
+            model = build_encoder(embedding_head, weights_path).eval()
+            if fast_preprocess:
+                # Fold before quantizing, so calibration sees the raw-pixel inputs
+                padding = fold_normalization(model, norm_mean, norm_std)
+                self.preprocess = FastPreprocessor(image_size, norm_mean, padding)
+            self.model = optimize_encoder(
+                model, inference_mode,
+                calibration_batches=self._calibration_batches(calibration_images or [])
+                if inference_mode == "int8" else None
+            )
+        self.model = self.model.to(self.device)
+        self.model.eval()  # Set model to evaluation mode
+    
+    def _calibration_batches(self, images, batch_size=16):
+        """
+        Preprocess calibration images into batches for int8 calibration.
+        """
+        tensors = []
+        for image in images:
+            try:
+                tensors.append(self.preprocess(self.load_image(image, is_url=False)))
+            except Exception as e:
+                print(f"Skipping calibration image {image}: {e}")
+        return [torch.stack(tensors[i:i + batch_size]) for i in range(0, len(tensors), batch_size)]
     
-    def encode_image(self, image_input, is_url=True):
+    def encode_image(self, image_input, is_url=None):
         """
         Encode an image and extract its feature vector.
         
         Args:
-            image_input: URL or local path to the image
-            is_url: Whether the input is a URL (True) or a local file path (False)
+            image_input: PIL image, encoded image bytes, numpy array, URL or local path
+            is_url: Whether a string input is a URL (True) or a local file path (False).
+                Detected from the string when None.
             
         Returns:
             dict: Contains 'base64' string and 'vector' (feature embedding)
         """
+        return self.encode_images([image_input], is_url=is_url)[0]
+
+    def encode_images(self, image_inputs, is_url=None):
+        """
+        Encode several images with a single forward pass through the model.
+        
+        Each image is loaded independently, so an image that cannot be read
+        only fails its own entry instead of the whole batch.
+        
+        Args:
+            image_inputs (list): PIL images, encoded image bytes, numpy arrays, URLs or local paths
+            is_url: Whether string inputs are URLs (True) or local file paths (False).
+                Detected from each string when None.
+            
+        Returns:
+            list: One dict per input with 'base64' string and 'vector' (feature embedding),
+                both None for images that could not be encoded
+        """
+        results = [{"base64": None, "vector": None} for _ in image_inputs]
+        images = []
+        positions = []
+        
+        for position, image_input in enumerate(image_inputs):
+            try:
+                # Decode once; the LLM payload and the model input both come from it
+                with span("decode"):
+                    image = self.load_image(image_input, is_url)
+                    image.load()  # Surface decoding errors here, not in the batch
+                with span("llm_payload"):
+                    results[position]["base64"] = self._to_base64(image)
+                images.append(image)
+                positions.append(position)
+            except Exception as e:
+                print(f"Error encoding image: {e}")
+                results[position]["base64"] = None
+        
+        if not images:
+            return results
+        
+        # Preprocess the images for ResNet50
+        batch = self.preprocess_batch(images)
         try:
+            vectors = self.extract_features(batch)
+        except Exception as e:
+            # Fall back to one image at a time so a single bad input
+            # cannot take the rest of the batch down with it
+            print(f"Error encoding image batch, retrying individually: {e}")
+            vectors = []
+            for i in range(len(batch)):
+                try:
+                    vectors.append(self.extract_features(batch[i:i + 1])[0])
+                except Exception as item_error:
+                    print(f"Error encoding image: {item_error}")
+                    vectors.append(None)
+        
+        for position, vector in zip(positions, vectors):
+            if vector is None:
+                results[position]["base64"] = None
+            results[position]["vector"] = vector
+        
+        return results
+
+    def encode_regions(self, image_input, mode="saliency", count=3, is_url=None):
+        """
+        Encode an image together with its garment regions in one forward pass.
+
+        Args:
+            image_input: PIL image, encoded image bytes, numpy array, URL or local path
+            mode (str): How regions are chosen, "grid" or "saliency"
+            count (int): Number of regions
+            is_url: Whether a string input is a URL (True) or a local file path (False).
+                Detected from the string when None.
+
+        Returns:
+            dict: 'base64' string and 'vector' of the whole image like encode_image,
+                plus 'regions', a list of dicts with the crop 'box' and its 'vector'.
+                The vectors are None and 'regions' empty if the image could not be encoded.
+        """
+        try:
+            with span("decode"):
+                image = self.load_image(image_input, is_url)
+            with span("crop_regions"):
+                boxes = crop_regions(image, mode=mode, count=count)
+            batch = self.preprocess_batch([image] + [image.crop(box) for box in boxes])
+            vectors = self.extract_features(batch)
+            return {
+                "base64": self._to_base64(image),
+                "vector": vectors[0],
+                "regions": [{"box": box, "vector": vector} for box, vector in zip(boxes, vectors[1:])],
+            }
+        except Exception as e:
+            print(f"Error encoding image regions: {e}")
+            return {"base64": None, "vector": None, "regions": []}
+
+    def preprocess_batch(self, images):
+        """
+        Preprocess RGB images into one model input batch.
+        
+        The fast path writes into a reused buffer, so the batch is only valid
+        until the next call from the same thread.
+        
+        Args:
+            images (list): RGB PIL images
+            
+        Returns:
+            Tensor: Batch of shape (n, 3, H, W)
+        """
+        with span("preprocess"):
+            if self.fast_preprocess:
+                return self.preprocess.batch(images)
+            return torch.stack([self.preprocess(image) for image in images])
+
+    def load_image(self, image_input, is_url=None):
+        """
+        Load an image from memory, a URL or a local file as an RGB PIL image.
+        
+        Args:
+            image_input: PIL image, encoded image bytes, numpy array, URL or local path
+            is_url: Whether a string input is a URL (True) or a local file path (False).
+                Detected from the string when None.
+            
+        Returns:
+            PIL.Image.Image: The image in RGB mode
+        """
+        if isinstance(image_input, Image.Image):
+            image = image_input
+        elif isinstance(image_input, (bytes, bytearray, memoryview)):
+            image = Image.open(BytesIO(image_input))
+        elif isinstance(image_input, np.ndarray):
+            image = Image.fromarray(image_input)
+        else:
+            if is_url is None:
+                is_url = str(image_input).startswith(("http://", "https://"))
             if is_url:
                 # Fetch the image from URL
                 response = requests.get(image_input)
                 response.raise_for_status()
-                image = Image.open(BytesIO(response.content)).convert("RGB")
+                image = Image.open(BytesIO(response.content))
             else:
                 # Load the image from a local file
-                image = Image.open(image_input).convert("RGB")
+                image = Image.open(image_input)
+        if self.fast_preprocess and not isinstance(image_input, Image.Image):
+            draft_for_size(image, self.draft_side)
+        return image if image.mode == "RGB" else image.convert("RGB")
+
+    def llm_payload(self, image):
+        """
+        Encode the Base64 JPEG sent to the LLM, e.g. for an upload whose
+        feature vectors came from a cache.
+
+        Args:
+            image (PIL.Image.Image): RGB image, as returned by load_image
 
-            # Convert image to Base64
-            buffered = BytesIO()
-            image.save(buffered, format="JPEG")
-            base64_string = base64.b64encode(buffered.getvalue()).decode("utf-8")
+        Returns:
+            str: Base64 string, as in the 'base64' field of encode_image
+        """
+        with span("llm_payload"):
+            return self._to_base64(image)
 
-            # Preprocess the image for ResNet50
-            input_tensor = self.preprocess(image).unsqueeze(0).to(self.device)
+    def _to_base64(self, image):
+        """
+        Encode a size-capped JPEG copy of the image as Base64 for the LLM.
+        """
+        if max(image.size) > self.llm_image_max_side:
+            image = image.copy()
+            image.thumbnail((self.llm_image_max_side, self.llm_image_max_side))
+        buffered = BytesIO()
+        image.save(buffered, format="JPEG", quality=self.llm_image_quality)
+        return base64.b64encode(buffered.getvalue()).decode("utf-8")
 
-            # Extract features using ResNet50
-            with torch.no_grad():
-                features = self.model(input_tensor)
+    def extract_features(self, batch):
+        """
+        Run a batch of preprocessed images through the model.
+        
+        Args:
+            batch (Tensor): Batch of preprocessed images of shape (n, 3, H, W)
             
-            # Convert features to a NumPy array
-            feature_vector = features.cpu().numpy().flatten()
+        Returns:
+            ndarray: Feature vectors of shape (n, dim)
+        """
+        # Extract features using ResNet50; the optimized modes also skip autograd tracking
+        context = torch.no_grad() if self.inference_mode == "fp32" else torch.inference_mode()
+        with span("forward"), context:
+            batch = batch.to(self.device, non_blocking=True)
+            features = self.model(prepare_input(batch, self.inference_mode))
+        
+        # Convert features to a NumPy array
+        vectors = features.cpu().numpy().reshape(len(batch), -1)
+        if self.projection is not None:
+            vectors = self.projection.transform(vectors)
+        return vectors
 
-            return {"base64": base64_string, "vector": feature_vector}
-        except Exception as e:
-            print(f"Error encoding image: {e}")
-            return {"base64": None, "vector": None}
+    def find_matches(self, user_vector, dataset, index=None, k=5, min_score=None, allowed=None):
+        """
+        Find the top-k matches in the dataset based on cosine similarity.
+        
+        Args:
+            user_vector: Feature vector of the user-uploaded image
+            dataset: DataFrame containing precomputed feature vectors
+            index (EmbeddingIndex, optional): Prebuilt index over the dataset embeddings.
+                Built on the fly when omitted.
+            k (int): Number of matches to return
+            min_score (float, optional): Minimum similarity for a match to be returned
+            allowed (ndarray, optional): Boolean mask over the index positions
+                restricting the candidates, see models/filters.py
+            
+        Returns:
+            list: (row, similarity score) tuples sorted by descending similarity
+        """
+        if index is None:
+            index = EmbeddingIndex.from_dataframe(dataset)
+        
+        # Row ids are positions in the full dataset, so rows without an
+        # embedding cannot shift the result
+        with span("similarity"):
+            row_ids, scores = index.search(user_vector, k=k, min_score=min_score, allowed=allowed)
+        return [(dataset.iloc[row_id], float(score)) for row_id, score in zip(row_ids, scores)]
 
-    def find_closest_match(self, user_vector, dataset):
+    def find_closest_match(self, user_vector, dataset, index=None, allowed=None):
         """
         Find the closest match in the dataset based on cosine similarity.
         
         Args:
             user_vector: Feature vector of the user-uploaded image
             dataset: DataFrame containing precomputed feature vectors
+            index (EmbeddingIndex, optional): Prebuilt index over the dataset embeddings.
+                Built on the fly when omitted.
+            allowed (ndarray, optional): Boolean mask over the index positions
+                restricting the candidates
             
         Returns:
             tuple: (Closest matching row, similarity score)
         """
         try:
-            dataset_vectors = np.vstack(dataset['Embedding'].dropna().values)
-            similarities = cosine_similarity(user_vector.reshape(1, -1), dataset_vectors)
-            
-            # Find the index of the most similar vector
-            closest_index = np.argmax(similarities)
-            similarity_score = similarities[0][closest_index]
-            
-            # Retrieve the closest matching row
-            closest_row = dataset.iloc[closest_index]
-            return closest_row, similarity_score
+            matches = self.find_matches(user_vector, dataset, index=index, k=1, allowed=allowed)
+            if not matches:
+                return None, None
+            return matches[0]
         except Exception as e:
             print(f"Error finding closest match: {e}")
-            return None, None
\ No newline at end of file
+            return None, None
@@ -0,0 +1,367 @@
+"""
+Module for updating the catalog and its index while the app is serving.
+
+Everything a request reads from the catalog (metadata, index, item lookup
+and filter structures) is bundled in an immutable CatalogGeneration.
+``IndexManager.current`` points at the live generation: a request reads the
+pointer once and works on that snapshot, while an update builds the next
+generation on the side and then swaps the pointer. Readers never take a
+lock; writers are serialized by one.
+
+Updates:
+
+- append: new items and their index segment, searched next to the existing
+  segments so no existing vector is copied or re-encoded
+- delete: items tombstoned by link or image URL and masked out of the search
+- compact: rewrites the live rows into one index once tombstones or
+  segments pile up
+- replace: swaps in a whole new catalog
+
+``watch`` polls a directory for update files and applies each one once, in
+name order:
+
+- ``<name>.json`` and the other files of a vector store (save_vector_store):
+  items to append; an item whose link already exists replaces it
+- ``<name>.full.json`` and the other files of a vector store: a new catalog
+- ``<name>.delete.json``: ``{"links": [...], "image_urls": [...]}`` to delete
+
+Updates sit on top of the dataset the app started from, so keep the files
+in place: after a restart they are applied again.
+
+Every generation also carries a ``catalog_id`` naming its contents. Unlike
+the version, which restarts at 0 in every process, it is derived from the
+files the catalog was loaded from and the updates applied since, so a
+persistent cache keyed on it is never served from another catalog. Updates
+without a file behind them get a random identity. Vector stores are written
+with their .json last, so a half-written store is never picked up; write
+delete files under another name and rename them into place.
+"""
+
+import copy
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from models.embedding_index import EmbeddingIndex, SegmentedIndex, build_index
+from models.filters import CatalogFilter, infer_categories
+from models.vector_store import load_vector_store, store_fingerprint
+from utils.helpers import build_item_lookup
+from utils.metrics import count, span
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogGeneration:
+    """
+    One version of the catalog. Never modified once published.
+    """
+
+    def __init__(self, version, data, index, deleted, item_lookup, catalog_filter, catalog_id):
+        """
+        Args:
+            version (int): Increases with every published update
+            data (DataFrame): Catalog metadata, including deleted rows until compaction
+            index (SegmentedIndex): Index whose row ids point into ``data``
+            deleted (ndarray): Boolean per data row, True for tombstoned items
+            item_lookup (dict): Live items grouped by image, see build_item_lookup
+            catalog_filter (CatalogFilter): Filter structures over the index positions
+            catalog_id (str): Identity of the contents, stable across restarts
+                (see the module docstring)
+        """
+        self.version = version
+        self.data = data
+        self.index = index
+        self.deleted = deleted
+        self.item_lookup = item_lookup
+        self.catalog_filter = catalog_filter
+        self.catalog_id = catalog_id
+
+    @property
+    def items(self):
+        """int: Number of live items."""
+        return int(len(self.data) - self.deleted.sum())
+
+
+class IndexManager:
+    """
+    Holds the live CatalogGeneration and publishes updated ones.
+    """
+
+    def __init__(self, data, index=None, index_options=None, filter_columns=("Category",),
+                 describe_items=True, compact_tombstone_fraction=0.2, compact_max_segments=8,
+                 source_id=None):
+        """
+        Publish the first generation.
+
+        Args:
+            data (DataFrame): Catalog metadata, with an Embedding column when no index is given
+            index (EmbeddingIndex, optional): Index over ``data``
+            index_options (dict, optional): Keyword arguments for build_index, used
+                when building an index for a replaced catalog
+            filter_columns (tuple): Categorical columns of the CatalogFilter
+            describe_items (bool): Pre-render the item list of every outfit in the
+                item lookup; off for lazily loaded catalogs (see build_item_lookup)
+            compact_tombstone_fraction (float): Compact once this share of the
+                indexed rows is deleted
+            compact_max_segments (int): Compact once the index has more segments
+            source_id (str, optional): Identity of the files ``data`` was loaded
+                from, e.g. store_fingerprint; random when omitted
+        """
+        self.index_options = index_options or {}
+        self.filter_columns = filter_columns
+        self.describe_items = describe_items
+        self.compact_tombstone_fraction = compact_tombstone_fraction
+        self.compact_max_segments = compact_max_segments
+        self.current = None
+        self._lock = threading.Lock()
+        self._seen = {}  # watched file name -> modification time when it was applied
+        self._stop = threading.Event()
+        self._watcher = None
+        with self._lock:
+            self._publish(self._full_generation(data, index, source_id), "initial")
+
+    def append(self, items, index=None, source_id=None):
+        """
+        Add items, replacing existing items with the same link.
+
+        Args:
+            items (DataFrame): New catalog rows, with an Embedding column when no index is given
+            index (EmbeddingIndex, optional): Index over ``items``, e.g. from load_vector_store
+            source_id (str, optional): Identity of the files ``items`` were loaded
+                from; random when omitted
+
+        Returns:
+            CatalogGeneration: The published generation
+        """
+        if index is None:
+            index = EmbeddingIndex.from_dataframe(items)
+        with self._lock:
+            current = self.current
+            data = current.data
+            if "Embedding" in items.columns and "Embedding" not in data.columns:
+                items = items.drop(columns=["Embedding"])
+            if "Category" in data.columns and "Category" not in items.columns and "Item Name" in items.columns:
+                # The catalog stores inferred categories (see save_items); infer them for new items too
+                items = items.assign(Category=infer_categories(items["Item Name"]))
+            # Match the catalog's column types, so Arrow-backed columns stay Arrow-backed
+            shared = [column for column in items.columns
+                      if column in data.columns and column != "Embedding"]
+            items = items.astype({column: data[column].dtype for column in shared})
+
+            # Shift the segment's row ids past the existing rows, sharing its vectors
+            segment = copy.copy(index)
+            segment.row_ids = index.row_ids + len(data)
+            data = pd.concat([data, items], ignore_index=True)
+
+            deleted = np.concatenate([current.deleted, np.zeros(len(items), dtype=bool)])
+            replaced = np.flatnonzero(~deleted[:len(current.data)]
+                                      & current.data["Link"].isin(items["Link"]).to_numpy())
+            deleted[replaced] = True
+
+            index = current.index.append(segment)
+            if len(replaced):
+                index = index.delete(deleted[index.row_ids])
+            changed = pd.concat([items["Image URL"], current.data["Image URL"].iloc[replaced]])
+            generation = CatalogGeneration(
+                current.version + 1, data, index, deleted,
+                _update_lookup(current.item_lookup, data, deleted, changed, self.describe_items),
+                CatalogFilter(data, index.row_ids, columns=self.filter_columns),
+                _derive_id(current.catalog_id, "append", source_id or uuid.uuid4().hex)
+            )
+            return self._publish(generation, "append")
+
+    def delete(self, links=None, image_urls=None):
+        """
+        Tombstone items by link, or whole outfits by image URL.
+
+        Returns:
+            CatalogGeneration: The published generation, or the current one
+                when nothing matched
+        """
+        with self._lock:
+            current = self.current
+            data = current.data
+            matches = np.zeros(len(data), dtype=bool)
+            if links:
+                matches |= data["Link"].isin(links).to_numpy()
+            if image_urls:
+                matches |= data["Image URL"].isin(image_urls).to_numpy()
+            matches &= ~current.deleted
+            if not matches.any():
+                return current
+
+            deleted = current.deleted | matches
+            index = current.index.delete(deleted[current.index.row_ids])
+            # Index positions are unchanged, so the filter structures stay valid;
+            # the tombstones keep deleted rows out of every search
+            generation = CatalogGeneration(
+                current.version + 1, data, index, deleted,
+                _update_lookup(current.item_lookup, data, deleted, data["Image URL"][matches],
+                               self.describe_items),
+                current.catalog_filter,
+                _derive_id(current.catalog_id, "delete", json.dumps([sorted(links or []),
+                                                                     sorted(image_urls or [])]))
+            )
+            return self._publish(generation, "delete")
+
+    def compact(self):
+        """
+        Drop the deleted rows and merge every segment into one index.
+
+        Returns:
+            CatalogGeneration: The published generation
+        """
+        with self._lock:
+            return self._compact()
+
+    def replace(self, data, index=None, source_id=None):
+        """
+        Swap in a whole new catalog.
+
+        Args:
+            data, index: As for the constructor
+            source_id (str, optional): Identity of the files ``data`` was loaded
+                from; random when omitted
+
+        Returns:
+            CatalogGeneration: The published generation
+        """
+        with self._lock:
+            return self._publish(self._full_generation(data, index, source_id), "replace")
+
+    def poll(self, directory):
+        """
+        Apply the update files in a directory that were not applied yet.
+
+        Returns:
+            list: Names of the files applied
+        """
+        applied = []
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(directory, name)
+            prefix = path[:-len(".json")]
+            is_store = os.path.exists(prefix + ".codes.npy")
+            if not is_store and not name.endswith(".delete.json"):
+                continue
+            modified = os.path.getmtime(path)
+            if self._seen.get(name) == modified:
+                continue
+
+            # Marked before applying, so a broken file is reported once, not on every poll
+            self._seen[name] = modified
+            try:
+                if not is_store:
+                    with open(path) as f:
+                        spec = json.load(f)
+                    self.delete(links=spec.get("links"), image_urls=spec.get("image_urls"))
+                elif prefix.endswith(".full"):
+                    self.replace(*load_vector_store(prefix), source_id=store_fingerprint(prefix))
+                else:
+                    self.append(*load_vector_store(prefix), source_id=store_fingerprint(prefix))
+            except Exception as e:
+                logger.exception("Error applying catalog update %s: %s", name, e)
+                count("catalog_update_error")
+                continue
+            applied.append(name)
+        return applied
+
+    def watch(self, directory, interval=5.0):
+        """
+        Poll a directory for update files from a daemon thread.
+        """
+        def run():
+            while True:
+                try:
+                    self.poll(directory)
+                except OSError as e:
+                    logger.warning("Cannot read catalog updates from %s: %s", directory, e)
+                if self._stop.wait(interval):
+                    return
+
+        self._watcher = threading.Thread(target=run, name="catalog-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """
+        Stop watching for update files.
+        """
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+    def _full_generation(self, data, index, source_id=None):
+        """
+        Build a generation from scratch, with every structure rebuilt.
+        """
+        if data.empty:
+            raise ValueError("The catalog is empty")
+        version = 0 if self.current is None else self.current.version + 1
+        if index is None:
+            index = build_index(data, **self.index_options)
+        if not isinstance(index, SegmentedIndex):
+            index = SegmentedIndex([index])
+        return CatalogGeneration(
+            version, data, index, np.zeros(len(data), dtype=bool),
+            build_item_lookup(data, describe=self.describe_items),
+            CatalogFilter(data, index.row_ids, columns=self.filter_columns),
+            _derive_id("", "full", source_id or uuid.uuid4().hex)
+        )
+
+    def _compact(self):
+        current = self.current
+        live = ~current.deleted
+        row_map = np.where(live, np.cumsum(live) - 1, -1)
+        data = current.data[live].reset_index(drop=True)
+        with span("catalog_compact"):
+            index = current.index.compact(row_map)
+        generation = CatalogGeneration(
+            current.version + 1, data, index, np.zeros(len(data), dtype=bool),
+            build_item_lookup(data, describe=self.describe_items),
+            CatalogFilter(data, index.row_ids, columns=self.filter_columns),
+            current.catalog_id  # Same live items, so the same contents
+        )
+        return self._publish(generation, "compact", compact=False)
+
+    def _publish(self, generation, kind, compact=True):
+        """
+        Make a generation the current one. Called with the lock held.
+        """
+        self.current = generation
+        count("catalog_update", kind=kind)
+        logger.info("Catalog generation %d (%s): %d items, %d index segments, %d deleted rows",
+                    generation.version, kind, generation.items, len(generation.index.segments),
+                    generation.index.deleted)
+
+        index = generation.index
+        if compact and (index.deleted > self.compact_tombstone_fraction * len(index)
+                        or len(index.segments) > self.compact_max_segments):
+            return self._compact()
+        return generation
+
+
+def _derive_id(parent_id, kind, update_id):
+    """
+    Identity of the catalog after applying an update to the one named parent_id.
+    """
+    return hashlib.sha1(f"{parent_id}\n{kind}\n{update_id}".encode()).hexdigest()
+
+
+def _update_lookup(item_lookup, data, deleted, image_urls, describe=True):
+    """
+    Copy an item lookup with the entries of some images rebuilt from their live rows.
+    """
+    image_urls = pd.unique(pd.Series(image_urls, dtype=object))
+    lookup = dict(item_lookup)
+    for image_url in image_urls:
+        lookup.pop(image_url, None)
+    rows = np.flatnonzero(data["Image URL"].isin(image_urls).to_numpy() & ~deleted)
+    lookup.update(build_item_lookup(data, rows, describe))
+    return lookup
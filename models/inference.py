@@ -0,0 +1,111 @@
+"""
+Module for CPU inference modes of the image encoder.
+"""
+
+import logging
+import os
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+# Supported encoder inference modes
+INFERENCE_MODES = ("fp32", "channels_last", "int8")
+
+def optimize_encoder(model, mode="fp32", calibration_batches=None, example_input=None):
+    """
+    Convert an eager encoder for the given inference mode.
+
+    - "fp32": the model unchanged
+    - "channels_last": weights in NHWC layout, which the CPU convolution
+      kernels prefer; inputs must be converted the same way (see prepare_input)
+    - "int8": FX graph mode post-training static quantization, calibrated on
+      the given batches of preprocessed catalog images
+
+    Args:
+        model (torch.nn.Module): Eager encoder in eval mode, on the CPU for int8
+        mode (str): One of INFERENCE_MODES
+        calibration_batches (iterable, optional): Preprocessed image batches of
+            shape (n, 3, H, W), required for "int8"
+        example_input (Tensor, optional): One preprocessed batch used to trace the
+            model for "int8", defaults to the first calibration batch
+
+    Returns:
+        torch.nn.Module: The converted encoder
+    """
+    if mode not in INFERENCE_MODES:
+        raise ValueError(f"Unknown inference mode '{mode}', expected one of {INFERENCE_MODES}")
+
+    if mode == "channels_last":
+        return model.to(memory_format=torch.channels_last)
+
+    if mode == "int8":
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import convert_fx, prepare_fx
+
+        batches = list(calibration_batches or [])
+        if not batches:
+            raise ValueError("int8 inference needs calibration images")
+        if example_input is None:
+            example_input = batches[0][:1]
+
+        # Observers record activation ranges on real catalog images
+        prepared = prepare_fx(model, get_default_qconfig_mapping("x86"), (example_input,))
+        with torch.inference_mode():
+            for batch in batches:
+                prepared(batch)
+        logger.info(f"Calibrated int8 encoder on {sum(len(b) for b in batches)} images")
+        return convert_fx(prepared)
+
+    return model
+
+
+def prepare_input(batch, mode="fp32"):
+    """
+    Lay out an input batch the way the encoder of a mode expects.
+    """
+    if mode == "channels_last":
+        return batch.contiguous(memory_format=torch.channels_last)
+    return batch
+
+
+def configure_threads(intra_op=None, inter_op=None):
+    """
+    Set the torch CPU thread counts of this process.
+
+    With several encoder workers per node, give each a share of the cores
+    instead of letting every one default to all of them.
+
+    Args:
+        intra_op (int, optional): Threads used inside one operator
+        inter_op (int, optional): Threads running independent operators
+    """
+    if intra_op:
+        torch.set_num_threads(intra_op)
+    if inter_op:
+        try:
+            torch.set_num_interop_threads(inter_op)
+        except RuntimeError as e:
+            # Only allowed before any parallel work has started
+            logger.warning(f"Could not set inter-op threads: {e}")
+
+
+def list_calibration_images(directory, limit=64):
+    """
+    Pick the catalog images used to calibrate the int8 encoder.
+
+    Args:
+        directory (str): Directory of catalog images
+        limit (int): Maximum number of images, spread evenly over the sorted files
+
+    Returns:
+        list: Image file paths
+    """
+    files = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory)
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".webp"))
+    )
+    if len(files) > limit:
+        step = len(files) / limit
+        files = [files[int(i * step)] for i in range(limit)]
+    return files
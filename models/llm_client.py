@@ -0,0 +1,356 @@
+"""
+Resilient wrapper around a chat model: deadlines, retries, a concurrency cap
+and a circuit breaker.
+"""
+
+import inspect
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+from utils.metrics import count
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying: throttling and transient server errors
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """
+    Base class for failures of the resilient chat client.
+    """
+
+
+class LLMTimeoutError(LLMError):
+    """
+    Raised when a call does not finish within its deadline.
+    """
+
+
+class CircuitOpenError(LLMError):
+    """
+    Raised without calling the model while the circuit breaker is open.
+    """
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency for a cool-down period.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls. Once ``reset_timeout`` seconds have passed, a single trial
+    call is let through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        """
+        Args:
+            failure_threshold (int): Consecutive failures that open the breaker
+            reset_timeout (float): Seconds to stay open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """str: "closed", "open" or "half-open"."""
+        with self._lock:
+            return self._state()
+
+    def allow(self):
+        """
+        Check whether a call may go through, claiming the trial slot when half-open.
+
+        Returns:
+            bool: True if the call may proceed
+        """
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half-open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_in_flight or self.failures >= self.failure_threshold:
+                if self.opened_at is None or self._trial_in_flight:
+                    logger.warning("Circuit breaker opened after %d failures", self.failures)
+                    count("llm_breaker_opened")
+                self.opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half-open"
+        return "open"
+
+
+class ResilientChatClient:
+    """
+    Wraps an object with ``chat``/``chat_stream`` methods (such as a watsonx
+    ModelInference) and adds:
+
+    - a deadline per attempt, counted from when the call starts rather than
+      from when it was queued, and passed on to the model when it accepts one
+    - retries with jittered exponential backoff on retryable errors
+    - a cap on concurrent in-flight calls, a stream holding its slot until it ends
+    - an idle timeout between the chunks of a stream
+    - a circuit breaker that fails fast while the model keeps failing
+
+    Failures are raised as LLMError subclasses instead of being returned as text.
+    """
+
+    def __init__(self, model, timeout=30, max_retries=2, backoff_base=0.5, backoff_max=8,
+                 max_concurrency=4, failure_threshold=5, reset_timeout=30):
+        """
+        Args:
+            model: Object with chat(messages=...) and optionally chat_stream(messages=...)
+            timeout (float): Seconds one attempt may run, and for streams the
+                longest wait for each chunk
+            max_retries (int): Retries after the first attempt
+            backoff_base (float): Base delay in seconds, doubled per retry
+            backoff_max (float): Upper bound of a single backoff delay
+            max_concurrency (int): Maximum calls in flight at once, including
+                calls whose caller already gave up waiting
+            failure_threshold (int): Consecutive failures that open the circuit breaker
+            reset_timeout (float): Seconds before the open breaker allows a trial call
+        """
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+        # A call takes a slot before it starts and gives it back once the model
+        # really returns, even if its caller stopped waiting at the deadline.
+        # Blocking reads run in the pool so callers can stop waiting; every read
+        # holds a slot, so the pool never queues.
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._queued = 0
+        self._queued_lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="llm-call")
+
+    def chat(self, messages, **kwargs):
+        """
+        Call the model's chat method with deadline, retries and circuit breaking.
+
+        Returns:
+            dict: The model's response
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            LLMTimeoutError: If the last attempt timed out
+            LLMError: If the last attempt failed with another error
+        """
+        kwargs = self._with_timeout(self.model.chat, kwargs)
+        result, _ = self._call(lambda: self.model.chat(messages=messages, **kwargs))
+        return result
+
+    def chat_stream(self, messages, **kwargs):
+        """
+        Stream from the model's chat_stream method.
+
+        Opening the stream and waiting for the first chunk are retried like
+        chat(). After the first chunk has been yielded the stream is not
+        retried, since the caller has already used part of it. The stream
+        holds a concurrency slot until it ends or is closed.
+
+        Yields:
+            dict: Chunks from the model
+
+        Raises:
+            LLMTimeoutError: If a chunk does not arrive within the timeout
+            LLMError: If the stream fails or breaks off
+        """
+        kwargs = self._with_timeout(self.model.chat_stream, kwargs)
+
+        def first_chunk():
+            stream = iter(self.model.chat_stream(messages=messages, **kwargs))
+            return stream, next(stream, None)
+
+        (stream, chunk), release = self._call(first_chunk, keep_slot=True)
+        abandoned = False
+        try:
+            while chunk is not None:
+                yield chunk
+                future = self._pool.submit(next, stream, None)
+                try:
+                    chunk = future.result(timeout=self.timeout)
+                except FutureTimeoutError:
+                    # The read is still blocked; its slot is freed when it returns
+                    abandoned = True
+                    future.add_done_callback(lambda _: release())
+                    count("llm_timeout")
+                    self.breaker.record_failure()
+                    raise LLMTimeoutError(f"No stream chunk within {self.timeout}s")
+                except Exception as e:
+                    self.breaker.record_failure()
+                    if _is_timeout(e):
+                        count("llm_timeout")
+                        raise LLMTimeoutError(f"No stream chunk within {self.timeout}s") from e
+                    raise LLMError(f"Stream interrupted: {e}") from e
+        finally:
+            if not abandoned:
+                # Ended, failed or closed by the caller: drop the connection and free the slot
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                release()
+
+    def _call(self, fn, keep_slot=False):
+        """
+        Run fn with the deadline, retries and circuit breaking.
+
+        Args:
+            fn (Callable): The model call
+            keep_slot (bool): Keep the concurrency slot after a successful call
+
+        Returns:
+            tuple: fn's result and a function releasing the slot (already
+                released unless keep_slot is set)
+        """
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                count("llm_breaker_rejected")
+                raise CircuitOpenError("LLM circuit breaker is open")
+
+            release = self._acquire()
+            # The slot is free, so the call starts now and the deadline counts from here
+            future = self._pool.submit(fn)
+            try:
+                result = future.result(timeout=self.timeout)
+                self.breaker.record_success()
+                if not keep_slot:
+                    release()
+                return result, release
+            except FutureTimeoutError:
+                count("llm_timeout")
+                last_error = LLMTimeoutError(f"LLM call timed out after {self.timeout}s")
+            except Exception as e:
+                last_error = e
+                if not is_retryable(e):
+                    self.breaker.record_failure()
+                    raise LLMError(f"LLM call failed: {e}") from e
+            finally:
+                if not future.done() or future.exception() is not None:
+                    # Free the slot once the call really returns
+                    future.add_done_callback(lambda _, release=release: release())
+
+            self.breaker.record_failure()
+            if attempt < self.max_retries:
+                delay = self._backoff(attempt)
+                logger.warning("LLM call attempt %d failed (%s), retrying in %.2fs",
+                               attempt + 1, last_error, delay)
+                count("llm_retry")
+                time.sleep(delay)
+
+        if isinstance(last_error, LLMError):
+            raise last_error
+        raise LLMError(f"LLM call failed: {last_error}") from last_error
+
+    def _acquire(self):
+        """
+        Wait for a concurrency slot.
+
+        Returns:
+            Callable: Releases the slot; later calls do nothing
+        """
+        with self._queued_lock:
+            self._queued += 1
+        try:
+            self._slots.acquire()
+        finally:
+            with self._queued_lock:
+                self._queued -= 1
+
+        released = threading.Event()
+        def release():
+            if not released.is_set():
+                released.set()
+                self._slots.release()
+        return release
+
+    def _with_timeout(self, method, kwargs):
+        """
+        Pass the deadline on to a model method that accepts a timeout, so a
+        call the caller gave up on does not keep running (and holding its slot).
+        """
+        if "timeout" in kwargs or not _accepts_keyword(method, "timeout"):
+            return kwargs
+        return {**kwargs, "timeout": self.timeout}
+
+    def queue_depth(self):
+        """
+        Returns:
+            int: Calls waiting for a free slot under the concurrency cap
+        """
+        return self._queued
+
+    def _backoff(self, attempt):
+        """
+        Full-jitter exponential backoff delay for a retry.
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+
+def _accepts_keyword(method, name):
+    """
+    Check whether a callable takes a keyword argument, by name or through **kwargs.
+    """
+    try:
+        parameters = inspect.signature(method).parameters.values()
+    except (TypeError, ValueError):
+        return False
+    return any(parameter.name == name or parameter.kind is parameter.VAR_KEYWORD
+               for parameter in parameters)
+
+
+def _is_timeout(error):
+    """
+    Check whether an error is a timeout of the model call, e.g. an HTTP read timeout.
+    """
+    return (isinstance(error, (TimeoutError, LLMTimeoutError))
+            or type(error).__name__ in ("Timeout", "ReadTimeout", "ConnectTimeout"))
+
+
+def is_retryable(error):
+    """
+    Decide whether an error is transient and worth retrying.
+
+    Args:
+        error (Exception): The error raised by the model call
+
+    Returns:
+        bool: True for timeouts, connection errors and retryable HTTP statuses
+    """
+    if isinstance(error, ConnectionError) or _is_timeout(error):
+        return True
+
+    # requests exceptions and watsonx ApiRequestFailure carry the HTTP response
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None) or getattr(error, "status_code", None)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+
+    return type(error).__name__ == "ConnectionError"
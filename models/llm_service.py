@@ -3,10 +3,11 @@ Service for interacting with the Llama 3.2 Vision Instruct model.
 """
 
 import logging
-from ibm_watsonx_ai import Credentials
-from ibm_watsonx_ai import APIClient
-from ibm_watsonx_ai.foundation_models import ModelInference
-from ibm_watsonx_ai.foundation_models.schema import TextChatParameters
+import time
+
+from models.llm_client import LLMError, ResilientChatClient
+from utils.helpers import build_basic_response, format_items_description, item_sections
+from utils.metrics import QUEUE_DEPTH, STAGE_SECONDS, count, span
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -18,7 +19,9 @@ class LlamaVisionService:
     """
     
     def __init__(self, model_id, project_id, region="us-south", 
-                 temperature=0.2, top_p=0.6, api_key=None, max_tokens=2000):
+                 temperature=0.2, top_p=0.6, api_key=None, max_tokens=2000, model=None,
+                 timeout=30, max_retries=2, backoff_seconds=0.5, max_concurrency=4,
+                 breaker_failures=5, breaker_reset_seconds=30):
         """
         Initialize the service with the specified model and parameters.
         
@@ -30,28 +33,58 @@ class LlamaVisionService:
             top_p (float): Nucleus sampling parameter
             api_key (str, optional): API key for authentication
             max_tokens (int): Maximum tokens in the response
+            model (optional): Object with a ``chat(messages=...)`` method used instead
+                of a watsonx ModelInference, e.g. a local stub for testing
+            timeout (float): Seconds one LLM call may run (for streams, the wait for each chunk)
+            max_retries (int): Retries of a call failing with a retryable error
+            backoff_seconds (float): Base delay of the jittered exponential backoff
+            max_concurrency (int): Maximum LLM calls in flight at once
+            breaker_failures (int): Consecutive failures before calls are skipped
+            breaker_reset_seconds (float): Seconds calls are skipped before a trial call
         """
-        # Set up authentication credentials
-        credentials = Credentials(
-            url=f"https://{region}.ml.cloud.ibm.com",
-            api_key=api_key
-        )
-        self.client = APIClient(credentials)
-        
-        # Define parameters for the model's behavior
-        params = TextChatParameters(
-            temperature=temperature,
-            top_p=top_p,
-            max_tokens=max_tokens
-        )
+        if model is None:
+            # Imported here so a stubbed service and app startup skip the SDK import
+            from ibm_watsonx_ai import Credentials
+            from ibm_watsonx_ai import APIClient
+            from ibm_watsonx_ai.foundation_models import ModelInference
+            from ibm_watsonx_ai.foundation_models.schema import TextChatParameters
+            
+            # Set up authentication credentials
+            credentials = Credentials(
+                url=f"https://{region}.ml.cloud.ibm.com",
+                api_key=api_key
+            )
+            self.client = APIClient(credentials, **_http_timeout_options(timeout))
+            
+            # Define parameters for the model's behavior
+            params = TextChatParameters(
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens
+            )
+            
+            # Initialize the model inference object on the shared client,
+            # so its authenticated HTTP session is reused across calls
+            model = ModelInference(
+                model_id=model_id,
+                api_client=self.client,
+                project_id=project_id,
+                params=params
+            )
+        else:
+            self.client = None
         
-        # Initialize the model inference object
-        self.model = ModelInference(
-            model_id=model_id,
-            credentials=credentials,
-            project_id=project_id,
-            params=params
+        # Deadlines, retries, a concurrency cap and a circuit breaker around the model
+        self.model = ResilientChatClient(
+            model,
+            timeout=timeout,
+            max_retries=max_retries,
+            backoff_base=backoff_seconds,
+            max_concurrency=max_concurrency,
+            failure_threshold=breaker_failures,
+            reset_timeout=breaker_reset_seconds
         )
+        QUEUE_DEPTH.set_function(self.model.queue_depth, queue="llm_calls")
     
     def generate_response(self, encoded_image, prompt):
         """
@@ -62,32 +95,15 @@ class LlamaVisionService:
             prompt (str): Text prompt to guide the model's response
             
         Returns:
-            str: Model's response
+            str: Model's response, or None if the call failed or the circuit
+                breaker is open
         """
         try:
             logger.info("Sending request to LLM with prompt length: %d", len(prompt))
             
-            # Create the messages object
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": "data:image/jpeg;base64," + encoded_image,
-                            }
-                        }
-                    ]
-                }
-            ]
-            
             # Send the request to the model
-            response = self.model.chat(messages=messages)
+            with span("llm"):
+                response = self.model.chat(messages=self._build_messages(encoded_image, prompt))
             
             # Extract and validate the response
             content = response['choices'][0]['message']['content']
@@ -100,12 +116,82 @@ class LlamaVisionService:
             
             return content
             
-        except Exception as e:
+        except LLMError as e:
             logger.error("Error generating response: %s", str(e))
-            return f"Error generating response: {e}"
+            count("llm_error")
+            return None
+        except (KeyError, IndexError, TypeError) as e:
+            logger.error("Unexpected response format: %s", str(e))
+            count("llm_bad_response")
+            return None
+    
+    def generate_response_stream(self, encoded_image, prompt):
+        """
+        Stream a response from the model based on an image and prompt.
+        
+        Args:
+            encoded_image (str): Base64-encoded image string
+            prompt (str): Text prompt to guide the model's response
+            
+        Yields:
+            str: Pieces of the model's response as they arrive
+            
+        Raises:
+            LLMError: If the call fails or the stream breaks off, possibly
+                after some pieces were already yielded
+        """
+        length = 0
+        start = time.perf_counter()
+        try:
+            logger.info("Streaming request to LLM with prompt length: %d", len(prompt))
+            
+            for chunk in self.model.chat_stream(messages=self._build_messages(encoded_image, prompt)):
+                choices = chunk.get('choices') or [{}]
+                content = (choices[0].get('delta') or {}).get('content')
+                if content:
+                    if not length:
+                        STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm_first_chunk")
+                    length += len(content)
+                    yield content
+            
+            STAGE_SECONDS.observe(time.perf_counter() - start, stage="llm")
+            
+            logger.info("Streamed response with length: %d", length)
+            if length >= 7900:  # Close to common model limits
+                logger.warning("Response may be truncated (length: %d)", length)
+        
+        except Exception as e:
+            logger.error("Error streaming response after %d characters: %s", length, str(e))
+            count("llm_error")
+            if isinstance(e, LLMError):
+                raise
+            raise LLMError(f"Response stream interrupted after {length} characters: {e}") from e
+    
+    def _build_messages(self, encoded_image, prompt):
+        """
+        Create the chat messages object for a prompt and an image.
+        """
+        return [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": prompt
+                    },
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": "data:image/jpeg;base64," + encoded_image,
+                        }
+                    }
+                ]
+            }
+        ]
     
     def generate_fashion_response(self, user_image_base64, matched_row, all_items, 
-                                 similarity_score, threshold=0.8):
+                                 similarity_score, threshold=0.8, items_description=None,
+                                 similar_items_description=None):
         """
         Generate a fashion-specific response using role-based prompts.
         
@@ -115,33 +201,120 @@ class LlamaVisionService:
             all_items: DataFrame with all items related to the matched image
             similarity_score: Similarity score between user and matched images
             threshold: Minimum similarity for considering an exact match
+            items_description (str, optional): Pre-rendered item list, e.g. from
+                the item lookup. Built from all_items when omitted.
+            similar_items_description (str, optional): Pre-rendered list of items
+                from other outfits, e.g. region matches, kept apart from the
+                matched outfit's items
             
         Returns:
             str: Detailed fashion response
         """
         # Generate a simpler list of items with prices and links
-        items_list = []
-        for _, row in all_items.iterrows():
-            item_str = f"{row['Item Name']} (${row['Price']}): {row['Link']}"
-            items_list.append(item_str)
-        
-        # Join items with clear separators
-        items_description = "\n".join([f"- {item}" for item in items_list])
+        if items_description is None:
+            items_description = format_items_description(all_items)
+        sections = item_sections(items_description, similarity_score, threshold, similar_items_description)
 
+        assistant_prompt = self._build_fashion_prompt(sections, similarity_score, threshold)
+        
+        # Send the prompt to the model
+        response = self.generate_response(user_image_base64, assistant_prompt)
+        
+        # Fall back to the item list if the call failed or the response is incomplete
+        if response is None or len(response) < 100:
+            logger.info("Response missing or incomplete, creating basic response")
+            count("response_fallback")
+            # Create a basic response with the item details
+            response = build_basic_response(items_description, similarity_score, threshold,
+                                            similar_items_description)
+        
+        # Ensure the items list is included - this is crucial
+        else:
+            missing = _missing_sections(response, sections)
+            if missing:
+                logger.info("Item details section missing from response")
+                # Append to existing response
+                response += missing
+        
+        return response
+    
+    def generate_fashion_response_stream(self, user_image_base64, matched_row, all_items,
+                                         similarity_score, threshold=0.8, items_description=None,
+                                         similar_items_description=None):
+        """
+        Stream a fashion-specific response, guaranteeing the item section at the end.
+        
+        Takes the same arguments as generate_fashion_response. Once the model
+        stream ends, the item list is appended if the model left it out, or
+        the basic response is appended if the model produced too little or
+        the stream broke off.
+        
+        Yields:
+            str: Pieces of the response
+            
+        Returns:
+            bool: True if the model's answer arrived in full, False if it
+                failed or broke off and the basic response was appended (the
+                generator's return value, i.e. StopIteration.value)
+        """
+        if items_description is None:
+            items_description = format_items_description(all_items)
+        sections = item_sections(items_description, similarity_score, threshold, similar_items_description)
+        assistant_prompt = self._build_fashion_prompt(sections, similarity_score, threshold)
+        
+        streamed = []
+        complete = True
+        try:
+            for chunk in self.generate_response_stream(user_image_base64, assistant_prompt):
+                streamed.append(chunk)
+                yield chunk
+        except LLMError:
+            complete = False
+        response = "".join(streamed)
+        
+        if not complete or len(response) < 100:
+            if complete:
+                logger.info("Streamed response appears incomplete, adding basic response")
+            else:
+                logger.info("Streamed response interrupted, adding basic response")
+            count("response_fallback")
+            separator = "\n\n" if response else ""
+            yield separator + build_basic_response(items_description, similarity_score, threshold,
+                                                   similar_items_description)
+            return False
+        missing = _missing_sections(response, sections)
+        if missing:
+            logger.info("Item details section missing from streamed response")
+            yield missing
+        return True
+    
+    def _build_fashion_prompt(self, sections, similarity_score, threshold):
+        """
+        Build the role-based prompt for an exact or a similar match from its
+        item sections (see item_sections).
+        """
         if similarity_score >= threshold:
+            listed = "".join(f"{header} (always include this section in your response):\n{items}\n\n"
+                             for header, items in sections)
+            include = (
+                "3. Include the ITEM DETAILS section at the end\n\n" if len(sections) == 1 else
+                "3. Include the ITEM DETAILS section and then the SIMILAR ITEMS section at the end\n"
+                "4. Keep the SIMILAR ITEMS apart: they come from other outfits and only resemble parts of this one\n\n"
+            )
             # Simplified prompt focused on professional fashion analysis
             assistant_prompt = (
                 f"You're conducting a professional retail catalog analysis. "
                 f"This image shows standard clothing items available in department stores. "
                 f"Focus exclusively on professional fashion analysis for a clothing retailer. "
-                f"ITEM DETAILS (always include this section in your response):\n{items_description}\n\n"
+                f"{listed}"
                 "Please:\n"
                 "1. Identify and describe the clothing items objectively (colors, patterns, materials)\n"
                 "2. Categorize the overall style (business, casual, etc.)\n"
-                "3. Include the ITEM DETAILS section at the end\n\n"
+                f"{include}"
                 "This is for a professional retail catalog. Use formal, clinical language."
             )
         else:
+            items_description = sections[0][1]
             # Similar approach for non-exact matches
             assistant_prompt = (
                 f"You're conducting a professional retail catalog analysis. "
@@ -154,22 +327,33 @@ class LlamaVisionService:
                 "3. Include the SIMILAR ITEMS section at the end\n\n"
                 "This is for a professional retail catalog. Use formal, clinical language."
             )
-        
-        # Send the prompt to the model
-        response = self.generate_response(user_image_base64, assistant_prompt)
-        
-        # Check if response is incomplete
-        if len(response) < 100:
-            logger.info("Response appears incomplete, creating basic response")
-            # Create a basic response with the item details
-            section_header = "ITEM DETAILS:" if similarity_score >= threshold else "SIMILAR ITEMS:"
-            response = f"# Fashion Analysis\n\nThis outfit features a collection of carefully coordinated pieces.\n\n{section_header}\n{items_description}"
-        
-        # Ensure the items list is included - this is crucial
-        elif "ITEM DETAILS:" not in response and "SIMILAR ITEMS:" not in response:
-            logger.info("Item details section missing from response")
-            # Append to existing response
-            section_header = "ITEM DETAILS:" if similarity_score >= threshold else "SIMILAR ITEMS:"
-            response += f"\n\n{section_header}\n{items_description}"
-        
-        return response
\ No newline at end of file
+        return assistant_prompt
+
+
+def _missing_sections(response, sections):
+    """
+    Render the item sections a response left out, to be appended to it.
+    
+    A lone section counts as present under either header; with separate
+    similar items each header must be there.
+    """
+    if len(sections) == 1 and ("ITEM DETAILS:" in response or "SIMILAR ITEMS:" in response):
+        return ""
+    return "".join(f"\n\n{header}:\n{items}" for header, items in sections
+                   if f"{header}:" not in response)
+
+
+def _http_timeout_options(timeout):
+    """
+    APIClient options capping each HTTP read at the call timeout, so a call the
+    resilient client gave up on is ended by the SDK instead of running on in
+    its worker. SDK versions without HttpClientConfig keep their defaults.
+    """
+    try:
+        import httpx
+        from ibm_watsonx_ai.utils.utils import HttpClientConfig
+    except ImportError:
+        logger.warning("This ibm-watsonx-ai version cannot set an HTTP timeout; "
+                       "timed-out LLM calls run on in the background")
+        return {}
+    return {"httpx_client": HttpClientConfig(timeout=httpx.Timeout(timeout, connect=10))}
@@ -0,0 +1,145 @@
+"""
+Module for the fast image preprocessing path of the encoder.
+
+The standard torchvision pipeline converts every image to a float tensor,
+divides by 255 and normalizes it in separate passes. The fast path resizes
+in uint8 with PIL and copies the pixels once into a batch buffer. The
+mean/std normalization is folded into the first convolution of the model,
+so the model takes raw 0-255 pixel values.
+
+The model's zero padding would become padding with black pixels once the
+normalization is folded in. So the buffer carries the padding itself, a
+border filled with the mean pixel (zero after normalization). The first
+convolution then runs without padding and gives the same output as before.
+"""
+
+import threading
+
+import numpy as np
+import torch
+from PIL import Image
+
+def fold_normalization(model, norm_mean, norm_std):
+    """
+    Fold input normalization into the first convolution of a ResNet.
+
+    After folding, the model expects raw pixel values (0-255) that are
+    already padded by the returned amount, as produced by FastPreprocessor.
+
+    Args:
+        model (torch.nn.Module): ResNet with a ``conv1`` layer, modified in place
+        norm_mean (list): Normalization mean per RGB channel (0-1 scale)
+        norm_std (list): Normalization standard deviation per RGB channel (0-1 scale)
+
+    Returns:
+        int: Padding the inputs must carry on each side
+    """
+    conv = model.conv1
+    padding = conv.padding[0]
+    mean = torch.tensor(norm_mean, dtype=torch.float32) * 255
+    std = torch.tensor(norm_std, dtype=torch.float32) * 255
+
+    # conv((x - mean) / std) == conv'(x) with W' = W / std and b' = b - sum(W' * mean)
+    weight = conv.weight.detach() / std.view(1, -1, 1, 1)
+    bias = -(weight * mean.view(1, -1, 1, 1)).sum(dim=(1, 2, 3))
+    if conv.bias is not None:
+        bias += conv.bias.detach()
+
+    folded = torch.nn.Conv2d(
+        conv.in_channels, conv.out_channels, conv.kernel_size,
+        stride=conv.stride, padding=0, dilation=conv.dilation, groups=conv.groups, bias=True
+    )
+    with torch.no_grad():
+        folded.weight.copy_(weight)
+        folded.bias.copy_(bias)
+    model.conv1 = folded
+    return padding
+
+
+class FastPreprocessor:
+    """
+    Turns PIL images into raw-pixel, mean-padded model inputs for a model
+    whose normalization was folded in by fold_normalization.
+
+    Called with one image it returns a (3, H + 2p, W + 2p) tensor like the
+    torchvision pipeline. ``batch`` writes several images straight into a
+    reusable per-thread buffer (pinned when CUDA is available).
+    """
+
+    def __init__(self, image_size=(224, 224), norm_mean=(0.485, 0.456, 0.406), padding=3,
+                 reducing_gap=None):
+        """
+        Args:
+            image_size (tuple): Target (height, width)
+            norm_mean (list): Normalization mean per RGB channel, the padding value
+            padding (int): Border width expected by the folded model
+            reducing_gap (float, optional): Let PIL shrink large images with a fast
+                box reduction first (see Image.resize). None keeps the exact bilinear
+                resize of the torchvision pipeline.
+        """
+        self.height, self.width = image_size
+        self.padding = padding
+        self.reducing_gap = reducing_gap
+        self.fill = torch.tensor(norm_mean, dtype=torch.float32).view(3, 1, 1) * 255
+        self.pin_memory = torch.cuda.is_available()
+        self._local = threading.local()
+
+    def __call__(self, image):
+        out = self._new_buffer(1)
+        self._write(image, out[0])
+        return out[0]
+
+    def batch(self, images):
+        """
+        Preprocess images into the thread's reusable batch buffer.
+
+        Args:
+            images (list): RGB PIL images
+
+        Returns:
+            Tensor: View of shape (len(images), 3, H + 2p, W + 2p), valid until
+                the next call from the same thread
+        """
+        buffer = getattr(self._local, "buffer", None)
+        if buffer is None or len(buffer) < len(images):
+            buffer = self._local.buffer = self._new_buffer(len(images))
+        for i, image in enumerate(images):
+            self._write(image, buffer[i])
+        return buffer[:len(images)]
+
+    def _new_buffer(self, size):
+        p = self.padding
+        buffer = torch.empty(size, 3, self.height + 2 * p, self.width + 2 * p,
+                             pin_memory=self.pin_memory)
+        buffer[:] = self.fill  # The border keeps the mean pixel; the centre is overwritten
+        return buffer
+
+    def _write(self, image, out):
+        resized = image.resize((self.width, self.height), Image.BILINEAR,
+                               reducing_gap=self.reducing_gap)
+        pixels = torch.from_numpy(np.array(resized))  # uint8 (H, W, 3), writable for torch
+        p = self.padding
+        # A single pass converts to float and transposes into the buffer
+        out[:, p:p + self.height, p:p + self.width].copy_(pixels.permute(2, 0, 1))
+
+
+def draft_for_size(image, max_side):
+    """
+    Let the JPEG decoder downscale an image that is not decoded yet.
+
+    JPEG decoding can skip detail by a factor of 2, 4 or 8 at almost no cost.
+    The image keeps at least ``max_side`` pixels on its longest side, so the
+    reduced image is still big enough for both the model input and the
+    image sent to the LLM.
+
+    Args:
+        image (PIL.Image.Image): Image returned by Image.open, not yet loaded
+        max_side (int): Longest side the result must keep
+
+    Returns:
+        PIL.Image.Image: The same image object
+    """
+    if image.format == "JPEG" and max(image.size) > max_side:
+        scale = max_side / max(image.size)
+        image.draft("RGB", (int(image.width * scale), int(image.height * scale)))
+    return image
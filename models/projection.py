@@ -0,0 +1,89 @@
+"""
+Module for the PCA projection used to compact image embeddings.
+"""
+
+import numpy as np
+
+class PCAProjection:
+    """
+    Linear projection of embeddings onto their top principal components.
+    """
+
+    def __init__(self, mean, components):
+        """
+        Initialize the projection from fitted parameters.
+
+        Args:
+            mean: Mean embedding of shape (dim,)
+            components: Principal axes of shape (n_components, dim)
+        """
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.components = np.ascontiguousarray(components, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, vectors, n_components):
+        """
+        Fit the projection on a matrix of embeddings.
+
+        Args:
+            vectors: Array of shape (n, dim) with one embedding per row
+            n_components (int): Number of dimensions to keep
+
+        Returns:
+            PCAProjection: The fitted projection
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if n_components > min(vectors.shape):
+            raise ValueError(
+                f"Cannot fit {n_components} components on {vectors.shape[0]} "
+                f"vectors of dimension {vectors.shape[1]}"
+            )
+        mean = vectors.mean(axis=0)
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        return cls(mean, vt[:n_components])
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load a projection saved with save().
+
+        Args:
+            path (str): Path to the .npz file
+
+        Returns:
+            PCAProjection: The loaded projection
+        """
+        with np.load(path) as data:
+            return cls(data["mean"], data["components"])
+
+    def save(self, path):
+        """
+        Save the projection to a .npz file.
+
+        Args:
+            path (str): Destination path
+        """
+        np.savez(path, mean=self.mean, components=self.components)
+
+    @property
+    def input_dim(self):
+        """int: Dimensionality of the embeddings the projection accepts."""
+        return self.components.shape[1]
+
+    @property
+    def output_dim(self):
+        """int: Dimensionality of the projected embeddings."""
+        return self.components.shape[0]
+
+    def transform(self, vectors):
+        """
+        Project one embedding or a matrix of embeddings.
+
+        Args:
+            vectors: Array of shape (dim,) or (n, dim)
+
+        Returns:
+            ndarray: Projected float32 array of shape (n_components,) or (n, n_components)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return (vectors - self.mean) @ self.components.T
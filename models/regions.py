@@ -0,0 +1,164 @@
+"""
+Module for splitting outfit photos into garment regions and matching them.
+
+Crops are found with cheap image heuristics on the CPU, so no detection
+model is needed.
+"""
+
+import numpy as np
+
+# Supported ways of choosing garment regions
+CROP_MODES = ("grid", "saliency")
+
+def grid_crops(image, rows=3, cols=1, overlap=0.15):
+    """
+    Split an image into an overlapping grid of boxes.
+
+    Args:
+        image (PIL.Image.Image): Image to split
+        rows (int): Horizontal bands, top to bottom
+        cols (int): Vertical bands, left to right
+        overlap (float): Fraction of a cell each box extends into its neighbours
+
+    Returns:
+        list: (left, top, right, bottom) boxes in pixels
+    """
+    return _split_box((0, 0, image.width, image.height), rows, cols, overlap)
+
+
+def saliency_crops(image, count=3, overlap=0.15, work_size=64):
+    """
+    Find the salient subject of a photo and split it into stacked regions.
+
+    Saliency is the colour distance to the median border colour plus the
+    local gradient, computed on a small copy. The box around the salient mass
+    is split into ``count`` horizontal bands, which for a standing person
+    roughly separates upper body, lower body and shoes.
+
+    Args:
+        image (PIL.Image.Image): RGB image
+        count (int): Number of stacked regions
+        overlap (float): Fraction of a band each box extends into its neighbours
+        work_size (int): Longest side of the copy the saliency is computed on
+
+    Returns:
+        list: (left, top, right, bottom) boxes in pixels
+    """
+    small = image.copy()
+    small.thumbnail((work_size, work_size))
+    pixels = np.asarray(small, dtype=np.float32)
+
+    border = np.concatenate([pixels[0], pixels[-1], pixels[:, 0], pixels[:, -1]])
+    distance = np.linalg.norm(pixels - np.median(border, axis=0), axis=2)
+    gray = pixels.mean(axis=2)
+    gradient = np.zeros_like(gray)
+    gradient[:, 1:] += np.abs(np.diff(gray, axis=1))
+    gradient[1:, :] += np.abs(np.diff(gray, axis=0))
+    saliency = distance + gradient
+
+    mask = saliency > saliency.mean()
+    if not mask.any():
+        return grid_crops(image, rows=count, overlap=overlap)
+
+    # Box holding the central 96% of the salient mass along each axis
+    scale_x = image.width / small.width
+    scale_y = image.height / small.height
+    left, right = _mass_bounds(mask.sum(axis=0))
+    top, bottom = _mass_bounds(mask.sum(axis=1))
+    box = (int(left * scale_x), int(top * scale_y),
+           int(np.ceil((right + 1) * scale_x)), int(np.ceil((bottom + 1) * scale_y)))
+    return _split_box(box, count, 1, overlap)
+
+
+def crop_regions(image, mode="saliency", count=3, overlap=0.15):
+    """
+    Choose garment regions of an image with the given method.
+
+    Args:
+        image (PIL.Image.Image): RGB image
+        mode (str): "grid" or "saliency"
+        count (int): Number of regions
+        overlap (float): Fraction of a region each box extends into its neighbours
+
+    Returns:
+        list: (left, top, right, bottom) boxes in pixels
+    """
+    if mode == "grid":
+        return grid_crops(image, rows=count, overlap=overlap)
+    if mode == "saliency":
+        return saliency_crops(image, count=count, overlap=overlap)
+    raise ValueError(f"Unknown crop mode '{mode}', expected one of {CROP_MODES}")
+
+
+def match_regions(region_vectors, index, k=10, min_score=None, allowed=None):
+    """
+    Search every region embedding against the index in turn.
+
+    Args:
+        region_vectors (list): One embedding per region
+        index (EmbeddingIndex): Index over the catalog rows
+        k (int): Matches kept per region
+        min_score (float, optional): Minimum similarity for a match
+        allowed (ndarray, optional): Boolean mask over the index positions
+            restricting the candidates
+
+    Returns:
+        list: One (row_ids, scores) pair per region
+    """
+    return [index.search(vector, k=k, min_score=min_score, allowed=allowed) for vector in region_vectors]
+
+
+def aggregate_region_matches(region_matches, per_region=3, exclude=None):
+    """
+    Merge per-region matches into one result list per garment region.
+
+    A catalog row matched by several regions is assigned to the region that
+    scores it highest, so each item is reported once, under the garment it
+    resembles most.
+
+    Args:
+        region_matches (list): Result of match_regions
+        per_region (int): Rows kept per region
+        exclude (iterable, optional): Row ids left out, e.g. the whole-image match
+
+    Returns:
+        list: One list of (row_id, score) tuples per region, best first
+    """
+    exclude = set(exclude) if exclude is not None else set()
+    best = {}
+    for region, (row_ids, scores) in enumerate(region_matches):
+        for row_id, score in zip(row_ids.tolist(), scores.tolist()):
+            if row_id in exclude:
+                continue
+            if row_id not in best or score > best[row_id][1]:
+                best[row_id] = (region, score)
+
+    regions = [[] for _ in region_matches]
+    for row_id, (region, score) in best.items():
+        regions[region].append((row_id, score))
+    return [sorted(rows, key=lambda item: -item[1])[:per_region] for rows in regions]
+
+
+def _split_box(box, rows, cols, overlap):
+    left, top, right, bottom = box
+    cell_w = (right - left) / cols
+    cell_h = (bottom - top) / rows
+    pad_w = cell_w * overlap
+    pad_h = cell_h * overlap
+    boxes = []
+    for row in range(rows):
+        for col in range(cols):
+            boxes.append((
+                int(max(left, left + col * cell_w - pad_w)),
+                int(max(top, top + row * cell_h - pad_h)),
+                int(min(right, left + (col + 1) * cell_w + pad_w)),
+                int(min(bottom, top + (row + 1) * cell_h + pad_h)),
+            ))
+    return boxes
+
+
+def _mass_bounds(profile, tail=0.02):
+    cumulative = np.cumsum(profile) / profile.sum()
+    low = int(np.searchsorted(cumulative, tail))
+    high = int(np.searchsorted(cumulative, 1 - tail))
+    return low, min(high, len(profile) - 1)
@@ -0,0 +1,188 @@
+"""
+Module for the compact on-disk vector store loaded with memory mapping.
+
+A store written under a path prefix consists of:
+
+- ``<prefix>.codes.npy``: the (possibly quantized) embedding matrix
+- ``<prefix>.index.npz``: row ids and the fitted quantization parameters
+- ``<prefix>.items.arrow``: the catalog metadata without the Embedding column,
+  as an uncompressed Arrow IPC file
+- ``<prefix>.json``: encoding name and shapes
+
+Both the codes and the metadata columns are memory-mapped, so every process
+loading the same store shares one page-cached copy instead of deserializing
+its own, and a metadata column is only read for the rows actually used
+(e.g. the names and links of the matched items). Unlike a pickle, loading a
+store never runs code from the file.
+
+The encoding trades memory against search speed (50k x 1000 synthetic
+vectors, one query on one core): float32 takes 4000 bytes per vector and
+17 ms; int8, the default, 1000 bytes and 27 ms at recall@10 0.98; float16
+2000 bytes but 140 ms, as every block is converted to float32 before
+scoring, so it only pays off where the store size on disk matters more
+than latency; pq is the smallest and fastest but loses most of the recall
+(0.09 at 8 subspaces). benchmarks/quantization.py measures other shapes.
+
+Stores written before the Arrow metadata have ``<prefix>.items.pkl``
+instead; they still load, and scripts/build_vector_store.py --migrate
+rewrites their metadata.
+"""
+
+import hashlib
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from models.embedding_index import EmbeddingIndex, QuantizedIndex, INDEX_BACKENDS
+from models.filters import infer_categories
+
+logger = logging.getLogger(__name__)
+
+STORE_ENCODINGS = ("float32", "float16", "int8", "pq")
+
+
+def save_vector_store(prefix, dataset, encoding="int8", column="Embedding", **kwargs):
+    """
+    Write a dataset as a compact vector store.
+
+    Args:
+        prefix (str): Path prefix for the store files
+        dataset (DataFrame): Dataset containing precomputed feature vectors
+        encoding (str): One of STORE_ENCODINGS; see the module docstring for
+            the memory and speed of each
+        column (str): Name of the column holding the embeddings
+        **kwargs: Encoding-specific options, e.g. n_subspaces for "pq"
+
+    Returns:
+        EmbeddingIndex: The in-memory index that was written
+    """
+    if encoding not in STORE_ENCODINGS:
+        raise ValueError(f"Unknown encoding '{encoding}', expected one of {STORE_ENCODINGS}")
+
+    backend = "exact" if encoding == "float32" else encoding
+    index = INDEX_BACKENDS[backend].from_dataframe(dataset, column=column, **kwargs)
+    if isinstance(index, QuantizedIndex):
+        codes, params = index.codes, index.params
+    else:
+        codes, params = index.matrix, {}
+
+    np.save(f"{prefix}.codes.npy", np.ascontiguousarray(codes))
+    np.savez(f"{prefix}.index.npz", row_ids=index.row_ids, **params)
+    save_items(prefix, dataset.drop(columns=[column]))
+
+    with open(f"{prefix}.json", "w") as f:
+        json.dump({
+            "encoding": encoding,
+            "rows": len(dataset),
+            "vectors": len(index),
+            "dim": index.dim,
+            "code_dtype": str(codes.dtype),
+            "code_shape": list(codes.shape),
+        }, f, indent=2)
+    return index
+
+
+def load_vector_store(prefix, mmap=True):
+    """
+    Load a vector store written by save_vector_store().
+
+    Args:
+        prefix (str): Path prefix of the store files
+        mmap (bool): Memory-map the codes instead of reading them into memory
+
+    Returns:
+        tuple: (metadata DataFrame, EmbeddingIndex)
+    """
+    with open(f"{prefix}.json") as f:
+        meta = json.load(f)
+
+    codes = np.load(f"{prefix}.codes.npy", mmap_mode="r" if mmap else None)
+    with np.load(f"{prefix}.index.npz") as arrays:
+        row_ids = arrays["row_ids"]
+        params = {name: arrays[name] for name in arrays.files if name != "row_ids"}
+
+    encoding = meta["encoding"]
+    if encoding == "float32":
+        # Rows were normalized before saving, so wrap them without copying
+        index = EmbeddingIndex.from_normalized(codes, row_ids)
+    else:
+        index = INDEX_BACKENDS[encoding].from_codes(codes, row_ids, meta["dim"], **params)
+
+    return load_items(prefix), index
+
+
+def store_fingerprint(prefix):
+    """
+    Identify the files of a store by path, size and modification time.
+
+    Rebuilding or replacing any file changes the fingerprint, without reading
+    the files. A prefix without store files is taken as a single file, such
+    as a pickled dataset.
+
+    Args:
+        prefix (str): Path prefix of the store files, or a file path
+
+    Returns:
+        str: Hex digest
+    """
+    paths = [prefix + suffix for suffix in (".json", ".codes.npy", ".index.npz", ".items.arrow", ".items.pkl")]
+    paths = [path for path in paths if os.path.exists(path)] or [prefix]
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{os.path.abspath(path)}\n{stat.st_size}\n{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def save_items(prefix, items):
+    """
+    Write catalog metadata as ``<prefix>.items.arrow``.
+
+    A Category column is inferred from the item names when missing, so the
+    category filter reads one short column instead of every name.
+
+    Args:
+        prefix (str): Path prefix of the store files
+        items (DataFrame): Catalog metadata without embeddings
+    """
+    items = items.reset_index(drop=True)
+    if "Category" not in items.columns and "Item Name" in items.columns:
+        items = items.assign(Category=infer_categories(items["Item Name"]))
+
+    columns = {}
+    for name in items.columns:
+        try:
+            columns[str(name)] = pa.array(items[name], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed Python types (e.g. prices as numbers and strings) are stored as strings
+            values = items[name]
+            columns[str(name)] = pa.array(values.where(values.isna(), values.astype(str)), from_pandas=True)
+    table = pa.table(columns)
+
+    # Uncompressed, so the columns can be memory-mapped and read row by row
+    with pa.OSFile(f"{prefix}.items.arrow", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def load_items(prefix):
+    """
+    Open the catalog metadata of a store without reading it.
+
+    Returns:
+        DataFrame: Metadata backed by the memory-mapped Arrow columns
+            (pandas ArrowDtype), or unpickled from a store in the old format
+    """
+    path = f"{prefix}.items.arrow"
+    if not os.path.exists(path):
+        logger.warning("Vector store %s has pickled metadata; rewrite it with "
+                       "scripts/build_vector_store.py --migrate", prefix)
+        return pd.read_pickle(f"{prefix}.items.pkl")
+
+    # The table keeps the memory map open for as long as the DataFrame lives
+    table = pa.ipc.open_file(pa.memory_map(path)).read_all()
+    return table.to_pandas(types_mapper=pd.ArrowDtype)
@@ -0,0 +1,279 @@
+"""
+Offline pipeline that embeds a catalog and writes the dataset used by the app.
+
+The catalog is a CSV or Parquet file with the columns Item Name, Price, Link
+and Image URL. Several items can share one outfit image, so each distinct
+image is embedded once. Images are fetched and decoded in worker processes
+and run through the ResNet50 model in batches in the main process.
+
+Usage:
+    python -m scripts.build_embeddings catalog.csv --output swift-style-embeddings.pkl
+    python -m scripts.build_embeddings catalog.parquet --image-dir images/ --workers 8
+
+Re-running against an existing output only embeds images that are new or
+whose content changed, so it must be built with the same --head. An interrupted run resumes from its checkpoint file.
+"""
+
+import argparse
+import hashlib
+import os
+import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+import requests
+from PIL import Image
+
+import config
+
+CATALOG_COLUMNS = ["Item Name", "Price", "Link", "Image URL"]
+
+# Per-process state set up by _init_worker
+_worker_preprocess = None
+_worker_image_dir = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed a catalog and write the app dataset.")
+    parser.add_argument("catalog", help="CSV or Parquet catalog file")
+    parser.add_argument("--output", default="swift-style-embeddings.pkl",
+                        help="Dataset file to write (also read for incremental updates)")
+    parser.add_argument("--image-dir",
+                        help="Directory holding the catalog images, named after the last "
+                             "path segment of each Image URL, used instead of downloading")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Worker processes fetching and decoding images")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per forward pass")
+    parser.add_argument("--checkpoint-every", type=int, default=10,
+                        help="Save progress after this many batches")
+    parser.add_argument("--head", default=config.EMBEDDING_HEAD, choices=["pooled", "logits"],
+                        help="Model output used as the embedding")
+    parser.add_argument("--full", action="store_true",
+                        help="Ignore the existing output and re-embed every image")
+    parser.add_argument("--threads", type=int, default=config.ENCODER_THREADS,
+                        help="Torch intra-op threads for the forward passes")
+    args = parser.parse_args()
+
+    from models.inference import configure_threads
+    configure_threads(args.threads)
+
+    catalog = load_catalog(args.catalog)
+    build_embeddings(
+        catalog,
+        output_path=args.output,
+        image_dir=args.image_dir,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        checkpoint_every=args.checkpoint_every,
+        incremental=not args.full,
+        embedding_head=args.head
+    )
+
+
+def load_catalog(path):
+    """
+    Read a catalog file and check that it has the expected columns.
+
+    Args:
+        path (str): Path to a .csv or .parquet file
+
+    Returns:
+        DataFrame: The catalog rows
+    """
+    if path.endswith(".parquet"):
+        catalog = pd.read_parquet(path)
+    elif path.endswith(".csv"):
+        catalog = pd.read_csv(path)
+    else:
+        raise ValueError(f"Unsupported catalog format: {path}")
+
+    missing = [column for column in CATALOG_COLUMNS if column not in catalog.columns]
+    if missing:
+        raise ValueError(f"Catalog is missing columns: {', '.join(missing)}")
+    return catalog
+
+
+def build_embeddings(catalog, output_path, image_dir=None, workers=None, batch_size=32,
+                     checkpoint_every=10, incremental=True, embedding_head="logits"):
+    """
+    Embed every distinct catalog image and write the dataset file.
+
+    Args:
+        catalog (DataFrame): Catalog rows with the CATALOG_COLUMNS
+        output_path (str): Dataset file to write
+        image_dir (str, optional): Local directory standing in for the image URLs
+        workers (int, optional): Number of decoding worker processes
+        batch_size (int): Images per forward pass
+        checkpoint_every (int): Batches between checkpoint saves
+        incremental (bool): Reuse embeddings of unchanged images from the existing output
+        embedding_head (str): Model output used as the embedding, "pooled" or "logits"
+
+    Returns:
+        DataFrame: The written dataset
+    """
+    from models.image_processor import ImageProcessor
+
+    checkpoint_path = output_path + ".partial"
+    known = _load_existing(output_path) if incremental else {}
+
+    # Images finished by an interrupted run are taken from the checkpoint
+    done = {}
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "rb") as f:
+            done = pickle.load(f)
+        print(f"Resuming from checkpoint with {len(done)} images")
+
+    urls = [url for url in catalog["Image URL"].dropna().unique() if url not in done]
+    jobs = [(url, known.get(url, (None, None))[1]) for url in urls]
+    print(f"{len(done)} images done, {len(jobs)} to check ({len(known)} in existing output)")
+
+    processor = ImageProcessor(
+        image_size=config.IMAGE_SIZE,
+        norm_mean=config.NORMALIZATION_MEAN,
+        norm_std=config.NORMALIZATION_STD,
+        embedding_head=embedding_head,
+        weights_path=config.ENCODER_WEIGHTS_PATH
+    )
+
+    pending = []
+    batches = 0
+    reused = 0
+    failed = 0
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(config.IMAGE_SIZE, config.NORMALIZATION_MEAN, config.NORMALIZATION_STD, image_dir)
+    ) as pool:
+        for url, image_hash, pixels, error in _map_windowed(pool, jobs, batch_size * 4):
+            if error is not None:
+                print(f"Skipping {url}: {error}")
+                failed += 1
+            elif pixels is None:
+                # Content unchanged since the existing output was written
+                done[url] = (image_hash, known[url][0])
+                reused += 1
+            else:
+                pending.append((url, image_hash, pixels))
+
+            if len(pending) >= batch_size:
+                _embed_pending(processor, pending, done)
+                batches += 1
+                if batches % checkpoint_every == 0:
+                    _write_atomic(checkpoint_path, done)
+                    print(f"Embedded {len(done)} images "
+                          f"({len(done) / (time.perf_counter() - start):.1f} images/s)")
+
+        _embed_pending(processor, pending, done)
+
+    dataset = catalog.copy()
+    dataset["Embedding"] = dataset["Image URL"].map(lambda url: _lookup(done, url, 1))
+    dataset["Image Hash"] = dataset["Image URL"].map(lambda url: _lookup(done, url, 0))
+
+    _write_atomic(output_path, dataset)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+
+    print(f"Wrote {len(dataset)} rows to {output_path}: {len(done) - reused} embedded, "
+          f"{reused} reused, {failed} failed in {time.perf_counter() - start:.1f}s")
+    return dataset
+
+
+def _load_existing(output_path):
+    """
+    Map image URLs of an existing dataset to their (embedding, content hash).
+    """
+    if not os.path.exists(output_path):
+        return {}
+    existing = pd.read_pickle(output_path)
+    hashes = existing["Image Hash"] if "Image Hash" in existing.columns else [None] * len(existing)
+
+    known = {}
+    for url, embedding, image_hash in zip(existing["Image URL"], existing["Embedding"], hashes):
+        if isinstance(embedding, np.ndarray) and url not in known:
+            known[url] = (embedding, image_hash)
+    return known
+
+
+def _init_worker(image_size, norm_mean, norm_std, image_dir):
+    global _worker_preprocess, _worker_image_dir
+    from models.image_processor import build_preprocess
+
+    _worker_preprocess = build_preprocess(image_size, norm_mean, norm_std)
+    _worker_image_dir = image_dir
+
+
+def _load_job(job):
+    """
+    Fetch, hash and preprocess one image in a worker process.
+
+    Returns:
+        tuple: (url, content hash, preprocessed pixels or None if unchanged, error or None)
+    """
+    url, known_hash = job
+    try:
+        if _worker_image_dir:
+            name = os.path.basename(urlparse(url).path)
+            with open(os.path.join(_worker_image_dir, name), "rb") as f:
+                content = f.read()
+        else:
+            response = requests.get(url, timeout=30)
+            response.raise_for_status()
+            content = response.content
+
+        image_hash = hashlib.sha1(content).hexdigest()
+        if image_hash == known_hash:
+            return url, image_hash, None, None
+
+        image = Image.open(BytesIO(content)).convert("RGB")
+        return url, image_hash, _worker_preprocess(image).numpy(), None
+    except Exception as e:
+        return url, None, None, e
+
+
+def _map_windowed(pool, jobs, window):
+    """
+    Map jobs over the pool a window at a time, so decoded images never pile
+    up in memory faster than the model consumes them.
+    """
+    for offset in range(0, len(jobs), window):
+        yield from pool.map(_load_job, jobs[offset:offset + window], chunksize=4)
+
+
+def _embed_pending(processor, pending, done):
+    """
+    Run the queued images through the model and record their embeddings.
+    """
+    import torch
+
+    if not pending:
+        return
+    batch = torch.from_numpy(np.stack([pixels for _, _, pixels in pending]))
+    vectors = processor.extract_features(batch)
+    for (url, image_hash, _), vector in zip(pending, vectors):
+        done[url] = (image_hash, vector)
+    pending.clear()
+
+
+def _lookup(done, url, field):
+    entry = done.get(url)
+    return None if entry is None else entry[field]
+
+
+def _write_atomic(path, obj):
+    """
+    Pickle an object to a temporary file and move it into place.
+    """
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Convert a pickled dataset into a compact, memory-mappable vector store.
+
+The store keeps the metadata columns in an Arrow file and the embeddings in
+a separate raw array, so the app never unpickles anything. Run this once on
+a trusted pickle; the app then loads only the store.
+
+Usage:
+    python -m scripts.build_vector_store swift-style-embeddings.pkl
+    python -m scripts.build_vector_store swift-style-embeddings.pkl --encoding pq --subspaces 8
+    python -m scripts.build_vector_store swift-style-embeddings.int8 --migrate
+
+--migrate rewrites the pickled metadata of a store built by an older version
+as Arrow, leaving its embeddings untouched.
+
+The app loads the store when VECTOR_STORE_PATH in config.py is set to the prefix.
+"""
+
+import argparse
+import os
+
+import pandas as pd
+
+from models.vector_store import STORE_ENCODINGS, save_items, save_vector_store
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a dataset into a vector store.")
+    parser.add_argument("dataset", help="Pickled dataset with an Embedding column, or with "
+                                        "--migrate the path prefix of an existing store")
+    parser.add_argument("--encoding", default="int8", choices=STORE_ENCODINGS,
+                        help="Vector encoding (default: int8, see models/vector_store.py)")
+    parser.add_argument("--prefix", help="Output path prefix (default: <dataset>.<encoding>)")
+    parser.add_argument("--subspaces", type=int, default=8,
+                        help="Product quantization subspaces (bytes per vector)")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Rewrite the pickled metadata of an existing store as Arrow")
+    args = parser.parse_args()
+
+    if args.migrate:
+        legacy = f"{args.dataset}.items.pkl"
+        items = pd.read_pickle(legacy)
+        save_items(args.dataset, items)
+        os.remove(legacy)
+        print(f"Wrote the metadata of {len(items)} items to {args.dataset}.items.arrow")
+        return
+
+    prefix = args.prefix or f"{os.path.splitext(args.dataset)[0]}.{args.encoding}"
+    options = {"n_subspaces": args.subspaces} if args.encoding == "pq" else {}
+
+    dataset = pd.read_pickle(args.dataset)
+    index = save_vector_store(prefix, dataset, encoding=args.encoding, **options)
+
+    size = os.path.getsize(f"{prefix}.codes.npy")
+    print(f"Wrote {len(index)} vectors of dimension {index.dim} to {prefix}.* "
+          f"({size / len(index):.0f} bytes per vector)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Export the image encoder as a frozen TorchScript file for fast startup.
+
+Traces ResNet50 with the configured embedding head and inference mode,
+freezes it and saves it with its metadata. Point ENCODER_TORCHSCRIPT_PATH in
+config.py at the output to load it instead of building the model from
+torchvision at startup. An int8 export is calibrated once here, so the app
+needs no calibration images.
+
+Usage:
+    python -m scripts.export_encoder --weights resnet50.pth --output encoder.ts
+    python -m scripts.export_encoder --mode int8 --calibration-dir catalog-images --output encoder-int8.ts
+"""
+
+import argparse
+import json
+import time
+
+import torch
+from PIL import Image
+
+import config
+from models.image_processor import ENCODER_METADATA_FILE, EMBEDDING_HEADS, ImageProcessor
+from models.inference import INFERENCE_MODES, list_calibration_images, prepare_input
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the image encoder as TorchScript.")
+    parser.add_argument("--output", default="encoder.ts", help="TorchScript file to write")
+    parser.add_argument("--weights", default=config.ENCODER_WEIGHTS_PATH,
+                        help="Local ResNet50 state dict (default: the pretrained weights)")
+    parser.add_argument("--head", default=config.EMBEDDING_HEAD, choices=EMBEDDING_HEADS,
+                        help="Model output used as the embedding")
+    parser.add_argument("--mode", default=config.ENCODER_INFERENCE_MODE, choices=INFERENCE_MODES,
+                        help="Inference mode to export")
+    parser.add_argument("--calibration-dir", default=config.ENCODER_CALIBRATION_DIR,
+                        help="Catalog images calibrating the int8 mode")
+    parser.add_argument("--calibration-images", type=int, default=config.ENCODER_CALIBRATION_IMAGES)
+    parser.add_argument("--fast-preprocess", action="store_true", default=config.FAST_PREPROCESSING,
+                        help="Fold the input normalization into the model for the fast preprocessing path")
+    args = parser.parse_args()
+
+    calibration_images = None
+    if args.mode == "int8":
+        if not args.calibration_dir:
+            parser.error("--mode int8 needs --calibration-dir")
+        calibration_images = list_calibration_images(args.calibration_dir, args.calibration_images)
+
+    processor = ImageProcessor(
+        image_size=config.IMAGE_SIZE,
+        norm_mean=config.NORMALIZATION_MEAN,
+        norm_std=config.NORMALIZATION_STD,
+        embedding_head=args.head,
+        weights_path=args.weights,
+        inference_mode=args.mode,
+        calibration_images=calibration_images,
+        fast_preprocess=args.fast_preprocess
+    )
+    model = processor.model
+    blank = processor.preprocess_batch([Image.new("RGB", config.IMAGE_SIZE[::-1])]).clone()
+    example = prepare_input(blank.to(processor.device), args.mode)
+    with torch.no_grad():
+        frozen = torch.jit.freeze(torch.jit.trace(model, example))
+
+        # Check the export against the converted model on a random batch
+        batch = prepare_input(example + torch.randn(4, *example.shape[1:], device=processor.device),
+                              args.mode)
+        drift = (frozen(batch) - model(batch)).abs().max().item()
+
+    metadata = {"embedding_head": args.head, "inference_mode": args.mode,
+                "fast_preprocess": args.fast_preprocess,
+                "input_padding": getattr(processor.preprocess, "padding", 0),
+                "image_size": list(config.IMAGE_SIZE)}
+    torch.jit.save(frozen, args.output, _extra_files={ENCODER_METADATA_FILE: json.dumps(metadata)})
+
+    start = time.perf_counter()
+    torch.jit.load(args.output)
+    print(f"Wrote {args.output} ({args.head} head, {args.mode}, max abs difference {drift:.2e}), "
+          f"loads in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Fit a PCA projection on the dataset embeddings and write a compact dataset.
+
+The projection is saved next to the dataset so the app can apply the same
+transform to query embeddings (see PCA_PROJECTION_PATH in config.py).
+
+Usage:
+    python -m scripts.fit_projection swift-style-embeddings.pkl --components 256
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from models.projection import PCAProjection
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit a PCA projection on dataset embeddings.")
+    parser.add_argument("dataset", help="Pickled dataset with an Embedding column")
+    parser.add_argument("--components", type=int, default=256, help="Dimensions to keep")
+    parser.add_argument("--projection", help="Where to save the projection "
+                                             "(default: <dataset>.pca<components>.npz)")
+    parser.add_argument("--output", help="Where to write the projected dataset "
+                                         "(default: <dataset>.pca<components>.pkl)")
+    args = parser.parse_args()
+
+    stem = os.path.splitext(args.dataset)[0]
+    projection_path = args.projection or f"{stem}.pca{args.components}.npz"
+    output_path = args.output or f"{stem}.pca{args.components}.pkl"
+
+    dataset = pd.read_pickle(args.dataset)
+    has_embedding = dataset["Embedding"].notna()
+    vectors = np.vstack(dataset.loc[has_embedding, "Embedding"].map(np.ravel).values)
+
+    # Fit on distinct vectors so outfits with many items do not dominate
+    unique_vectors = np.unique(vectors, axis=0)
+    projection = PCAProjection.fit(unique_vectors, args.components)
+    projection.save(projection_path)
+
+    centered = unique_vectors - projection.mean
+    total = float((centered ** 2).sum())
+    kept = float((projection.transform(unique_vectors) ** 2).sum())
+    print(f"Fitted {projection.input_dim} -> {projection.output_dim} dims on "
+          f"{len(unique_vectors)} vectors, {kept / total:.1%} of variance kept")
+
+    projected = dataset.copy()
+    projected.loc[has_embedding, "Embedding"] = pd.Series(
+        list(projection.transform(vectors)), index=projected.index[has_embedding]
+    )
+    projected.to_pickle(output_path)
+    print(f"Wrote {projection_path} and {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Offline alternatives search over the local catalog.
+"""
+
+import logging
+import math
+from collections import Counter, defaultdict
+
+import numpy as np
+
+from services.search_service import normalize_query
+from utils.helpers import parse_prices
+from utils.metrics import span
+
+logger = logging.getLogger(__name__)
+
+class BM25Index:
+    """
+    Okapi BM25 text index over short documents such as item names.
+
+    Term weights are precomputed per posting at build time, so scoring a
+    query only sums the postings of its terms.
+    """
+
+    def __init__(self, texts, k1=1.5, b=0.75):
+        """
+        Build the index.
+
+        Args:
+            texts (iterable): One document per row
+            k1 (float): Term frequency saturation
+            b (float): Document length normalization
+        """
+        postings = defaultdict(list)
+        lengths = []
+        for row, text in enumerate(texts):
+            tokens = normalize_query(str(text)).split()
+            lengths.append(len(tokens))
+            for token, tf in Counter(tokens).items():
+                postings[token].append((row, tf))
+
+        self.size = len(lengths)
+        lengths = np.asarray(lengths, dtype=np.float32)
+        avg_length = max(float(lengths.mean()), 1.0) if self.size else 1.0
+
+        self.postings = {}
+        for token, entries in postings.items():
+            rows = np.fromiter((row for row, _ in entries), dtype=np.int64, count=len(entries))
+            tf = np.fromiter((tf for _, tf in entries), dtype=np.float32, count=len(entries))
+            idf = math.log(1 + (self.size - len(entries) + 0.5) / (len(entries) + 0.5))
+            norm = k1 * (1 - b + b * lengths[rows] / avg_length)
+            self.postings[token] = (rows, (idf * tf * (k1 + 1) / (tf + norm)).astype(np.float32))
+
+    def search(self, query):
+        """
+        Score the rows matching any term of a query.
+
+        Args:
+            query (str): Free-text query
+
+        Returns:
+            tuple: (rows, scores) arrays for every row with a nonzero score
+        """
+        matches = [self.postings[token] for token in set(normalize_query(query).split())
+                   if token in self.postings]
+        if not matches:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        rows = np.concatenate([m[0] for m in matches])
+        weights = np.concatenate([m[1] for m in matches])
+        unique, inverse = np.unique(rows, return_inverse=True)
+        return unique, np.bincount(inverse, weights=weights).astype(np.float32)
+
+
+class LocalSearchService:
+    """
+    Finds alternatives in the local catalog instead of on the web.
+
+    Exposes the same search_alternatives interface and result format as
+    SearchService, so format_alternatives_response can render either. Items
+    are ranked by BM25 relevance of their names to the garment description,
+    optionally blended with visual similarity to the user's image, and kept
+    within a price band.
+    """
+
+    def __init__(self, dataset, index=None, text_weight=0.5, visual_candidates=256,
+                 price_quantile=0.5, source="Style Finder catalog"):
+        """
+        Build the text index and price column over a catalog.
+
+        Args:
+            dataset (DataFrame): Catalog with Item Name, Price, Link and Image URL
+            index (EmbeddingIndex, optional): Similarity index over the dataset,
+                enables visual ranking
+            text_weight (float): Share of the text score in the blended ranking
+            visual_candidates (int): Nearest rows fetched from the index per item
+            price_quantile (float): Catalog price quantile used as the default
+                upper bound, None for no default bound
+            source (str): Source name shown with each result
+        """
+        self.dataset = dataset
+        self.index = index
+        self.text_weight = text_weight
+        self.visual_candidates = visual_candidates
+        self.source = source
+
+        self.text_index = BM25Index(dataset['Item Name'].tolist())
+        self.prices = parse_prices(dataset['Price'])
+        self.names = dataset['Item Name'].tolist()
+        self.links = dataset['Link'].tolist()
+        self.image_urls = dataset['Image URL'].values
+
+        valid = self.prices[~np.isnan(self.prices)]
+        self.default_max_price = (
+            float(np.quantile(valid, price_quantile))
+            if price_quantile is not None and len(valid) else None
+        )
+        logger.info(f"Built local alternatives index over {len(dataset)} items")
+
+    def search_alternatives(self, descriptions, top_n=5, query_vector=None,
+                            min_price=None, max_price=None, exclude_image_url=None):
+        """
+        Search the catalog for alternatives to each described item.
+
+        Args:
+            descriptions (list): Item descriptions extracted from the bot's response
+            top_n (int): Number of top alternatives to return for each item
+            query_vector (array, optional): Embedding of the user's image, blends
+                visual similarity into the ranking
+            min_price (float, optional): Lowest price kept
+            max_price (float, optional): Highest price kept, defaults to the
+                catalog price quantile given at construction
+            exclude_image_url (str, optional): Outfit whose own items are skipped,
+                usually the matched one
+
+        Returns:
+            dict: Item names mapped to lists of alternatives
+        """
+        if max_price is None:
+            max_price = self.default_max_price
+
+        with span("local_search"):
+            visual = None
+            if query_vector is not None and self.index is not None:
+                visual = self.index.search(query_vector, k=self.visual_candidates)
+
+            alternatives = {}
+            for desc in descriptions:
+                rows, scores = self._rank(desc["description"], visual)
+                alternatives[desc["item_name"]] = self._collect(
+                    rows, scores, top_n, min_price, max_price, exclude_image_url
+                )
+        return alternatives
+
+    def _rank(self, description, visual):
+        """
+        Blend text and visual scores, each scaled to [0, 1], over the candidates.
+        """
+        text_rows, text_scores = self.text_index.search(description)
+        if len(text_scores):
+            text_scores = text_scores / text_scores.max()
+        if visual is None:
+            return text_rows, text_scores
+
+        visual_rows, visual_scores = visual
+        rows = np.union1d(text_rows, visual_rows)
+        scores = np.zeros(len(rows), dtype=np.float32)
+        scores[np.searchsorted(rows, text_rows)] += self.text_weight * text_scores
+        np.add.at(scores, np.searchsorted(rows, visual_rows),
+                  (1 - self.text_weight) * np.clip(visual_scores, 0, 1))
+        return rows, scores
+
+    def _collect(self, rows, scores, top_n, min_price, max_price, exclude_image_url):
+        """
+        Apply the price band and exclusions, then take the best distinct links.
+        """
+        prices = self.prices[rows]
+        keep = ~np.isnan(prices)
+        if min_price is not None:
+            keep &= prices >= min_price
+        if max_price is not None:
+            keep &= prices <= max_price
+        if exclude_image_url is not None:
+            keep &= self.image_urls[rows] != exclude_image_url
+        rows, scores = rows[keep], scores[keep]
+
+        results = []
+        seen = set()
+        for row in rows[np.argsort(-scores, kind="stable")]:
+            if self.links[row] in seen:
+                continue
+            seen.add(self.links[row])
+            results.append({
+                "title": self.names[row],
+                "price": f"${self.prices[row]:.2f}",
+                "link": self.links[row],
+                "source": self.source,
+            })
+            if len(results) == top_n:
+                break
+        return results
+
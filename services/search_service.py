@@ -3,21 +3,87 @@ Service for searching online products using SerpAPI.
 """
 
 import re
+from concurrent.futures import ThreadPoolExecutor, wait
 from serpapi import GoogleSearch
 
+from utils.cache import TTLCache
+from utils.metrics import CACHE_LOOKUPS, count, span
+
+# Words dropped when normalizing queries, so near-identical descriptions share a search
+_QUERY_STOPWORDS = {"a", "an", "the", "with", "and", "of", "in", "on", "its", "it", "is", "are"}
+
+
+class SerpApiBackend:
+    """
+    Search backend calling Google Shopping through SerpAPI.
+    """
+    
+    def __init__(self, api_key):
+        """
+        Args:
+            api_key (str): SerpAPI key for authentication
+        """
+        self.api_key = api_key
+    
+    def search(self, query):
+        """
+        Run one shopping search.
+        
+        Args:
+            query (str): Search query
+            
+        Returns:
+            dict: Raw SerpAPI JSON response
+        """
+        params = {
+            "engine": "google_shopping",
+            "q": query,
+            "api_key": self.api_key,
+        }
+        return GoogleSearch(params).get_dict()
+
+
+def normalize_query(description):
+    """
+    Normalize an item description into a search query.
+    
+    Lowercases, strips punctuation and filler words and collapses whitespace,
+    so "A white T-shirt." and "white t-shirt" give the same query.
+    
+    Args:
+        description (str): Item description
+        
+    Returns:
+        str: Normalized query
+    """
+    words = re.sub(r"[^\w\s-]", " ", description.lower()).split()
+    return " ".join(word for word in words if word not in _QUERY_STOPWORDS)
+
+
 class SearchService:
     """
     Handles online product searches using SerpAPI.
     """
     
-    def __init__(self, api_key):
+    def __init__(self, api_key=None, backend=None, max_workers=4, timeout=10,
+                 cache_ttl=86400, cache_max_entries=1024):
         """
-        Initialize the search service with the SerpAPI key.
+        Initialize the search service with the SerpAPI key or another backend.
         
         Args:
-            api_key (str): SerpAPI key for authentication
+            api_key (str, optional): SerpAPI key for authentication
+            backend (optional): Object with a ``search(query)`` method returning a
+                SerpAPI-style dict, used instead of SerpAPI, e.g. a local fake
+            max_workers (int): Searches run at the same time
+            timeout (float): Seconds to wait for all the searches of one call together
+            cache_ttl (float): Seconds a search result stays cached, None disables the cache
+            cache_max_entries (int): Cached queries before LRU eviction
         """
         self.api_key = api_key
+        self.backend = backend or SerpApiBackend(api_key)
+        self.timeout = timeout
+        self.cache = TTLCache(cache_max_entries, cache_ttl) if cache_ttl is not None else None
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
     
     def extract_item_descriptions(self, bot_response):
         """
@@ -50,6 +116,11 @@ class SearchService:
         """
         Search for alternatives using Google Shopping via SerpAPI.
         
+        Items are searched concurrently under one deadline for the whole call.
+        Descriptions that normalize to the same query are searched once, and
+        results are cached by normalized query. An item whose search fails or
+        is not done by the deadline gets an empty list.
+        
         Args:
             descriptions (list): Item descriptions extracted from the bot's response
             top_n (int): Number of top alternatives to return for each item
@@ -57,37 +128,59 @@ class SearchService:
         Returns:
             dict: Item names mapped to lists of alternatives
         """
-        alternatives = {}
-        
         print("\n Starting SerpAPI search for alternatives...\n")
         
-        for desc in descriptions:
-            item_name = desc["item_name"]
-            query = f"Search for affordable alternatives of: {desc['description']}"
-            
-            params = {
-                "engine": "google_shopping",
-                "q": query,
-                "api_key": self.api_key,
-            }
-            
+        # One search per distinct normalized query
+        queries = {desc["item_name"]: normalize_query(desc["description"]) for desc in descriptions}
+        results = {}
+        pending = {}
+        for query in dict.fromkeys(queries.values()):
+            cached = self.cache.get(query) if self.cache is not None else None
+            if cached is not None:
+                results[query] = cached
+            else:
+                pending[query] = self.pool.submit(self._search, query)
+        if self.cache is not None:
+            CACHE_LOOKUPS.inc(len(results), cache="search", result="hit")
+            CACHE_LOOKUPS.inc(len(pending), cache="search", result="miss")
+        
+        # One deadline for every search; whatever is not done by then is dropped
+        wait(pending.values(), timeout=self.timeout)
+        for query, future in pending.items():
+            if not future.done():
+                future.cancel()  # Frees its slot if it has not started
+                print(f"SerpAPI search timed out after {self.timeout}s for query: {query}")
+                count("search_timeout")
+                results[query] = []
+                continue
             try:
-                search = GoogleSearch(params)
-                search_results = search.get_dict()
-                
-                shopping_items = self._extract_shopping_results(search_results)
-                if shopping_items:
-                    print(f"Alternatives found for {item_name}.")
-                else:
-                    print(f"No shopping results found for {item_name} alternative.")
-                
-                alternatives[item_name] = shopping_items[:top_n]
+                results[query] = future.result()
+                if self.cache is not None:
+                    self.cache.set(query, results[query])
             except Exception as e:
-                print(f"Error querying SerpAPI for {item_name}: {e}")
-                alternatives[item_name] = []
+                print(f"Error querying SerpAPI for {query}: {e}")
+                count("search_error")
+                results[query] = []
+        
+        alternatives = {}
+        for item_name, query in queries.items():
+            shopping_items = results[query]
+            if shopping_items:
+                print(f"Alternatives found for {item_name}.")
+            else:
+                print(f"No shopping results found for {item_name} alternative.")
+            alternatives[item_name] = shopping_items[:top_n]
         
         return alternatives
     
+    def _search(self, query):
+        """
+        Run one search on the backend and extract its shopping results.
+        """
+        with span("search"):
+            search_results = self.backend.search(f"Search for affordable alternatives of: {query}")
+        return self._extract_shopping_results(search_results)
+    
     def _extract_shopping_results(self, json_response):
         """
         Extract relevant shopping results from a JSON response.
@@ -0,0 +1,547 @@
+"""
+Multi-process serving: a pool of StyleFinderApp worker processes.
+
+Each worker process runs its own StyleFinderApp, with its own encoder, and
+serves requests sent to it over its own pipe. When the dataset is a vector
+store (see models/vector_store.py), every worker memory-maps the same
+embedding file, so the catalog vectors are held once in the page cache no
+matter how many workers run.
+
+The front end (the Gradio process) keeps a backlog of requests and hands
+each to the least busy ready worker, up to ``concurrency`` requests per
+worker, recording the owner as it does. A worker runs its requests as
+concurrent tasks on one event loop, so requests waiting on the LLM do not
+hold up encoding. Encoding, matching and response formatting run in the
+workers, so throughput scales with cores instead of being capped by the GIL
+of one process.
+
+Every worker has a private pipe, so a worker that dies or is killed can only
+break its own channel: the front end sees the pipe close and fails exactly
+the requests that worker owned.
+"""
+
+import asyncio
+import collections
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+import config
+from utils.metrics import QUEUE_DEPTH, REGISTRY, count
+
+logger = logging.getLogger(__name__)
+
+# Request handlers a worker can run, by StyleFinderApp method name
+WORKER_METHODS = ("process_image_async", "process_image_stream", "process_image_tiered")
+
+STOPPED_MESSAGE = "Error: The server stopped while processing your image. Please try again."
+TIMEOUT_MESSAGE = "Error: The server took too long to process your image. Please try again."
+
+
+class WorkerPool:
+    """
+    Runs N StyleFinderApp worker processes behind a local request backlog.
+
+    Offers the same handlers and readiness interface as StyleFinderApp, so
+    create_gradio_interface can serve from it unchanged.
+    """
+
+    def __init__(self, dataset_path, workers=2, llm_factory=None, heartbeat_seconds=1.0,
+                 health_timeout=30.0, concurrency=8, request_timeout=120.0, config_overrides=None):
+        """
+        Start the worker processes.
+
+        Args:
+            dataset_path (str): Dataset or vector store prefix loaded by every worker.
+                A vector store is memory-mapped and shared; a pickle is copied per worker.
+            workers (int): Number of worker processes
+            llm_factory (callable, optional): Picklable function returning the
+                LlamaVisionService of a worker, e.g. one backed by a stub model
+            heartbeat_seconds (float): Interval of the worker heartbeats
+            health_timeout (float): Seconds without a heartbeat before a worker
+                is considered hung and restarted
+            concurrency (int): Requests each worker handles at once
+            request_timeout (float): Seconds a handler waits for a request,
+                including its time in the backlog, before giving up on it
+            config_overrides (dict, optional): Settings applied in the workers on
+                top of the current config values
+        """
+        if not os.path.exists(dataset_path + ".json"):
+            logger.warning("Dataset %s is not a vector store; each worker loads its own copy",
+                           dataset_path)
+
+        self.dataset_path = dataset_path
+        self.size = workers
+        self.llm_factory = llm_factory
+        self.heartbeat_seconds = heartbeat_seconds
+        self.health_timeout = health_timeout
+        self.concurrency = concurrency
+        self.request_timeout = request_timeout
+        self.startup_error = None
+
+        # Workers inherit the current settings, including changes made at runtime
+        self.worker_config = {k: v for k, v in vars(config).items() if k.isupper()}
+        self.worker_config.update(config_overrides or {})
+        if self.worker_config.get("ENCODER_THREADS") is None:
+            # Split the cores between the workers instead of oversubscribing them
+            self.worker_config["ENCODER_THREADS"] = max(1, (os.cpu_count() or 1) // workers)
+        self.worker_config["BACKGROUND_STARTUP"] = False
+
+        self._context = multiprocessing.get_context("spawn")
+        self._heartbeats = self._context.Array("d", workers, lock=False)
+        self._ids = itertools.count()
+        # Guards the request state below and every send on the pipes
+        self._lock = threading.Lock()
+        self._pending = {}  # request id -> [on_message callback, worker id or None]
+        self._backlog = collections.deque()  # requests waiting for a free worker slot
+        self._assigned = [set() for _ in range(workers)]  # request ids each worker is running
+        self._workers = [None] * workers
+        self._pipes = [None] * workers  # None once a worker's pipe has closed
+        self._ready = [False] * workers
+        self._startup_failed = [False] * workers
+        self._handled = [0] * workers
+        self._restarts = [0] * workers
+        self._filter_choices = {}  # Reported by the first worker to start
+        self._closed = False
+
+        for worker_id in range(workers):
+            self._start_worker(worker_id)
+
+        QUEUE_DEPTH.set_function(self.queue_depth, queue="worker_pool")
+        REGISTRY.gauge("stylefinder_workers_ready", "Worker processes ready to serve").set_function(
+            lambda: sum(self._ready))
+
+        threading.Thread(target=self._dispatch_results, name="pool-results", daemon=True).start()
+        threading.Thread(target=self._monitor, name="pool-health", daemon=True).start()
+
+    @property
+    def ready(self):
+        """bool: Whether at least one worker can take requests."""
+        return any(self._ready)
+
+    def wait_until_ready(self, timeout=None, all_workers=False):
+        """
+        Block until one worker (or every worker) has started.
+
+        Returns:
+            bool: True if ready, False on timeout or when a worker failed to start
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        check = all if all_workers else any
+        while not check(self._ready):
+            if self.startup_error is not None:
+                return False
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def readiness_message(self):
+        """
+        Describe the startup state for the UI.
+        """
+        ready = sum(self._ready)
+        if ready == self.size:
+            return "Ready to analyze."
+        if self.startup_error is not None:
+            return f"Error: The application failed to start: {self.startup_error}"
+        if ready:
+            return f"Ready to analyze ({ready} of {self.size} workers started)."
+        return "The style finder is still starting up (starting workers). Please try again in a moment."
+
+    def filter_choices(self, column):
+        """
+        List the values a categorical filter offers, as reported by the workers.
+        """
+        return self._filter_choices.get(column, [])
+
+    async def process_image_async(self, image, *filters):
+        """
+        Run StyleFinderApp.process_image_async in a worker.
+        """
+        final = None
+        async for final in self._stream("process_image_async", image, filters):
+            pass
+        return final
+
+    def process_image_stream(self, image, *filters):
+        """
+        Run StyleFinderApp.process_image_stream in a worker, yielding its updates.
+        """
+        return self._stream("process_image_stream", image, filters)
+
+    def process_image_tiered(self, image, *filters):
+        """
+        Run StyleFinderApp.process_image_tiered in a worker, yielding its updates.
+        """
+        return self._stream("process_image_tiered", image, filters)
+
+    def submit(self, method, image, on_message, filters=()):
+        """
+        Queue a request for the next free worker slot.
+
+        Args:
+            method (str): One of WORKER_METHODS
+            image: PIL image or path, sent to the worker by pickling
+            on_message (callable): Called from the dispatcher thread with
+                (kind, value) for every "partial" update and the final "done"
+                or "error" message
+            filters (tuple): Filter arguments passed to the handler after the
+                image (min_price, max_price, categories, brands)
+
+        Returns:
+            int: Request id
+        """
+        if method not in WORKER_METHODS:
+            raise ValueError(f"Unknown worker method '{method}', expected one of {WORKER_METHODS}")
+        request_id = next(self._ids)
+        with self._lock:
+            self._pending[request_id] = [on_message, None]
+            self._backlog.append((request_id, method, image, tuple(filters)))
+            self._assign()
+        return request_id
+
+    def cancel(self, request_id):
+        """
+        Give up on a request: drop it from the backlog, or ask its worker to stop it.
+        No further messages are delivered for it.
+        """
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+            if entry is not None and entry[1] is not None:
+                self._send(entry[1], ("cancel", request_id))
+
+    def run(self, method, image, timeout=None, filters=()):
+        """
+        Blocking helper: run a request and return its final value.
+        """
+        future = Future()
+
+        def on_message(kind, value):
+            if kind != "partial":
+                future.set_result(value)
+
+        request_id = self.submit(method, image, on_message, filters)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            self.cancel(request_id)
+            raise
+
+    def health(self):
+        """
+        Report the state of every worker.
+
+        Returns:
+            list: One dict per worker with pid, liveness, readiness, seconds since
+                its last heartbeat, requests in flight, requests handled and restarts
+        """
+        now = time.time()
+        with self._lock:
+            in_flight = [len(assigned) for assigned in self._assigned]
+        return [
+            {
+                "worker": worker_id,
+                "pid": process.pid,
+                "alive": process.is_alive(),
+                "ready": self._ready[worker_id],
+                "heartbeat_age_s": round(now - self._heartbeats[worker_id], 2)
+                if self._heartbeats[worker_id] else None,
+                "in_flight": in_flight[worker_id],
+                "handled": self._handled[worker_id],
+                "restarts": self._restarts[worker_id],
+            }
+            for worker_id, process in enumerate(self._workers)
+        ]
+
+    def queue_depth(self):
+        """
+        Returns:
+            int: Requests waiting for a free worker slot
+        """
+        return len(self._backlog)
+
+    def close(self, timeout=5):
+        """
+        Stop every worker, letting each finish the requests it is running.
+        """
+        self._closed = True
+        with self._lock:
+            for worker_id in range(self.size):
+                self._send(worker_id, None)
+        for process in self._workers:
+            process.join(timeout)
+            if process.is_alive():
+                # Last resort for a hung worker; it can only break its own pipe
+                process.kill()
+                process.join()
+
+    async def _stream(self, method, image, filters=()):
+        loop = asyncio.get_running_loop()
+        updates = asyncio.Queue()
+
+        def on_message(kind, value):
+            loop.call_soon_threadsafe(updates.put_nowait, (kind, value))
+
+        request_id = self.submit(method, image, on_message, filters)
+        deadline = loop.time() + self.request_timeout
+        finished = False
+        try:
+            while True:
+                try:
+                    kind, value = await asyncio.wait_for(updates.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    logger.warning("Request %d got no answer within %ss", request_id, self.request_timeout)
+                    count("worker_request_timeout")
+                    yield TIMEOUT_MESSAGE
+                    return
+                if kind != "partial":
+                    finished = True
+                yield value
+                if finished:
+                    return
+        finally:
+            if not finished:
+                # Timed out, or the caller stopped listening: free the worker slot
+                self.cancel(request_id)
+
+    def _assign(self):
+        """
+        Hand backlog requests to the least busy ready workers. Called with the lock held.
+        """
+        while self._backlog:
+            free = [worker_id for worker_id in range(self.size)
+                    if self._ready[worker_id] and self._pipes[worker_id] is not None
+                    and len(self._assigned[worker_id]) < self.concurrency]
+            if not free:
+                return
+            worker_id = min(free, key=lambda worker_id: len(self._assigned[worker_id]))
+            request = self._backlog.popleft()
+            entry = self._pending.get(request[0])
+            if entry is None:
+                continue  # Cancelled while waiting
+            # The owner is recorded before the worker can see the request
+            entry[1] = worker_id
+            self._assigned[worker_id].add(request[0])
+            if not self._send(worker_id, ("request",) + request):
+                entry[1] = None
+                self._assigned[worker_id].discard(request[0])
+                self._backlog.appendleft(request)
+
+    def _send(self, worker_id, message):
+        """
+        Send a message to a worker. Called with the lock held.
+
+        Returns:
+            bool: False if the worker's pipe is closed
+        """
+        pipe = self._pipes[worker_id]
+        if pipe is None:
+            return False
+        try:
+            pipe.send(message)
+            return True
+        except (OSError, ValueError):
+            self._pipes[worker_id] = None
+            self._ready[worker_id] = False
+            return False
+
+    def _start_worker(self, worker_id):
+        self._ready[worker_id] = False
+        self._heartbeats[worker_id] = 0.0
+        pipe, worker_pipe = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(worker_id, self.dataset_path, self.worker_config, self.llm_factory,
+                  worker_pipe, self._heartbeats, self.heartbeat_seconds),
+            name=f"style-finder-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        # Only the worker holds its end, so the pipe closes when the worker exits
+        worker_pipe.close()
+        self._workers[worker_id] = process
+        self._pipes[worker_id] = pipe
+
+    def _dispatch_results(self):
+        """
+        Route worker messages to the waiting requests.
+        """
+        while not self._closed:
+            pipes = {pipe: worker_id for worker_id, pipe in enumerate(self._pipes) if pipe is not None}
+            if not pipes:
+                time.sleep(0.1)
+                continue
+            for pipe in multiprocessing.connection.wait(list(pipes), timeout=0.5):
+                worker_id = pipes[pipe]
+                try:
+                    message = pipe.recv()
+                except (EOFError, OSError):
+                    # The worker exited; the monitor fails its requests and restarts it
+                    with self._lock:
+                        if self._pipes[worker_id] is pipe:
+                            self._pipes[worker_id] = None
+                            self._ready[worker_id] = False
+                    continue
+                self._handle_message(worker_id, message)
+
+    def _handle_message(self, worker_id, message):
+        kind = message[0]
+        if kind == "ready":
+            self._filter_choices = self._filter_choices or message[2]
+            with self._lock:
+                self._ready[worker_id] = True
+                self._assign()
+            logger.info("Worker %d ready: %s", worker_id, message[1])
+        elif kind == "failed":
+            self.startup_error = message[1]
+            self._startup_failed[worker_id] = True
+            logger.error("Worker %d failed to start: %s", worker_id, message[1])
+        else:
+            _, request_id, value = message
+            with self._lock:
+                entry = self._pending.get(request_id)
+                if kind != "partial":
+                    # The worker is done with the request, answered or cancelled
+                    self._pending.pop(request_id, None)
+                    self._assigned[worker_id].discard(request_id)
+                    if kind != "cancelled":
+                        self._handled[worker_id] += 1
+                    self._assign()
+            if entry is not None and kind != "cancelled":
+                entry[0](kind, value)
+
+    def _monitor(self):
+        """
+        Restart workers that died or stopped sending heartbeats.
+        """
+        while not self._closed:
+            time.sleep(self.heartbeat_seconds)
+            for worker_id, process in enumerate(self._workers):
+                if self._closed:
+                    return
+                last = self._heartbeats[worker_id]
+                hung = last and time.time() - last > self.health_timeout
+                if process.is_alive() and not hung:
+                    continue
+                if not process.is_alive() and self._startup_failed[worker_id]:
+                    continue  # Failed at startup; restarting would fail the same way
+                logger.warning("Worker %d %s, restarting it", worker_id,
+                               "stopped responding" if hung else f"exited ({process.exitcode})")
+                if process.is_alive():
+                    # A hung worker cannot read a stop message; it only owns its own pipe
+                    process.kill()
+                    process.join()
+                with self._lock:
+                    if self._pipes[worker_id] is not None:
+                        self._pipes[worker_id].close()
+                    self._pipes[worker_id] = None
+                    self._ready[worker_id] = False
+                self._fail_requests_of(worker_id)
+                self._restarts[worker_id] += 1
+                self._start_worker(worker_id)
+
+    def _fail_requests_of(self, worker_id):
+        with self._lock:
+            failed = [self._pending.pop(request_id) for request_id in self._assigned[worker_id]
+                      if request_id in self._pending]
+            self._assigned[worker_id].clear()
+        for on_message, _ in failed:
+            on_message("error", STOPPED_MESSAGE)
+
+
+def _worker_main(worker_id, dataset_path, worker_config, llm_factory,
+                 pipe, heartbeats, heartbeat_seconds):
+    """
+    Entry point of a worker process: load the app, then serve requests until told to stop.
+    """
+    def beat():
+        while True:
+            heartbeats[worker_id] = time.time()
+            time.sleep(heartbeat_seconds)
+
+    threading.Thread(target=beat, name="heartbeat", daemon=True).start()
+
+    for name, value in worker_config.items():
+        setattr(config, name, value)
+
+    if config.METRICS_PORT is not None:
+        # Each worker records its own stage timings; scrape them next to the front end's port
+        from utils.metrics import start_metrics_server
+        try:
+            start_metrics_server(config.METRICS_PORT + 1 + worker_id)
+        except OSError as e:
+            logger.warning("Worker %d cannot serve metrics: %s", worker_id, e)
+
+    try:
+        from app import StyleFinderApp
+        llm_service = llm_factory() if llm_factory is not None else None
+        app = StyleFinderApp(dataset_path, llm_service=llm_service)
+    except Exception as e:
+        pipe.send(("failed", str(e)))
+        return
+    filter_choices = {column: app.filter_choices(column) for column in config.FILTER_COLUMNS}
+    pipe.send(("ready", app.startup_timings, filter_choices))
+
+    asyncio.run(_serve(app, worker_id, pipe))
+
+
+async def _serve(app, worker_id, pipe):
+    """
+    Run every request the front end sends as its own task, until the stop message.
+    """
+    loop = asyncio.get_running_loop()
+    tasks = {}
+    while True:
+        try:
+            message = await loop.run_in_executor(None, pipe.recv)
+        except EOFError:
+            break  # The front end is gone
+        if message is None:
+            break
+        if message[0] == "cancel":
+            task = tasks.get(message[1])
+            if task is not None:
+                task.cancel()
+            continue
+        _, request_id, method, image, filters = message
+        tasks[request_id] = loop.create_task(
+            _handle_request(app, worker_id, pipe, request_id, method, image, filters, tasks))
+
+    # Finish the requests in flight before exiting
+    if tasks:
+        await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+
+async def _handle_request(app, worker_id, pipe, request_id, method, image, filters, tasks):
+    try:
+        value = await _run_handler(app, method, image, filters, request_id, pipe)
+        pipe.send(("done", request_id, value))
+    except asyncio.CancelledError:
+        pipe.send(("cancelled", request_id, None))
+    except Exception as e:
+        logger.exception("Worker %d failed request %d", worker_id, request_id)
+        pipe.send(("error", request_id, f"Error: {e}"))
+    finally:
+        tasks.pop(request_id, None)
+
+
+async def _run_handler(app, method, image, filters, request_id, pipe):
+    handler = getattr(app, method)
+    if method == "process_image_async":
+        return await handler(image, *filters)
+    last = None
+    stream = handler(image, *filters)
+    try:
+        async for rendered in stream:
+            if last is not None:
+                pipe.send(("partial", request_id, last))
+            last = rendered
+    finally:
+        await stream.aclose()
+    return last
@@ -0,0 +1,167 @@
+"""
+Tests for catalog updates while queries are running.
+"""
+
+import threading
+
+import numpy as np
+import pytest
+
+from benchmarks.fakes import synthetic_catalog
+from models.index_manager import IndexManager
+from utils.helpers import get_all_items_for_image
+
+ROWS = 2000
+DIM = 64
+
+
+def _manager(**options):
+    return IndexManager(synthetic_catalog(ROWS, dim=DIM), filter_columns=(), **options)
+
+
+def _new_items(step, rows=200, replaced=20):
+    """
+    Items for an append: fresh outfits plus updated copies of existing links.
+    """
+    items = synthetic_catalog(rows, dim=DIM, seed=step)
+    items["Link"] = [f"https://shop.example.com/item/{i}" if i < replaced
+                     else f"https://shop.example.com/new/{step}/{i}" for i in range(rows)]
+    items["Image URL"] = [f"https://images.example.com/new/{step}/{i // 4}.jpg" for i in range(rows)]
+    return items
+
+
+def _check_results(generation, row_ids, scores):
+    """
+    Assert that search results only point at live rows of their own generation.
+    """
+    assert len(row_ids) > 0
+    assert np.all(np.diff(scores) <= 1e-6)
+    assert np.all(row_ids < len(generation.data))
+    assert not generation.deleted[row_ids].any()
+    rows = generation.data.iloc[row_ids]
+    for link, image_url in zip(rows["Link"], rows["Image URL"]):
+        items = get_all_items_for_image(image_url, generation.data, generation.item_lookup)
+        assert link in set(items["Link"])
+
+
+def test_queries_stay_consistent_while_the_catalog_changes():
+    manager = _manager(compact_tombstone_fraction=0.05, compact_max_segments=3)
+    rng = np.random.default_rng(0)
+    queries = rng.normal(size=(32, DIM)).astype(np.float32)
+    stop = threading.Event()
+    errors = []
+    served = []
+
+    def reader(offset):
+        i = offset
+        while not stop.is_set():
+            generation = manager.current
+            try:
+                row_ids, scores = generation.index.search(queries[i % len(queries)], k=5)
+                _check_results(generation, row_ids, scores)
+                allowed = generation.catalog_filter.mask(max_price=100.0)
+                row_ids, scores = generation.index.search(queries[i % len(queries)], k=5, allowed=allowed)
+                _check_results(generation, row_ids, scores)
+                assert np.all(generation.data["Price"].to_numpy()[row_ids] <= 100.0)
+            except Exception as e:  # Reported after the writer is done
+                errors.append(repr(e))
+            served.append(generation.version)
+            i += 4
+
+    readers = [threading.Thread(target=reader, args=(offset,)) for offset in range(4)]
+    for thread in readers:
+        thread.start()
+    try:
+        for step in range(1, 25):
+            if step % 8 == 0:
+                manager.replace(synthetic_catalog(ROWS, dim=DIM, seed=100 + step))
+            elif step % 3 == 0:
+                manager.delete(
+                    links=[f"https://shop.example.com/item/{i}" for i in rng.integers(0, ROWS, 40)],
+                    image_urls=[f"https://images.example.com/outfit/{i}.jpg"
+                                for i in rng.integers(0, ROWS // 4, 10)]
+                )
+            elif step % 5 == 0:
+                manager.compact()
+            else:
+                manager.append(_new_items(step))
+    finally:
+        stop.set()
+        for thread in readers:
+            thread.join()
+
+    assert errors == []
+    assert len(served) > 0
+    assert len(set(served)) > 1  # Queries ran across several generations
+    assert manager.current.version >= 24
+
+
+def test_append_replaces_items_with_the_same_link():
+    manager = _manager()
+    generation = manager.append(_new_items(1))
+
+    links = generation.data["Link"][~generation.deleted]
+    assert links.is_unique
+    assert generation.items == ROWS + 200 - 20
+    assert len(generation.index.segments) == 2
+
+
+def test_deleted_items_are_never_returned():
+    manager = _manager(compact_tombstone_fraction=1.0)
+    data = manager.current.data
+    target = data.iloc[0]
+    query = np.asarray(target["Embedding"], dtype=np.float32)
+
+    generation = manager.delete(image_urls=[target["Image URL"]])
+
+    row_ids, _ = generation.index.search(query, k=10)
+    assert target["Image URL"] not in set(generation.data["Image URL"].iloc[row_ids])
+    assert target["Image URL"] not in generation.item_lookup
+
+
+def test_compaction_drops_tombstones_and_keeps_the_live_items():
+    manager = _manager(compact_tombstone_fraction=1.0)
+    manager.append(_new_items(1))
+    manager.delete(links=[f"https://shop.example.com/item/{i}" for i in range(100, 200)])
+    before = manager.current
+
+    after = manager.compact()
+
+    assert after.version == before.version + 1
+    assert after.deleted.sum() == 0
+    assert len(after.index.segments) == 1
+    assert after.items == before.items
+    assert sorted(after.data["Link"]) == sorted(before.data["Link"][~before.deleted])
+
+
+def test_replace_rejects_an_empty_catalog():
+    manager = _manager()
+    version = manager.current.version
+
+    with pytest.raises(ValueError):
+        manager.replace(synthetic_catalog(ROWS, dim=DIM).iloc[:0])
+    assert manager.current.version == version
+
+
+def test_catalog_id_is_stable_across_restarts_and_follows_the_contents():
+    data = synthetic_catalog(ROWS, dim=DIM)
+
+    def restart(source_id):
+        manager = IndexManager(data, filter_columns=(), compact_tombstone_fraction=1.0,
+                               source_id=source_id)
+        manager.append(_new_items(1), source_id="update-1")
+        manager.delete(links=["https://shop.example.com/item/5"])
+        return manager
+
+    first, second = restart("store-a"), restart("store-a")
+    assert first.current.catalog_id == second.current.catalog_id
+    # The version restarts in every process; the identity also tells catalogs apart
+    rebuilt = restart("store-b")
+    assert rebuilt.current.version == first.current.version
+    assert rebuilt.current.catalog_id != first.current.catalog_id
+
+    # Compaction keeps the contents and so the identity
+    before = first.current.catalog_id
+    assert first.compact().catalog_id == before
+    # An update without a source is never mistaken for another one
+    assert first.append(_new_items(2)).catalog_id != second.append(_new_items(2)).catalog_id
@@ -0,0 +1,114 @@
+"""
+Tests for the deadlines and the concurrency cap of the resilient chat client.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.fakes import FakeChatModel
+from models.llm_client import LLMTimeoutError, ResilientChatClient
+
+MESSAGES = [{"role": "user", "content": [{"type": "text", "text": "Describe the outfit."}]}]
+
+
+class CountingModel(FakeChatModel):
+    """
+    FakeChatModel that records how many calls and streams are open at once.
+    """
+
+    def __init__(self, **options):
+        super().__init__(echo_items=False, **options)
+        self.open = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.open += 1
+            self.peak = max(self.peak, self.open)
+
+    def _exit(self):
+        with self._lock:
+            self.open -= 1
+
+    def chat(self, messages, **kwargs):
+        self._enter()
+        try:
+            return super().chat(messages, **kwargs)
+        finally:
+            self._exit()
+
+    def chat_stream(self, messages, **kwargs):
+        self._enter()
+        try:
+            yield from super().chat_stream(messages, **kwargs)
+        finally:
+            self._exit()
+
+
+def test_time_in_the_queue_does_not_count_against_the_deadline():
+    model = CountingModel(latency=0.3)
+    client = ResilientChatClient(model, timeout=0.5, max_retries=0, max_concurrency=2,
+                                 failure_threshold=3)
+
+    with ThreadPoolExecutor(max_workers=6) as callers:
+        results = list(callers.map(lambda _: client.chat(messages=MESSAGES), range(6)))
+
+    assert len(results) == 6
+    assert model.peak == 2
+    assert client.breaker.state == "closed"
+
+
+def test_timed_out_call_is_ended_by_the_model_timeout():
+    model = CountingModel(latency=5.0)
+    client = ResilientChatClient(model, timeout=0.2, max_retries=0, max_concurrency=1)
+
+    start = time.perf_counter()
+    with pytest.raises(LLMTimeoutError):
+        client.chat(messages=MESSAGES)
+    # The timeout was passed on, so the call does not keep its slot for the full latency
+    model.latency = 0.0
+    client.chat(messages=MESSAGES)
+    assert time.perf_counter() - start < 2.0
+
+
+def test_stream_holds_its_slot_until_it_ends():
+    model = CountingModel(latency=0.5, first_chunk_latency=0.0, chunk_size=32)
+    client = ResilientChatClient(model, timeout=1.0, max_retries=0, max_concurrency=2)
+
+    def consume(_):
+        return "".join(chunk["choices"][0]["delta"]["content"]
+                       for chunk in client.chat_stream(messages=MESSAGES))
+
+    with ThreadPoolExecutor(max_workers=5) as callers:
+        texts = list(callers.map(consume, range(5)))
+
+    assert texts == [model.response] * 5
+    assert model.peak == 2
+
+
+def test_stream_closed_early_frees_its_slot():
+    model = CountingModel(latency=0.5, first_chunk_latency=0.0)
+    client = ResilientChatClient(model, timeout=1.0, max_retries=0, max_concurrency=1)
+
+    stream = client.chat_stream(messages=MESSAGES)
+    next(stream)
+    stream.close()
+
+    assert model.open == 0
+    model.latency = 0.0
+    assert client.chat(messages=MESSAGES)
+
+
+def test_stall_between_chunks_times_out():
+    model = CountingModel(latency=10.0, first_chunk_latency=0.0, chunk_size=1000)
+    model.response = "x" * 3000  # Three chunks, ~3.3s apart
+    client = ResilientChatClient(model, timeout=0.2, max_retries=0, max_concurrency=1)
+
+    stream = client.chat_stream(messages=MESSAGES)
+    next(stream)
+    with pytest.raises(LLMTimeoutError):
+        next(stream)
@@ -0,0 +1,201 @@
+"""
+Tests for streamed LLM responses: the item section fallback, which answers
+are cached and that abandoned streams are closed.
+"""
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import config
+from app import StyleFinderApp
+from benchmarks.fakes import FAKE_ANALYSIS, FakeChatModel, synthetic_catalog
+from models.llm_service import LlamaVisionService
+from utils.helpers import build_basic_response, format_items_description, get_all_items_for_image
+
+ITEMS = "- navy blazer ($120.00): https://shop.example.com/item/1"
+
+
+class FakeImageProcessor:
+    """
+    Stands in for the ResNet50 encoder, which these tests never reach.
+    """
+
+    def encode_image(self, image, is_url=None):
+        return {"base64": "", "vector": np.zeros(1000, dtype=np.float32)}
+
+
+class TrackedChatModel(FakeChatModel):
+    """
+    Counts the model streams that were opened and not closed yet.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.open_streams = 0
+
+    def chat_stream(self, messages, timeout=None, **kwargs):
+        self.open_streams += 1
+        try:
+            yield from super().chat_stream(messages, timeout=timeout, **kwargs)
+        finally:
+            self.open_streams -= 1
+
+
+def _service(**model_options):
+    model = FakeChatModel(latency=0.0, chunk_size=8, **model_options)
+    return LlamaVisionService(model_id="stub", project_id="stub", model=model, max_retries=0)
+
+
+def _slow_service():
+    """
+    A service whose model takes seconds to stream its answer.
+
+    Returns:
+        tuple: (service, its TrackedChatModel)
+    """
+    model = TrackedChatModel(latency=5.0, first_chunk_latency=0.0, chunk_size=8)
+    return LlamaVisionService(model_id="stub", project_id="stub", model=model, max_retries=0), model
+
+
+def _consume(stream):
+    """
+    Drain a response stream.
+
+    Returns:
+        tuple: (joined text, the generator's return value)
+    """
+    chunks = []
+    while True:
+        try:
+            chunks.append(next(stream))
+        except StopIteration as stop:
+            return "".join(chunks), stop.value
+
+
+def _fashion_stream(service):
+    return service.generate_fashion_response_stream(
+        "", matched_row=None, all_items=None, similarity_score=0.9, threshold=0.8,
+        items_description=ITEMS
+    )
+
+
+def test_complete_stream():
+    text, complete = _consume(_fashion_stream(_service()))
+
+    assert complete
+    assert text == FAKE_ANALYSIS + "ITEM DETAILS:\n" + ITEMS
+
+
+def test_interrupted_stream_appends_the_item_list():
+    text, complete = _consume(_fashion_stream(_service(interrupt_after=20)))
+
+    assert not complete
+    assert text == FAKE_ANALYSIS[:20 * 8] + "\n\n" + build_basic_response(ITEMS, 0.9, 0.8)
+
+
+def test_stream_failing_before_the_first_chunk():
+    text, complete = _consume(_fashion_stream(_service(interrupt_after=0)))
+
+    assert not complete
+    assert text == build_basic_response(ITEMS, 0.9, 0.8)
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    dataset_path = tmp_path_factory.mktemp("catalog") / "catalog.pkl"
+    synthetic_catalog(200).to_pickle(dataset_path)
+    return StyleFinderApp(str(dataset_path), image_processor=FakeImageProcessor(),
+                          llm_service=_service())
+
+
+def _match(app):
+    catalog = app.catalog.current
+    row = catalog.data.iloc[0]
+    items = get_all_items_for_image(row["Image URL"], catalog.data, catalog.item_lookup)
+    return {
+        "encoding": {"base64": ""},
+        "closest_row": row,
+        "similarity_score": 0.9,
+        "all_items": items,
+        "items_description": format_items_description(items),
+        "catalog_id": catalog.catalog_id,
+    }
+
+
+async def _render(app, match):
+    return [rendered async for rendered in app._stream_response(match)]
+
+
+def test_app_caches_a_complete_stream(app):
+    app.llm_service = _service()
+    app.response_cache.clear()
+    match = _match(app)
+
+    renders = asyncio.run(_render(app, match))
+
+    assert "## Item Details" in renders[-1]
+    assert len(app.response_cache) == 1
+    # The second request is answered from the cache without calling the model
+    app.llm_service = _service(interrupt_after=0)
+    assert asyncio.run(_render(app, match)) == [renders[-1]]
+
+
+def test_app_does_not_cache_an_interrupted_stream(app):
+    app.llm_service = _service(interrupt_after=20)
+    app.response_cache.clear()
+    match = _match(app)
+
+    final = asyncio.run(_render(app, match))[-1]
+
+    assert final.startswith("# Fashion Analysis")
+    for link in match["all_items"]["Link"]:
+        assert link in final
+    assert len(app.response_cache) == 0
+
+    # Once the model recovers, its answer is cached
+    app.llm_service = _service()
+    asyncio.run(_render(app, match))
+    assert len(app.response_cache) == 1
+
+
+@pytest.fixture
+def tiered_app(app, monkeypatch):
+    monkeypatch.setattr(app, "match_image", lambda image, filters=None: (_match(app), None))
+    monkeypatch.setattr(config, "STREAM_RESPONSES", True)
+    app.response_cache.clear()
+    return app
+
+
+def test_tiered_deadline_closes_the_model_stream(tiered_app, monkeypatch):
+    tiered_app.llm_service, model = _slow_service()
+    monkeypatch.setattr(config, "LLM_DEADLINE_SECONDS", 0.3)
+
+    async def run():
+        return [rendered async for rendered in tiered_app.process_image_tiered("image")]
+
+    renders = asyncio.run(run())
+
+    assert renders[-1].endswith("_The detailed style analysis is unavailable right now._")
+    # A chunk read still running at the deadline closes the stream once it returns
+    deadline = time.monotonic() + 2
+    while model.open_streams and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert model.open_streams == 0
+    assert len(tiered_app.response_cache) == 0
+
+
+def test_client_leaving_closes_the_model_stream(tiered_app):
+    tiered_app.llm_service, model = _slow_service()
+
+    async def leave_after_first_analysis():
+        responses = tiered_app.process_image_tiered("image")
+        await responses.__anext__()  # The catalog answer
+        await responses.__anext__()  # The start of the analysis
+        assert model.open_streams == 1
+        await responses.aclose()
+        return model.open_streams
+
+    assert asyncio.run(leave_after_first_analysis()) == 0
@@ -0,0 +1,192 @@
+"""
+Caches with TTL and LRU eviction, plus the image hash used as a cache key.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+class TTLCache:
+    """
+    In-process cache with per-entry expiry and least-recently-used eviction.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        """
+        Initialize an empty cache.
+
+        Args:
+            max_entries (int): Entries kept before the least recently used is evicted
+            ttl (float): Seconds an entry stays valid, None to never expire
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for a key, or default when missing or expired.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[1] is None or entry[1] > time.monotonic()):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        """
+        Store a value, evicting the least recently used entries if full.
+        """
+        expires = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count with hit, miss and eviction counters
+        """
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class DiskCache(TTLCache):
+    """
+    Cache persisted in a SQLite file, so entries survive restarts.
+
+    Values are pickled; only point it at a directory the app owns.
+    """
+
+    def __init__(self, path, max_entries=10000, ttl=86400):
+        """
+        Open or create the cache file.
+
+        Args:
+            path (str): SQLite database file
+            max_entries (int): Entries kept before the least recently used is evicted
+            ttl (float): Seconds an entry stays valid, None to never expire
+        """
+        super().__init__(max_entries=max_entries, ttl=ttl)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)"
+        )
+        self._db.commit()
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (repr(key),)
+            ).fetchone()
+            if row is not None and (row[1] is None or row[1] > now):
+                self._db.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, repr(key)))
+                self._db.commit()
+                self.hits += 1
+                return pickle.loads(row[0])
+            if row is not None:
+                self._db.execute("DELETE FROM cache WHERE key = ?", (repr(key),))
+                self._db.commit()
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        now = time.time()
+        expires = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                (repr(key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), expires, now)
+            )
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                self._db.execute(
+                    "DELETE FROM cache WHERE key IN "
+                    "(SELECT key FROM cache ORDER BY accessed LIMIT ?)", (excess,)
+                )
+                self.evictions += excess
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._db.execute("DELETE FROM cache")
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def create_cache(name, max_entries, ttl, cache_dir=None):
+    """
+    Create an on-disk cache when a directory is configured, else an in-process one.
+
+    Args:
+        name (str): Cache name, used as the file name on disk
+        max_entries (int): Maximum number of entries
+        ttl (float): Seconds an entry stays valid
+        cache_dir (str, optional): Directory for the on-disk backend
+
+    Returns:
+        TTLCache: The cache
+    """
+    if cache_dir:
+        path = os.path.join(cache_dir, f"{name}.sqlite")
+        logger.info("Using on-disk cache %s", path)
+        return DiskCache(path, max_entries=max_entries, ttl=ttl)
+    return TTLCache(max_entries=max_entries, ttl=ttl)
+
+
+def image_hash(image):
+    """
+    Compute a content hash of an image's decoded pixels.
+
+    Only uploads with identical pixels share a hash, so a cache entry is
+    never served for a different photo. The same photo re-uploaded in
+    another file format still hits, as long as it decodes to the same pixels.
+
+    Args:
+        image (PIL.Image.Image): Image to hash
+
+    Returns:
+        str: Hexadecimal SHA-1 of the mode, size and pixel bytes
+    """
+    digest = hashlib.sha1(f"{image.mode} {image.size[0]}x{image.size[1]}".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
@@ -5,22 +5,154 @@ Utility functions for the Style Finder application.
 import logging
 import re
 
+import numpy as np
+import pandas as pd
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def get_all_items_for_image(image_url, dataset):
+def format_items_description(items):
+    """
+    Render the bullet list of item names, prices and links used in prompts.
+    
+    Args:
+        items (DataFrame): Items to list
+        
+    Returns:
+        str: One "- name ($price): link" line per item
+    """
+    # Whole-column tolist() is much faster than iterating Series, above all Arrow-backed ones
+    return "\n".join(
+        f"- {name} (${price}): {link}"
+        for name, price, link in zip(items['Item Name'].tolist(), items['Price'].tolist(),
+                                     items['Link'].tolist())
+    )
+
+def parse_prices(prices):
+    """
+    Convert a price column holding numbers or strings like "$1,299.00" to floats.
+    
+    Args:
+        prices (Series): Price column
+        
+    Returns:
+        ndarray: float64 prices, NaN where a price cannot be parsed
+    """
+    if pd.api.types.is_numeric_dtype(prices):
+        return prices.to_numpy(dtype=np.float64)
+    cleaned = prices.astype(str).str.replace(r"[^\d.]", "", regex=True)
+    return pd.to_numeric(cleaned, errors="coerce").to_numpy(dtype=np.float64)
+
+def item_sections(items_description, similarity_score, threshold=0.8, similar_items_description=None):
+    """
+    Arrange the item lists of a match into the sections a response lists them in.
+    
+    An exact match lists its outfit under ITEM DETAILS and items from other
+    outfits, such as region matches, under SIMILAR ITEMS. Otherwise every
+    item is only similar and they share the SIMILAR ITEMS section.
+    
+    Args:
+        items_description (str): Pre-rendered item list of the matched outfit
+        similarity_score (float): Similarity score of the match
+        threshold (float): Threshold for determining match quality
+        similar_items_description (str, optional): Pre-rendered list of items
+            from other outfits
+        
+    Returns:
+        list: (section header, item list) tuples
+    """
+    if similarity_score >= threshold:
+        sections = [("ITEM DETAILS", items_description)]
+        if similar_items_description:
+            sections.append(("SIMILAR ITEMS", similar_items_description))
+        return sections
+    if similar_items_description:
+        items_description += "\n" + similar_items_description
+    return [("SIMILAR ITEMS", items_description)]
+
+def build_basic_response(items_description, similarity_score, threshold=0.8, similar_items_description=None):
+    """
+    Build the deterministic response listing the matched items, used when
+    there is no usable model analysis.
+    
+    Args:
+        items_description (str): Pre-rendered item list
+        similarity_score (float): Similarity score of the match
+        threshold (float): Threshold for determining match quality
+        similar_items_description (str, optional): Pre-rendered list of items
+            from other outfits
+        
+    Returns:
+        str: Raw response with the item sections, ready for process_response
+    """
+    sections = item_sections(items_description, similarity_score, threshold, similar_items_description)
+    return (
+        "# Fashion Analysis\n\nThis outfit features a collection of carefully coordinated pieces."
+        + "".join(f"\n\n{header}:\n{items}" for header, items in sections)
+    )
+
+def build_item_lookup(dataset, rows=None, describe=True):
+    """
+    Group the dataset rows by image URL once, so lookups avoid a full scan.
+    
+    Args:
+        dataset (DataFrame): Dataset containing outfit information
+        rows (array, optional): Positional rows to group, e.g. only the items
+            that were not deleted. Defaults to every row.
+        describe (bool): Pre-render each outfit's item list. Without it only the
+            Image URL column is read, which keeps lazily loaded columns unread
+            until a request needs them.
+        
+    Returns:
+        dict: Image URL mapped to a dict with the positional row ids of its
+            items ('positions') and, when describe is set, their pre-rendered
+            item list ('items_description')
+    """
+    if rows is not None:
+        rows = np.asarray(rows, dtype=np.int64)
+        dataset = dataset.iloc[rows]
+    
+    # Factorize once and split a stable sort, much faster than groupby().indices
+    codes, image_urls = pd.factorize(dataset['Image URL'], sort=False)
+    order = np.argsort(codes, kind="stable")
+    bounds = np.searchsorted(codes[order], np.arange(len(image_urls) + 1))
+    positions = order if rows is None else rows[order]
+    
+    lookup = {
+        image_url: {"positions": positions[bounds[i]:bounds[i + 1]]}
+        for i, image_url in enumerate(image_urls.tolist())
+    }
+    if describe:
+        # Pull the columns out once; per-group DataFrame slicing is far slower
+        names = dataset['Item Name'].tolist()
+        prices = dataset['Price'].tolist()
+        links = dataset['Link'].tolist()
+        for i, entry in enumerate(lookup.values()):
+            entry["items_description"] = "\n".join(
+                f"- {names[j]} (${prices[j]}): {links[j]}" for j in order[bounds[i]:bounds[i + 1]]
+            )
+    logger.info(f"Built item lookup for {len(lookup)} images")
+    return lookup
+
+def get_all_items_for_image(image_url, dataset, item_lookup=None):
     """
     Get all items related to a specific image from the dataset.
     
     Args:
         image_url (str): The URL of the matched image
         dataset (DataFrame): Dataset containing outfit information
+        item_lookup (dict, optional): Lookup built by build_item_lookup. Without
+            it the whole dataset is scanned.
         
     Returns:
         DataFrame: All items related to the image
     """
-    related_items = dataset[dataset['Image URL'] == image_url]
+    if item_lookup is not None:
+        entry = item_lookup.get(image_url)
+        related_items = dataset.iloc[entry["positions"]] if entry else dataset.iloc[:0]
+    else:
+        related_items = dataset[dataset['Image URL'] == image_url]
     logger.info(f"Found {len(related_items)} items related to image URL: {image_url}")
     return related_items
 
@@ -100,6 +232,8 @@ def process_response(response: str) -> str:
         if "ITEM DETAILS:" in response:
             # Extract everything after ITEM DETAILS:
             items_section = "## Item Details\n\n" + response.split("ITEM DETAILS:")[1].strip()
+            # Items from other outfits may follow in their own section
+            items_section = items_section.replace("SIMILAR ITEMS:", "## Similar Items")
         elif "SIMILAR ITEMS:" in response:
             # Extract everything after SIMILAR ITEMS:
             items_section = "## Similar Items\n\n" + response.split("SIMILAR ITEMS:")[1].strip()
@@ -129,4 +263,61 @@ def process_response(response: str) -> str:
     # Ensure all bullet points use consistent Markdown
     processed = re.sub(r'^\* ', '- ', processed, flags=re.MULTILINE)
     
-    return processed
\ No newline at end of file
+    return processed
+
+class StreamingResponseProcessor:
+    """
+    Applies the process_response formatting to a response arriving in chunks.
+    
+    Text is released a whole line at a time, because the section header and
+    bullet rewrites need to see the start of each line. Rejections can only
+    be recognised once the full response is known, so the final rendering
+    should still come from process_response.
+    """
+    
+    def __init__(self):
+        self.text = ""
+        self._pending = ""
+        self._started = False
+    
+    def feed(self, chunk):
+        """
+        Add a chunk of the response.
+        
+        Args:
+            chunk (str): Next piece of the raw response
+            
+        Returns:
+            str: Newly rendered Markdown, empty until a line is complete
+        """
+        self._pending += chunk
+        complete, newline, self._pending = self._pending.rpartition("\n")
+        if not newline:
+            self._pending = complete + self._pending
+            return ""
+        return self._render(complete + newline)
+    
+    def finish(self):
+        """
+        Render whatever is left after the last chunk.
+        
+        Returns:
+            str: Newly rendered Markdown
+        """
+        rest, self._pending = self._pending, ""
+        return self._render(rest) if rest else ""
+    
+    def _render(self, lines):
+        # Same transformations as process_response, applied to complete lines
+        processed = lines.replace("$", "\\$")
+        processed = processed.replace("ITEM DETAILS:", "## Item Details")
+        processed = processed.replace("SIMILAR ITEMS:", "## Similar Items")
+        processed = re.sub(r'^\* ', '- ', processed, flags=re.MULTILINE)
+        
+        if not self._started:
+            self._started = True
+            if not processed.startswith("#"):
+                processed = "# Fashion Analysis\n\n" + processed
+        
+        self.text += processed
+        return processed
@@ -0,0 +1,390 @@
+"""
+In-process metrics for the request pipeline: stage timers, counters and
+gauges, exported in the Prometheus text format.
+
+Stages are timed with ``span``::
+
+    with span("encode"):
+        vectors = model(batch)
+
+Each stage gets a latency summary (p50/p95/p99 over a sliding window of
+recent requests) and an error counter. ``start_metrics_server`` serves
+everything at /metrics for a Prometheus scraper. ``SamplingProfiler``
+records where the time of single requests goes.
+"""
+
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter as _Tally, deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Quantiles reported for every summary
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Metric:
+    """
+    Base class for a named metric with one value per label set.
+    """
+
+    type = "untyped"
+
+    def __init__(self, name, description):
+        self.name = name
+        self.description = description
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        """
+        Returns:
+            list: Lines of the Prometheus text format for this metric
+        """
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self._samples(labels, value))
+        return lines
+
+    def set_function(self, fn, **labels):
+        """
+        Read the value from ``fn()`` whenever the metric is rendered, for
+        values another object already tracks (cache hits, queue sizes).
+        """
+        with self._lock:
+            self._values[_label_key(labels)] = fn
+
+    def _samples(self, labels, value):
+        if callable(value):
+            try:
+                value = value()
+            except Exception as e:
+                logger.warning("Error reading metric %s: %s", self.name, e)
+                return []
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """
+    Monotonic count, such as errors or retries.
+    """
+
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(_label_key(labels), 0)
+
+
+class Gauge(_Metric):
+    """
+    Current value, such as a queue depth.
+    """
+
+    type = "gauge"
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Summary(_Metric):
+    """
+    Latency distribution: total count and sum plus quantiles over a sliding
+    window of the most recent observations.
+    """
+
+    type = "summary"
+
+    def __init__(self, name, description, window=1024):
+        super().__init__(name, description)
+        self.window = window
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {"count": 0, "sum": 0.0, "recent": deque(maxlen=self.window)}
+            state["count"] += 1
+            state["sum"] += value
+            state["recent"].append(value)
+
+    def labels(self):
+        """
+        Returns:
+            list: Label dicts of every series with observations
+        """
+        with self._lock:
+            return [dict(key) for key in self._values]
+
+    def reset(self):
+        """
+        Drop all observations, e.g. between benchmark runs.
+        """
+        with self._lock:
+            self._values.clear()
+
+    def quantiles(self, **labels):
+        """
+        Returns:
+            dict: Quantile -> value over the recent window, empty without observations
+        """
+        with self._lock:
+            state = self._values.get(_label_key(labels))
+            recent = sorted(state["recent"]) if state else []
+        return {q: _quantile(recent, q) for q in QUANTILES} if recent else {}
+
+    def _samples(self, labels, state):
+        recent = sorted(state["recent"])
+        lines = [
+            f"{self.name}{_format_labels(labels + (('quantile', str(q)),))} {_format_value(_quantile(recent, q))}"
+            for q in QUANTILES if recent
+        ]
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(state['sum'])}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {state['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Holds the metrics of a process and renders them for the /metrics endpoint.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, description):
+        return self._get(Counter, name, description)
+
+    def gauge(self, name, description):
+        return self._get(Gauge, name, description)
+
+    def summary(self, name, description, window=1024):
+        return self._get(Summary, name, description, window=window)
+
+    def render(self):
+        """
+        Returns:
+            str: All metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def _get(self, cls, name, description, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, description, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"Metric '{name}' is already registered as a {metric.type}")
+            return metric
+
+
+# Process-wide registry and the metrics shared by all instrumented modules
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.summary("stylefinder_stage_seconds", "Time spent per pipeline stage")
+STAGE_ERRORS = REGISTRY.counter("stylefinder_stage_errors_total", "Pipeline stages that raised an error")
+EVENTS = REGISTRY.counter("stylefinder_events_total", "Notable events such as LLM retries and fallback responses")
+QUEUE_DEPTH = REGISTRY.gauge("stylefinder_queue_depth", "Work items waiting in each queue")
+CACHE_LOOKUPS = REGISTRY.counter("stylefinder_cache_lookups_total", "Cache lookups by cache and result")
+IN_FLIGHT = REGISTRY.gauge("stylefinder_requests_in_flight", "Requests being processed")
+
+
+@contextmanager
+def span(stage, **labels):
+    """
+    Time a pipeline stage, counting it as an error if it raises.
+
+    Args:
+        stage (str): Stage name, such as "encode" or "llm"
+        **labels: Extra labels, such as the request handler
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage, **labels)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=stage, **labels)
+
+
+def count(event, amount=1, **labels):
+    """
+    Count an event, such as "llm_retry" or "response_fallback".
+    """
+    EVENTS.inc(amount, event=event, **labels)
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=REGISTRY):
+    """
+    Serve the registry at http://host:port/metrics from a daemon thread.
+
+    Args:
+        port (int): Port to listen on, 0 picks a free one
+        host (str): Interface to bind, local only by default
+
+    Returns:
+        ThreadingHTTPServer: The running server; its server_address holds the bound port
+    """
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Scrapes would flood the log
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info("Serving metrics at http://%s:%d/metrics", host, server.server_address[1])
+    return server
+
+
+class SamplingProfiler:
+    """
+    Low-overhead profiler for single requests.
+
+    A background thread samples the call stacks of the threads working on the
+    request every ``interval`` seconds. Threads join with ``track``, so a
+    request that hops between the encode and LLM pools is followed across
+    them. The result is a collapsed-stack file for flame graph tools.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = _Tally()
+        self._threads = _Tally()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._sampler.start()
+
+    @contextmanager
+    def track(self):
+        """
+        Sample the calling thread while inside the block.
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._threads[thread_id] += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._threads[thread_id] -= 1
+
+    def call(self, fn, *args):
+        """
+        Run ``fn(*args)`` in the calling thread while sampling it.
+        """
+        with self.track():
+            return fn(*args)
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+    def save(self, path):
+        """
+        Stop sampling and write the collapsed stacks, one "frame;frame count" line each.
+
+        Returns:
+            str: The written path
+        """
+        self.stop()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, samples in self.samples.most_common():
+                f.write(f"{stack} {samples}\n")
+        return path
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            with self._lock:
+                threads = [thread_id for thread_id, depth in self._threads.items() if depth > 0]
+            frames = sys._current_frames()
+            for thread_id in threads:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    self.samples[_collapse(frame)] += 1
+
+
+def maybe_profiler(rate, interval=0.005):
+    """
+    Start a profiler for a share of the requests.
+
+    Returns:
+        SamplingProfiler: A running profiler, or None when this request is not sampled
+    """
+    if rate > 0 and random.random() < rate:
+        return SamplingProfiler(interval)
+    return None
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+               for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, float) and math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _quantile(values, q):
+    """Nearest-rank quantile of sorted values."""
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]